@@ -3,12 +3,13 @@
 #============================================================= 
 
 import libtcodpy as libtcod
-from random import choice
 from math import sqrt
 from constants import *
 
-from utility_methods import MAP_WIDTH, MAP_HEIGHT, choose_random_unblocked_spot, find_player_in_list, \
-                            message, move, move_towards, send_to_back, switch
+from utility_methods import MAP_WIDTH, MAP_HEIGHT, choose_random_unblocked_spot, message, move, move_towards, send_to_back, \
+                            switch, ring_around
+from pathing import make_path
+from randomness import streams, random_int
 
 
 
@@ -33,14 +34,16 @@ class BasicNPC(object):
         player and attack the player."""
 
         NPC = self.owner
-        object_list = gamemap_instance.objects
-        player = find_player_in_list(object_list)
+        player = gamemap_instance.player
         fov_map = gamemap_instance.fov_map
 
         if libtcod.map_is_in_fov(fov_map, NPC.x, NPC.y):
-            # move towards player if far away
+            # move towards player if far away. Every chaser shares the same flow field to the player, so this
+            # is just a step downhill rather than a new A* path each turn.
             if NPC.distance_to(player) >= 2:
-                move_towards(gamemap_instance, NPC, player.x, player.y)
+                step = gamemap_instance.flow_field_to_player().step_from(NPC.x, NPC.y)
+                if step is not None:
+                    move(gamemap_instance, NPC, step[0], step[1])
             # if close enough, attack!
             elif player.fighter.hp > 0:
                 NPC.fighter.attack(player)
@@ -57,53 +60,50 @@ class BasicExplorer(object):
     def __init__(self):
 
         self.is_pathmap_created = False
+        self.path = None
+        self.destination = None # where it is headed. This gets saved, and the path gets made again on loading.
+
+    def drop_path(self):
+        """Throw away the current path, so it stops listening for tile changes."""
+        if self.path is not None:
+            self.path.close()
+            self.path = None
+        if self.owner.gamemap is not None:
+            self.owner.gamemap.reservations.release(self.owner)
 
     def create_path(self, gamemap_instance):
-        """Creates the initial path_map, and then on subsequent calls uses that path_map to play."""
+        """
+        Creates a path to the destination, picking a random spot first if it doesn't have one. The path repairs
+        itself if the terrain changes along the way.
+        """
 
         mymap = gamemap_instance.level
+        self.is_pathmap_created = True
+        self.drop_path()
 
-        if not self.is_pathmap_created:
-            #Create the path map
-            self.path_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-            for x in range(1, MAP_WIDTH):
-                for y in range(1, MAP_HEIGHT):
-                    libtcod.map_set_properties(self.path_map, x, y, not mymap[x][y].block_sight, not mymap[x][y].blocked)
-            self.is_pathmap_created = True
-
-        # now use the path map to create the path from the explorer's current position to another spot:
-        self.path = libtcod.path_new_using_map(self.path_map)
-        random_destination_x, random_destination_y = choose_random_unblocked_spot(mymap)
-        libtcod.path_compute(self.path, self.owner.x, self.owner.y, random_destination_x, random_destination_y)
-
-        originx, originy = libtcod.path_get_origin(self.path)
-        destx, desty = libtcod.path_get_destination(self.path)
-        #print 'Created a new path with origin (' + str(originx)+', '+str(originy)+') and dest ('+str(destx)+
-            # ', '+str(desty)+').'
+        if self.destination is None:
+            # Only pick destinations in the same region, since there's no way to get anywhere else
+            random_destination_x, random_destination_y = choose_random_unblocked_spot(mymap, 
+                reachable_from=(self.owner.x, self.owner.y), rng=streams['ai'])
+            if random_destination_x is None:
+                random_destination_x, random_destination_y = choose_random_unblocked_spot(mymap, rng=streams['ai'])
+            self.destination = (random_destination_x, random_destination_y)
+        self.path = make_path(mymap, self.owner.x, self.owner.y, self.destination[0], self.destination[1])
 
-    def take_turn(self, gamemap_instance):
+        #print 'Created a new path with origin (' + str(self.owner.x)+', '+str(self.owner.y)+') and dest ('+
+            # str(random_destination_x)+', '+str(random_destination_y)+').'
 
-        mymap = gamemap_instance.level
-        object_list = gamemap_instance.objects
+    def take_turn(self, gamemap_instance):
 
         if not self.is_pathmap_created:
             self.create_path(gamemap_instance)
 
-        if not libtcod.path_is_empty(self.path):
-            pathx, pathy = libtcod.path_walk(self.path, True)
-            #print 'Explorer is trying to move from (' + str(self.owner.x) + ', ' + str(self.owner.y) + 
-                #') to (' + str(pathx) + ', ' + str(pathy) +').'
-            dx = pathx - self.owner.x
-            dy = pathy - self.owner.y
-            distance = sqrt(dx ** 2 + dy ** 2)
-     
-            #normalize it to length 1 (preserving direction), then round it and
-            #convert to integer so the movement is restricted to the map grid
-            dx = int(round(dx / distance))
-            dy = int(round(dy / distance))
-            move(gamemap_instance, self.owner, dx, dy)        
+        self.path.move_to(self.owner.x, self.owner.y)
+        if self.path.distance():
+            step_cooperatively(gamemap_instance, self.owner, self.path)
         else:
             #print 'The Explorer ' + self.owner.name + ' has finished their path. Choosing a new one...'
+            self.destination = None
             self.create_path(gamemap_instance)
 
 class BasicBuilder(object):
@@ -113,143 +113,174 @@ class BasicBuilder(object):
 
         self.work_target = (None, None)
         self.is_pathmap_created = False
+        self.path = None
     
     def pick_spot_to_work(self, gamemap_instance):
         """
         Choose a Tile that needs work done, and mark it as being worked on so no one else chooses it.
-        TODO: This should make a small 2D array of all eligible Tiles and then randomly select one, so they don't all
-        just start from the top right.
+        The GameMap's work orders hand out the nearest job that no other builder has claimed.
         """
-        for y in range(MAP_HEIGHT):
-            for x in range(MAP_WIDTH):
-                if gamemap_instance.level[x][y].designated and not gamemap_instance.level[x][y].being_worked_on:
-                    gamemap_instance.level[x][y].being_worked_on = True
-                    return (x, y)
+        return gamemap_instance.claim_job(self.owner)
 
-        return (None, None)
-
-    def create_path(self, gamemap_instance):
+    def give_up(self, gamemap_instance):
+        """Stop working on the current job and let someone else have it."""
+        gamemap_instance.release_job(self.owner)
+        self.work_target = (None, None)
+        self.is_pathmap_created = False
+        self.drop_path()
 
-        mymap = gamemap_instance.level
+    def drop_path(self):
+        """Throw away the current path, so it stops listening for tile changes."""
+        if self.path is not None:
+            self.path.close()
+            self.path = None
+        if self.owner.gamemap is not None:
+            self.owner.gamemap.reservations.release(self.owner)
 
-        #Create the path map
-        self.path_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-        for x in range(1, MAP_WIDTH):
-            for y in range(1, MAP_HEIGHT):
-                libtcod.map_set_properties(self.path_map, x, y, not mymap[x][y].block_sight, not mymap[x][y].blocked)
-        print 'Builder created self.path_map'
+    def create_path(self, gamemap_instance):
+        """
+        Picks a job and makes a path to it. The path repairs itself when tiles get blocked or cleared, so 
+        it only needs making again when the builder moves on to a new job.
+        """
         self.is_pathmap_created = True
-
-        # now use the path map to create the path from the explorer's current position to another spot:
-        self.path = libtcod.path_new_using_map(self.path_map)
+        self.drop_path()
         destinationx, destinationy = self.pick_spot_to_work(gamemap_instance)
 
         if destinationx is not None:
             self.work_target = (destinationx, destinationy)
-            print 'Builder chose a work target at ' + str(self.work_target[0]) +', ' + str(self.work_target[1]) + '.'
-
-            libtcod.path_compute(self.path, self.owner.x, self.owner.y, destinationx, destinationy)
+            self.path = make_path(gamemap_instance.level, self.owner.x, self.owner.y, destinationx, destinationy)
 
-            #originx, originy = libtcod.path_get_origin(self.path)
-            #destx, desty = libtcod.path_get_destination(self.path)
+    def blocking_neighbours(self, gamemap_instance):
+        """
+        Returns the tiles next to the builder which something is standing on and isn't going to move off of.
+        Creatures which have planned their moves, or which get out of the way when asked, don't count.
+        """
+        mymap = gamemap_instance.level
+        reservations = gamemap_instance.reservations
+        tiles = []
+        for (x, y) in ring_around(self.owner.x, self.owner.y, 1):
+            if 0 <= x < mymap.width and 0 <= y < mymap.height and not mymap[x][y].blocked:
+                for obj in gamemap_instance.objects_at(x, y):
+                    if obj.blocks and obj not in reservations.claims and not hasattr(obj.ai, 'make_way'):
+                        tiles.append((x, y))
+                        break
+        return tiles
 
-        elif destinationx is None:
-            print 'destinationx is None.'
+    def make_way(self, gamemap_instance):
+        """An idle builder steps aside if somebody else is planning to walk through where it is standing."""
+        if gamemap_instance.reservations.is_wanted(self.owner):
+            tile = gamemap_instance.reservations.step_aside(self.owner)
+            if tile is not None:
+                move(gamemap_instance, self.owner, tile[0] - self.owner.x, tile[1] - self.owner.y)
 
     def take_turn(self, gamemap_instance):
         """
         Current bugs:
         1) The worked-on Tile doesn't turn to gravel- why not?
-        2) The loop doesn't really go back around. They don't pick a new target, especially if they
-            get stuck while walking. They just give up after the first time they bump into something
-            dynamic. 
         """
         fov_map = gamemap_instance.fov_map
         object_list = gamemap_instance.objects
         mymap = gamemap_instance.level
 
         if not self.is_pathmap_created:
-            print 'Builder needs to create_path'
             self.create_path(gamemap_instance)
 
-        if not libtcod.path_is_empty(self.path):
-            pathx, pathy = libtcod.path_walk(self.path, True)
-            #print 'Explorer is trying to move from (' + str(self.owner.x) + ', ' + str(self.owner.y) + 
-                #') to (' + str(pathx) + ', ' + str(pathy) +').'
-            dx = pathx - self.owner.x
-            dy = pathy - self.owner.y
-            distance = sqrt(dx ** 2 + dy ** 2)
-     
-            #normalize it to length 1 (preserving direction), then round it and
-            #convert to integer so the movement is restricted to the map grid
-            dx = int(round(dx / distance))
-            dy = int(round(dy / distance))
-            move(gamemap_instance, self.owner, dx, dy)        
-        elif self.work_target[0] is not None:
-            (x, y) = self.work_target
-            (my_x, my_y) = self.owner.x, self.owner.y
-
-            # The following logic checks to see if they are standing in any of the 8 squares around
-            # the target Tile. I definitely had to draw a diagram for this.
-            if ((my_x+1 == x) and ( (my_y+1 == y) or (my_y == y) or (my_y-1 == y)) ) \
-                or ((my_x == x) and ( (my_y+1 == y) or (my_y == y) or (my_y-1 == y)) ) \
-                or ((my_x-1 == x) and ( (my_y+1 == y) or (my_y == y) or (my_y-1 == y)) ):
-
-                # We have arrived at a Tile that needs work done. Now begin work:
-                print 'Builder is standing at (' + str(my_x) +', '+ str(my_y)+') ' \
-                    'and is beginning work at (' + str(x) + ', ' + str(y) +').'
-
-
-                # Using a switch statement here because eventually there will be other states like
-                # 'building' or 'installing' something, etc
-                for case in switch(mymap[x][y].designation_type):
-                    if case('clearing'): 
-                        mymap[x][y].blocked = False
-                        mymap[x][y].block_sight = False
-                        mymap[x][y].fore = color_ground
-                        mymap[x][y].back = color_ground
-                        mymap[x][y].char = GRAVEL
-
-                        # Then reset the tile:
-                        mymap[x][y].designated = False
-                        mymap[x][y].designation_type = None
-                        mymap[x][y].designation_char = None
-                        mymap[x][y].being_worked_on = False
-
-                        #gamemap_instance.initialize_fov()
-                        print 'Finished work, resetting work_target to None, None.'
-                        self.work_target = (None, None)
-                        self.is_pathmap_created = False
-                        break
-
-                    if case(): break # default
+        if self.work_target[0] is not None and gamemap_instance.work_orders.claim_of(self.owner) != self.work_target:
+            # Somebody else finished or cancelled this job in the meantime
+            self.work_target = (None, None)
+            self.is_pathmap_created = False
+            self.drop_path()
+            return
+
+        if self.work_target[0] is None:
+            # Nothing to do right now, so look for work again next turn
+            self.is_pathmap_created = False
+            self.make_way(gamemap_instance)
+            return
+
+        (x, y) = self.work_target
+        (my_x, my_y) = self.owner.x, self.owner.y
+
+        # The following logic checks to see if they are standing in any of the 8 squares around
+        # the target Tile.
+        if abs(my_x - x) <= 1 and abs(my_y - y) <= 1:
+
+            # We have arrived at a Tile that needs work done. Now begin work:
+
+            # Using a switch statement here because eventually there will be other states like
+            # 'building' or 'installing' something, etc
+            for case in switch(mymap[x][y].designation_type):
+                if case('clearing'): 
+                    # Turns the tile into gravel and resets its designation. No need to initialize_fov() here,
+                    # the GameMap hears about the change itself.
+                    gamemap_instance.clear_tile(x, y)
+                    self.work_target = (None, None)
+                    self.is_pathmap_created = False
+                    self.drop_path()
+                    break
+
+                if case(): break # default
+            return
+
+        # Anyone standing in the way counts as blocked for now, and the path gets repaired around them 
+        # instead of the builder getting stuck behind them.
+        self.path.move_to(my_x, my_y)
+        obstacles = self.blocking_neighbours(gamemap_instance)
+        self.path.set_obstacles(obstacles)
+        step = self.path.next_step()
+        if step is None and not obstacles:
+            self.give_up(gamemap_instance)
         else:
-            self.pick_spot_to_work(gamemap_instance)
-            self.create_path(gamemap_instance)
+            # Even when boxed in by other creatures this still plans, and waits for them to move
+            step_cooperatively(gamemap_instance, self.owner, self.path, 
+                               done=lambda tile_x, tile_y: abs(tile_x - x) <= 1 and abs(tile_y - y) <= 1)
+
 
 
+def step_cooperatively(gamemap_instance, creature, path, done=None):
+    """
+    Moves a creature one step along its path. The creature plans its next few steps around where everyone
+    else has said they'll be, and reserves them in turn, so creatures sharing a corridor or an airlock take
+    turns instead of bumping into each other.
+    """
+    steps = gamemap_instance.reservations.plan(creature, path.cost_to_goal, done)
+    (x, y) = steps[0]
+    move(gamemap_instance, creature, x - creature.x, y - creature.y)
+
 
 def player_death(player, game_state):
     """Turn the player into a corpse and declare game over."""
+    if player.gamemap is not None:
+        player.gamemap.record('died', player)
     message('Game Over!', libtcod.red)
 
     # transform player into a corpse:
     player.char = '%'
     player.color = libtcod.dark_red
     player.name = 'remains of ' + player.name
+    if player.gamemap is not None:
+        player.gamemap.object_changed(player)
 
     game_state = 'dead'
     return game_state
     
 def NPC_death(NPC):
     """Transform into a corpse which doesn't block, can't move, and can't be attacked."""
+    if NPC.gamemap is not None:
+        NPC.gamemap.record('died', NPC)
     message(NPC.name.capitalize() + ' dies! You gain ' + str(NPC.fighter.xp) + ' experience points.', libtcod.orange)
     NPC.char = '%'
     NPC.color = libtcod.dark_red
     NPC.blocks = False
+    if NPC.gamemap is not None:
+        NPC.gamemap.release_job(NPC) # let another builder take over whatever it was doing
+    if isinstance(NPC.ai, (BasicExplorer, BasicBuilder)):
+        NPC.ai.drop_path()
     NPC.fighter = None
     NPC.ai = None # important to make sure they dont keep acting! Unless they're a ghost...
     NPC.name = 'remains of ' + NPC.name
+    if NPC.gamemap is not None:
+        NPC.gamemap.object_changed(NPC)
     
 def namegenerator():
     """Create a random male or female demon name and return it as a string."""
@@ -257,14 +288,19 @@ def namegenerator():
     alphanumerics = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
     choices = []
     new_name = ''
-    for i in range(0, libtcod.random_get_int(0, 2, 4)):
-        choices.append(choice(alphanumerics))
+    for i in range(0, random_int(streams['names'], 2, 4)):
+        choices.append(alphanumerics[random_int(streams['names'], 0, len(alphanumerics)-1)])
 
+    name_rng = streams.libtcod_generator('names')
     try:
-        libtcod.namegen_parse('libtcod-1.5.1/data/namegen/mingos_demon.cfg')
-        if libtcod.random_get_int(0, 0, 1):
+        libtcod.namegen_parse('libtcod-1.5.1/data/namegen/mingos_demon.cfg', name_rng)
+        if random_int(streams['names'], 0, 1):
             return new_name.join(choices[i] for i in range(len(choices))) + '-' + libtcod.namegen_generate('demon male')
         else:
             return new_name.join(choices[i] for i in range(len(choices))) + '-' + libtcod.namegen_generate('demon female')
     except:
         print 'Cannot find name generator file. Is it in ./libtcod-1.5.1/data/namegen/mingos_demon.cfg ?'
+    finally:
+        # The name generators hang on to the generator they were parsed with, so they get parsed again each time
+        libtcod.namegen_destroy()
+        libtcod.random_delete(name_rng)
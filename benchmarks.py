@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+#=============================================================
+# Benchmarks. Times map generation, FOV, pathing, the AI loop and drawing
+# on fixed seeds, at a few map sizes and populations, and writes the
+# results to a JSON file. Give it a baseline file from an earlier run and
+# it shows what got faster or slower.
+#
+#     python benchmarks.py --output results.json
+#     python benchmarks.py --baseline baseline.json
+#     python benchmarks.py --baseline baseline.json --update-baseline
+#
+# Like simulation.py, this never opens a window.
+#=============================================================
+
+import sys
+import json
+import atexit
+import shutil
+import tempfile
+import platform
+import argparse
+from time import time
+
+import libtcodpy as libtcod
+
+from constants import *
+from mapcreation import TileGrid, make_surface_map, make_bare_surface_map, place_junk
+from utility_methods import move_towards
+from pathing import make_path
+from rendering import MapRenderer
+from simulation import seed_generators, new_colony, new_world, simulate, Quiet
+import savegame
+from levels import LevelCache
+
+
+SEED = 1
+
+SIZES = [dict(width=MAP_WIDTH, height=MAP_HEIGHT), dict(width=MAP_WIDTH * 2, height=MAP_HEIGHT * 2)]
+POPULATIONS = [dict(landings=1), dict(landings=3), dict(landings=6)]
+WORLDS = [dict(levels=1), dict(levels=4)]
+
+# How much slower than the baseline something has to be before it counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+
+#------------------------------------------------------------
+# The benchmarks. Each one does its setup and returns a function which does the part that gets timed. The ones
+# in FRESH change what they run on, so they get set up again before every run.
+
+def bench_make_surface_map(width, height):
+    """Generates a whole surface map with buildings, robots and junk."""
+    def run():
+        seed_generators(SEED)
+        make_surface_map(width=width, height=height)
+    return run
+
+def bench_make_bare_surface_map(width, height):
+    """Generates a surface map with only terrain and junk."""
+    def run():
+        seed_generators(SEED)
+        make_bare_surface_map(width=width, height=height)
+    return run
+
+def bench_place_junk(width, height):
+    """Scatters junk over an empty map."""
+    level = TileGrid(width, height, blocked=False, block_sight=False)
+    def run():
+        seed_generators(SEED)
+        place_junk(level)
+    return run
+
+def bench_initialize_fov(width, height):
+    """Builds the FOV map from scratch and computes the player's field of view on it."""
+    gamemap_instance = new_colony(SEED, landings=0, jobs=0, width=width, height=height)
+    player = gamemap_instance.player
+    def run():
+        gamemap_instance.initialize_fov()
+        gamemap_instance.compute_fov(player.x, player.y)
+    return run
+
+def bench_compute_fov(width, height):
+    """Computes the field of view from 20 different spots."""
+    gamemap_instance = new_colony(SEED, landings=0, jobs=0, width=width, height=height)
+    spots = [gamemap_instance.level.random_free_tile() for i in range(20)]
+    def run():
+        for (x, y) in spots:
+            gamemap_instance.fov_recompute = True
+            gamemap_instance.compute_fov(x, y)
+    return run
+
+def bench_move_towards(width, height):
+    """Takes one A* step towards each of 20 far away spots, from the same starting point."""
+    gamemap_instance = new_colony(SEED, landings=1, jobs=0, width=width, height=height)
+    walker = gamemap_instance.actors[-1]
+    home = (walker.x, walker.y)
+    targets = [gamemap_instance.level.random_free_tile() for i in range(20)]
+    def run():
+        for (x, y) in targets:
+            gamemap_instance.move_object(walker, home[0], home[1])
+            move_towards(gamemap_instance, walker, x, y)
+        gamemap_instance.move_object(walker, home[0], home[1])
+    return run
+
+def bench_builder_paths(width, height):
+    """Makes the path from a lander to each of 20 designated tiles, and takes the first step along it."""
+    gamemap_instance = new_colony(SEED, landings=1, jobs=20, width=width, height=height)
+    level = gamemap_instance.level
+    start = (gamemap_instance.actors[-1].x, gamemap_instance.actors[-1].y)
+    jobs = [level.coords(index) for index in xrange(level.size) if level.designated[index]]
+    def run():
+        for (x, y) in jobs:
+            path = make_path(level, start[0], start[1], x, y)
+            path.next_step()
+            path.close()
+    return run
+
+def bench_explorer_paths(width, height):
+    """Makes paths between 20 random pairs of reachable spots, the way explorers pick where to go next."""
+    gamemap_instance = new_colony(SEED, landings=0, jobs=0, width=width, height=height)
+    level = gamemap_instance.level
+    trips = []
+    for i in range(20):
+        x, y = level.random_free_tile()
+        trips.append((x, y) + level.random_reachable_tile(x, y))
+    def run():
+        for (x1, y1, x2, y2) in trips:
+            path = make_path(level, x1, y1, x2, y2)
+            path.next_step()
+            path.close()
+    return run
+
+def bench_ai_turns(landings):
+    """Runs 20 turns of a colony with landings full of builders and 30 jobs for them."""
+    gamemap_instance = new_colony(SEED, landings=landings, jobs=30)
+    def run():
+        simulate(gamemap_instance, 20)
+    return run
+
+def bench_render_full(width, height):
+    """Draws the whole map onto an off-screen console, as after switching maps."""
+    gamemap_instance = new_colony(SEED, landings=1, jobs=0, width=width, height=height)
+    renderer = MapRenderer(libtcod.console_new(width, height), width, height)
+    player = gamemap_instance.player
+    def run():
+        renderer.invalidate()
+        renderer.render(gamemap_instance, player)
+    return run
+
+def bench_render_frame(width, height):
+    """Draws 20 frames of a colony which is going about its business, onto an off-screen console."""
+    gamemap_instance = new_colony(SEED, landings=1, jobs=30, width=width, height=height)
+    renderer = MapRenderer(libtcod.console_new(width, height), width, height)
+    player = gamemap_instance.player
+    renderer.render(gamemap_instance, player)
+    def run():
+        for frame in range(20):
+            gamemap_instance.run_turn()
+            renderer.render(gamemap_instance, player)
+    return run
+
+def bench_save_game(levels):
+    """Saves a colony with a number of levels into memory, with zlib compression."""
+    list_of_maps = new_world(SEED, levels, landings=3, jobs=30, turns=50)
+    def run():
+        savegame.encode(savegame.snapshot(list_of_maps, 0), 'zlib')
+    return run
+
+def bench_load_game(levels):
+    """Loads a colony with a number of levels back out of memory."""
+    data = savegame.encode(savegame.snapshot(new_world(SEED, levels, landings=3, jobs=30, turns=50), 0), 'zlib')
+    def run():
+        savegame.decode(data)
+    return run
+
+def bench_visit_levels(levels):
+    """Goes down the stairs to the bottom level and back up, with no room in memory for more than three levels."""
+    directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, directory, True)
+    list_of_maps = LevelCache(new_world(SEED, levels, landings=3, jobs=30, turns=50), budget=0, directory=directory)
+    def run():
+        for number in range(levels) + range(levels - 1, -1, -1):
+            list_of_maps.visit(number)
+    return run
+
+
+# (name, benchmark function, list of keyword arguments to run it with)
+BENCHMARKS = [
+    ('make_surface_map', bench_make_surface_map, SIZES),
+    ('make_bare_surface_map', bench_make_bare_surface_map, SIZES),
+    ('place_junk', bench_place_junk, SIZES),
+    ('initialize_fov', bench_initialize_fov, SIZES),
+    ('compute_fov', bench_compute_fov, SIZES),
+    ('move_towards', bench_move_towards, SIZES),
+    ('builder_paths', bench_builder_paths, SIZES),
+    ('explorer_paths', bench_explorer_paths, SIZES),
+    ('ai_turns', bench_ai_turns, POPULATIONS),
+    ('render_full', bench_render_full, SIZES),
+    ('render_frame', bench_render_frame, SIZES),
+    ('save_game', bench_save_game, WORLDS),
+    ('load_game', bench_load_game, WORLDS),
+    ('visit_levels', bench_visit_levels, WORLDS),
+]
+
+# Benchmarks which leave their colony further on than they found it, so timing them twice on the same one would
+# time two different things
+FRESH = set(['ai_turns', 'render_frame'])
+
+
+#------------------------------------------------------------
+# Running them
+
+def case_name(name, params):
+    """Names one run of a benchmark, like 'compute_fov[height=43,width=80]'."""
+    return name + '[' + ','.join(key + '=' + str(params[key]) for key in sorted(params)) + ']'
+
+def time_case(function, params, repeat, fresh=False):
+    """
+    Sets a benchmark up and times it repeat times. If fresh is True it is set up again before each time, and
+    only the run is timed. Returns a dict of timings in seconds.
+    """
+    run = function(**params)
+    run() # warm up caches, like the lazily built regions and cluster maps
+    times = []
+    for i in range(repeat):
+        if fresh:
+            run = function(**params)
+        start = time()
+        run()
+        times.append(time() - start)
+    times.sort()
+    return {'best': times[0], 'median': times[len(times) // 2], 'repeat': repeat}
+
+def run_benchmarks(only=None, repeat=5, quick=False):
+    """Runs every benchmark whose name contains only (or all of them), and returns the results by case name."""
+    results = {}
+    for (name, function, param_sets) in BENCHMARKS:
+        if only is not None and only not in name:
+            continue
+        if quick:
+            param_sets = param_sets[:1]
+        for params in param_sets:
+            with Quiet():
+                result = time_case(function, params, repeat, name in FRESH)
+            results[case_name(name, params)] = result
+            print '%-50s %10.2f ms' % (case_name(name, params), result['median'] * 1000)
+    return results
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Prints how each result compares with the baseline, and returns the names of the cases which got slower
+    by more than threshold.
+    """
+    regressions = []
+    print
+    print '%-50s %10s %10s %8s' % ('benchmark', 'baseline', 'now', 'change')
+    for name in sorted(results):
+        if name not in baseline:
+            print '%-50s %10s %10.2f %8s' % (name, '-', results[name]['median'] * 1000, 'new')
+            continue
+        before = baseline[name]['median']
+        now = results[name]['median']
+        change = (now - before) / before if before else 0.0
+        note = ''
+        if change > threshold:
+            note = '  SLOWER'
+            regressions.append(name)
+        elif change < -threshold:
+            note = '  faster'
+        print '%-50s %10.2f %10.2f %+7.1f%%%s' % (name, before * 1000, now * 1000, change * 100, note)
+    return regressions
+
+def load(path):
+    with open(path) as results_file:
+        return json.load(results_file)['results']
+
+def save(path, results):
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': SEED,
+        'results': results,
+    }
+    with open(path, 'w') as results_file:
+        json.dump(report, results_file, indent=1, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time map generation, FOV, pathing, AI and drawing.')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='write these results over the baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='how much slower counts as a regression, as a fraction')
+    parser.add_argument('--repeat', type=int, default=5, help='how many times to time each benchmark')
+    parser.add_argument('--only', help='only run benchmarks with this in their name')
+    parser.add_argument('--quick', action='store_true', help='only run the smallest size of each benchmark')
+    parser.add_argument('--strict', action='store_true', help='exit with an error if anything got slower')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only, args.repeat, args.quick)
+    save(args.output, results)
+    print 'Wrote ' + args.output
+
+    regressions = []
+    if args.baseline:
+        try:
+            regressions = compare(results, load(args.baseline), args.threshold)
+        except IOError:
+            print 'No baseline at ' + args.baseline + ' yet.'
+        if args.update_baseline:
+            save(args.baseline, results)
+            print 'Updated the baseline in ' + args.baseline
+
+    if regressions and args.strict:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
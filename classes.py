@@ -14,6 +14,31 @@ PLAYER_SPEED = 1
 DEFAULT_SPEED = 8
 DEFAULT_ATTACK_SPEED = 20
 
+# Every GamePiece gets a number of its own, which stays the same when the game is saved and loaded, so that
+# things like the action journal can say which object they mean.
+_last_uid = [0]
+
+def new_uid():
+    _last_uid[0] += 1
+    return _last_uid[0]
+
+def uid_in_use(uid):
+    """Makes sure new_uid() never hands out a number which a loaded object already has."""
+    _last_uid[0] = max(_last_uid[0], uid)
+
+def record(creature, kind, *args):
+    """
+    GameMap.record() for the components, which don't know the map. It goes to the map the creature is on, and
+    nowhere if it isn't on one.
+    """
+    if creature.gamemap is not None:
+        creature.gamemap.record(kind, *args)
+
+def record_equipped(creature):
+    """Writes down which of a creature's things it has equipped, after that changes."""
+    record(creature, 'equipped', creature, [item.uid for item in creature.inventory
+                                            if item.equipment and item.equipment.is_equipped])
+
 #============================================================= 
 # Drawable objects
 #============================================================= 
@@ -37,6 +62,7 @@ class GamePiece(object):
         inventory=None
         ):
 
+        self.uid = new_uid()
         self.x = x
         self.y = y
         self.char = char
@@ -77,6 +103,9 @@ class GamePiece(object):
         # For creatures with names
         self.scifi_name = None
         self.spoken = False
+
+        # The GameMap this is on, if any. GameMap.add_object and remove_object keep this up to date.
+        self.gamemap = None
         
     def distance_to(self, other):
         """Return the distance to another object from this object."""
@@ -143,6 +172,7 @@ class Fighter(object):
     def take_damage(self, damage):
         if damage > 0:
             self.hp -= damage
+            record(self.owner, 'hp', self.owner, self.hp)
             if self.hp <= 0: # if it died, do the appropriate thing according to its death_function
                 function = self.death_function
                 if function is not None:
@@ -166,6 +196,7 @@ class Fighter(object):
         self.hp += amount
         if self.hp > self.max_hp:
             self.hp = self.max_hp
+        record(self.owner, 'hp', self.owner, self.hp)
 
 class Item(object):
     """Item class defines usage, picking up, and dropping of GamePieces."""
@@ -175,7 +206,8 @@ class Item(object):
     def use(self, creature):
         #Special case: if the object has the Equipment component, the "use" action is to equip/dequip
         if self.owner.equipment:
-            self.owner.equipment.toggle_equip()
+            self.owner.equipment.toggle_equip(creature)
+            record_equipped(creature)
             return
 
         #call the use_function if it is defined
@@ -185,32 +217,36 @@ class Item(object):
             # This call to use_function includes the () because this is when it actually gets called. 
             # Above, where it doesn't have the (), it doesn't actually get called.
             if self.use_function() != 'cancelled':
+                record(creature, 'used', self.owner, creature)
                 creature.inventory.remove(self.owner) #destroy after use unless the use was aborted
                 
-    def pick_up(self, creature):
+    def pick_up(self, creature, gamemap_instance):
         #it needs to be added to the player's inventory and removed from the map
         if len(creature.inventory) >= 26:
             message('Your inventory is full, cannot pick up ' + self.owner.name + '.', libtcod.red)
         else:
+            gamemap_instance.record('carried', self.owner, creature)
             creature.inventory.append(self.owner)
-            objects.remove(self.owner)
+            gamemap_instance.remove_object(self.owner)
             message('You picked up a ' + self.owner.name + '!', libtcod.green)
 
         #Special case: automatically equip an eligible piece of equipment if the slot is unused
         equipment = self.owner.equipment
-        if equipment and get_equipped_in_slot(equipment.slot) is None:
-            equipment.equip()
+        if equipment and self.owner in creature.inventory and get_equipped_in_slot(equipment.slot, creature) is None:
+            equipment.equip(creature)
+            record_equipped(creature)
             
-    def drop(self, creature):
+    def drop(self, creature, gamemap_instance):
         #Special case: if the object has the Equipment component, dequip it before dropping
-        if self.owner.equipment:
+        if self.owner.equipment and self.owner.equipment.is_equipped:
             self.owner.equipment.dequip()
+            record_equipped(creature)
 
         #add to the map and remove from the player's inventory. Place it at the player's coordinates
-        objects.append(self.owner)
         creature.inventory.remove(self.owner)
         self.owner.x = creature.x
         self.owner.y = creature.y
+        gamemap_instance.add_object(self.owner)
         message('You dropped a ' + self.owner.name + '.', libtcod.yellow)
             
 class Equipment(object):
@@ -222,16 +258,17 @@ class Equipment(object):
         self.max_hp_bonus = max_hp_bonus
         self.is_equipped = False
 
-    def toggle_equip(self):
+    def toggle_equip(self, creature):
         if self.is_equipped:
             self.dequip()
         else:
-            self.equip()
+            self.equip(creature)
 
-    def equip(self):
+    def equip(self, creature):
+        """Equips this on the creature carrying it, taking off whatever was in its slot before."""
         if self.is_equipped: return
 
-        old_equipment = get_equipped_in_slot(self.slot)
+        old_equipment = get_equipped_in_slot(self.slot, creature)
         if old_equipment is not None:
             old_equipment.dequip()
 
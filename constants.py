@@ -52,6 +52,10 @@ FIREBALL_DAMAGE = 12
 ASTRONAUTS_IN_LANDER = 9
 
 LIMIT_FPS = 20  #20 frames-per-second maximum
+AUTOSAVE_INTERVAL = 1200 # turns between autosaves, which is about a minute at LIMIT_FPS
+SNAPSHOT_INTERVAL = 200 # turns between the snapshots the action journal gets played back on top of
+LEVEL_MEMORY_BUDGET = 8 * 1024 * 1024 # roughly how many bytes of levels to keep in memory, see levels.py
+LEVEL_CACHE_DIR = 'levels' # where the levels which don't fit go
 PLAYER_SPEED = 1
 DEFAULT_SPEED = 8
 DEFAULT_ATTACK_SPEED = 20
@@ -65,6 +69,17 @@ TORCH_RADIUS = 10
 color_wall = libtcod.dark_red
 color_ground = libtcod.flame
 color_building = libtcod.darker_red
+color_lander = libtcod.darkest_grey
+color_lander_floor = libtcod.grey
+color_door = libtcod.white
+color_door_back = libtcod.grey
+color_stone = libtcod.dark_sepia
+color_gravel = libtcod.dark_red
+color_water = libtcod.darker_blue
+
+# How remembered tiles are shaded when they are out of view
+color_remembered_wall = libtcod.light_gray
+color_remembered_floor = libtcod.dark_grey
 
 # ASCII Code Page 437 characters:
 GRAVEL = 176
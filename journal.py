@@ -0,0 +1,300 @@
+#=============================================================
+# The action journal. Saving the whole game every turn would be far too
+# slow, so instead every change to the world gets written down as it
+# happens, one short line each, and the whole game only gets saved every
+# SNAPSHOT_INTERVAL turns. After a crash, restore() loads the last of
+# those snapshots and plays the journal written since then back on top.
+#
+# Each line is the number of the record, the map and the turn it
+# happened on, what happened, and a JSON list with the details:
+#
+#     1041 0 5230 move [17,34,12]
+#     1042 0 5230 designate [40,20,"clearing","+"]
+#     1043 0 5231 cleared [40,20]
+#
+# Objects are given by their uid. What can happen is:
+#
+#     move       uid x y           something moved
+#     designate  x y type char     the player designated a tile
+#     cleared    x y               a builder finished clearing a tile
+#     landed     x y               an empty lander came down
+#     spawn      description       something was put on the map, see savegame.describe()
+#     removed    uid               something was taken off the map
+#     carried    uid holder uid    something went into a creature's inventory
+#     died       uid               a creature died
+#     hp         uid hp            a creature was hurt or healed, and has hp hit points left
+#     equipped   uid [uid, ...]    a creature put on or took off something, and has these things on
+#     used       uid holder uid    a creature used something up
+#     wait       uid turns         a creature acted, and has to wait this many turns before it acts again
+#     turn                         the turn is over, and the map has moved on to the next
+#
+# At the end of every turn the journal gets a turn record and is flushed. Snapshots are saved in
+# the background, and each one notes the number of the last record it
+# includes. When a snapshot starts, the journal so far moves to
+# <path>.journal.1 and a new one is begun, as long as the snapshot before
+# it made it to the disk, so the records restore() needs are always in
+# those two files.
+#=============================================================
+
+import os
+import json
+
+import savegame
+from constants import SNAPSHOT_INTERVAL
+from classes import GamePiece
+from ai import player_death
+from mapcreation import build_lander
+from levels import LevelCache
+
+
+class Journal(object):
+    """
+    Writes down everything that happens on the maps it is attached to, and saves a snapshot of the game every
+    snapshot_interval turns. Use it like this:
+
+        journal.start(list_of_maps, map_number)
+        ...
+        gamemap_instance.run_turn()
+        journal.end_turn(list_of_maps, map_number, game_state, game_msgs)
+        ...
+        journal.close()
+    """
+    def __init__(self, path, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.file = None
+        self.seq = 0
+        self.last_snapshot = None # the turn of the last snapshot which was started
+        self.saver = savegame.BackgroundSaver()
+        self.maps = None    # the list_of_maps this is attached to
+        self.levels = 0     # how many levels it had
+
+    def start(self, list_of_maps, map_number, game_state='playing', messages=()):
+        """
+        Starts a new journal for a game which was just made or loaded. This saves the first snapshot right away,
+        before the old journal is thrown out.
+        """
+        self.close()
+        self.seq = 0
+        self.attach(list_of_maps)
+        savegame.save(self.snapshot_path, list_of_maps, map_number, game_state, messages,
+                      extra={'journal_seq': self.seq})
+        self.last_snapshot = list_of_maps[map_number].turn
+        if os.path.exists(self.old_journal_path):
+            os.remove(self.old_journal_path)
+        self.file = open(self.journal_path, 'w')
+
+    def attach(self, list_of_maps):
+        """Has every map in list_of_maps write to this journal."""
+        self.maps = list_of_maps
+        self.levels = len(list_of_maps)
+        set_journal(list_of_maps, self)
+
+    def close(self):
+        """Finishes the journal, after waiting for the snapshot that is being saved. The maps stop writing to it."""
+        self.saver.wait()
+        if self.maps is not None:
+            set_journal(self.maps, None)
+        self.maps = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @property
+    def snapshot_path(self):
+        return self.path + '.snapshot'
+
+    @property
+    def journal_path(self):
+        return self.path + '.journal'
+
+    @property
+    def old_journal_path(self):
+        return self.path + '.journal.1'
+
+    #------------------------------------------------------------
+
+    def append(self, gamemap_instance, kind, args):
+        """Writes one record. GameMap.record() calls this."""
+        if self.file is None:
+            return
+        if kind == 'spawn':
+            args = [savegame.describe(args[0])]
+        else:
+            args = [arg.uid if isinstance(arg, GamePiece) else arg for arg in args]
+        self.seq += 1
+        self.file.write('%d %d %d %s %s\n' % (self.seq, gamemap_instance.id_number, gamemap_instance.turn, kind,
+                                              json.dumps(args, separators=(',', ':'))))
+
+    def end_turn(self, list_of_maps, map_number, game_state='playing', messages=()):
+        """
+        Makes sure this turn's records are out of the game, and starts a snapshot if it is time for one. A level
+        which appeared since the last snapshot gets one straight away, since the journal can't make levels.
+        """
+        if self.file is None:
+            return
+        self.append(list_of_maps[map_number], 'turn', ())
+        self.file.flush()
+        new_level = len(list_of_maps) != self.levels
+        if new_level:
+            self.attach(list_of_maps)
+        elif list_of_maps[map_number].turn - self.last_snapshot < self.snapshot_interval:
+            return
+
+        # Snapshots are taken on the turns the game says, however slow the disk is, so if the last one is still
+        # being written this waits for it
+        self.saver.wait()
+        if self.saver.status in (None, 'saved'):
+            # The last snapshot is safely on the disk, so the records before it aren't needed any more
+            self.file.close()
+            if os.name == 'nt' and os.path.exists(self.old_journal_path):
+                os.remove(self.old_journal_path)
+            os.rename(self.journal_path, self.old_journal_path)
+            self.file = open(self.journal_path, 'w')
+        self.saver.save(self.snapshot_path, list_of_maps, map_number, game_state, messages,
+                        extra={'journal_seq': self.seq})
+        self.last_snapshot = list_of_maps[map_number].turn
+
+
+def set_journal(list_of_maps, journal):
+    if isinstance(list_of_maps, LevelCache):
+        # It passes the journal on to the levels it has in memory, and the ones it loads later
+        list_of_maps.journal = journal
+    else:
+        for gamemap_instance in list_of_maps:
+            gamemap_instance.journal = journal
+
+
+#------------------------------------------------------------
+# Restoring
+
+def restore(path):
+    """
+    Loads the last snapshot a Journal saved to path, and replays the journal written after it. Raises
+    ValueError if the journal and the snapshot don't go together. Returns
+    (list_of_maps, map_number, game_state, messages, random_state) like savegame.load() does. The random streams
+    come back as they were at the snapshot, since the journal only has what the random numbers did.
+    """
+    extra = {}
+    list_of_maps, map_number, game_state, messages, random_state = savegame.load(path + '.snapshot', extra)
+    after = extra.get('journal_seq', 0)
+
+    objects = {}    # uid -> object
+    holders = {}    # uid -> the object carrying it
+    for gamemap_instance in list_of_maps:
+        for obj in gamemap_instance.objects:
+            index_object(obj, objects, holders)
+
+    for journal_path in (path + '.journal.1', path + '.journal'):
+        if not os.path.exists(journal_path):
+            continue
+        with open(journal_path) as journal_file:
+            for line in journal_file:
+                record = parse(line)
+                if record is None:
+                    break # the game went down halfway through writing this line
+                seq, number, turn, kind, args = record
+                if seq <= after:
+                    continue
+                if number >= len(list_of_maps):
+                    raise ValueError(journal_path + ' has level ' + str(number) + ', but the snapshot does not.')
+                gamemap_instance = list_of_maps[number]
+                gamemap_instance.turn = turn
+                try:
+                    game_state = replay(gamemap_instance, kind, args, objects, holders, game_state)
+                except (KeyError, IndexError, TypeError) as error:
+                    raise ValueError(journal_path + ' does not fit the snapshot, record ' + str(seq) + ' (' + kind +
+                                     ') failed: ' + error.__class__.__name__ + ': ' + str(error))
+                after = seq
+
+    return list_of_maps, map_number, game_state, messages, random_state
+
+def parse(line):
+    """Splits a line of the journal up, or returns None if it isn't all there."""
+    fields = line.split(' ', 4)
+    if len(fields) != 5 or not line.endswith('\n'):
+        return None
+    try:
+        return int(fields[0]), int(fields[1]), int(fields[2]), fields[3], json.loads(fields[4])
+    except ValueError:
+        return None
+
+def index_object(obj, objects, holders):
+    objects[obj.uid] = obj
+    for item in obj.inventory:
+        holders[item.uid] = obj
+        index_object(item, objects, holders)
+
+def replay(gamemap_instance, kind, args, objects, holders, game_state):
+    """Does what one record of the journal says to, and returns the game state afterwards."""
+    if kind == 'move':
+        gamemap_instance.move_object(objects[args[0]], args[1], args[2])
+    elif kind == 'designate':
+        gamemap_instance.designate(args[0], args[1], savegame.as_str(args[2]), savegame.as_str(args[3]))
+    elif kind == 'cleared':
+        gamemap_instance.clear_tile(args[0], args[1])
+    elif kind == 'landed':
+        build_lander(gamemap_instance, args[0], args[1])
+    elif kind == 'spawn':
+        description = args[0]
+        uid = description['columns']['uid'][0]
+        if uid in objects:
+            # Something which was already around, like an item being dropped
+            obj = objects[uid]
+            if uid in holders:
+                holders.pop(uid).inventory.remove(obj)
+            if obj.gamemap is not None:
+                obj.gamemap.remove_object(obj)
+            obj.x, obj.y = description['columns']['x'][0], description['columns']['y'][0]
+        else:
+            obj = savegame.rebuild(description)
+            index_object(obj, objects, holders)
+        gamemap_instance.add_object(obj)
+    elif kind == 'removed':
+        obj = objects[args[0]]
+        if obj.gamemap is gamemap_instance:
+            gamemap_instance.remove_object(obj)
+    elif kind == 'carried':
+        (item, holder) = (objects[args[0]], objects[args[1]])
+        holder.inventory.append(item)
+        holders[item.uid] = holder
+    elif kind == 'hp':
+        objects[args[0]].fighter.hp = args[1]
+    elif kind == 'equipped':
+        (holder, equipped) = (objects[args[0]], set(args[1]))
+        for item in holder.inventory:
+            if item.equipment is not None:
+                item.equipment.is_equipped = item.uid in equipped
+    elif kind == 'used':
+        (item, holder) = (objects[args[0]], objects[args[1]])
+        holder.inventory.remove(item)
+        del holders[item.uid]
+    elif kind == 'wait':
+        reschedule(gamemap_instance, objects[args[0]], args[1])
+    elif kind == 'turn':
+        pass # restore() already set the turn
+    elif kind == 'died':
+        obj = objects[args[0]]
+        if obj.fighter is not None and obj.fighter.death_function is not None:
+            if obj.fighter.death_function is player_death:
+                game_state = player_death(obj, game_state)
+            else:
+                obj.fighter.death_function(obj)
+    else:
+        raise ValueError('The journal has a record of ' + kind + ', which is not something that can happen.')
+    return game_state
+
+def reschedule(gamemap_instance, obj, turns):
+    """
+    Puts a creature back in the scheduler the way it was after it acted, so that it acts on the same turn, and
+    in the same order among the creatures due then, as it did before the crash.
+    """
+    scheduler = gamemap_instance.scheduler
+    scheduler.remove(obj, gamemap_instance.turn)
+    if obj.ai:
+        obj.wait = turns
+        scheduler.add(obj, gamemap_instance.turn)
+    else:
+        # Creatures driven by the keyboard are held instead, see TurnScheduler.hold()
+        obj.wait = turns - 1
+        scheduler.hold(obj, gamemap_instance.turn)
@@ -0,0 +1,247 @@
+#=============================================================
+# The level cache. Every level the player has been to used to stay in
+# memory for the rest of the game, tiles, objects, libtcod maps and all.
+# A LevelCache stands in for list_of_maps and keeps only the level the
+# player is on, the levels next to it, and as many recently visited ones
+# as fit in a memory budget. The rest are saved to LEVEL_CACHE_DIR, one
+# file per level in the savegame format, and come back the next time
+# they are asked for:
+#
+#     list_of_maps = LevelCache(list_of_maps)
+#     gamemap_instance = list_of_maps.visit(map_number)  # the player took the stairs
+#     gamemap_instance = list_of_maps[map_number]        # loads the level if it isn't in memory
+#
+# Saving the game doesn't load the levels on the disk, it copies them
+# straight out of their files, see savegame.level_snapshots(). Loading a
+# saved game with load() doesn't build every level either, only the ones
+# the cache would keep in memory anyway.
+#
+# The stairs are in here as well, since going up or down them is how the
+# player gets from one level to another.
+#=============================================================
+
+import os
+
+import libtcodpy as libtcod
+
+from constants import LEVEL_MEMORY_BUDGET, LEVEL_CACHE_DIR
+from utility_methods import message, choose_random_unblocked_spot
+from mapcreation import GameMap, make_surface_map
+from randomness import streams
+import savegame
+
+# Rough guesses at what a level takes up in memory: each tile has its planes, a cell in the FOV map and in
+# the pathing caches, and each object has its components and maybe a libtcod path of its own.
+TILE_BYTES = 64
+OBJECT_BYTES = 4096
+
+
+def level_size(gamemap_instance):
+    """Guesses how many bytes of memory a level takes up."""
+    level = gamemap_instance.level
+    return level.width * level.height * TILE_BYTES + len(gamemap_instance.objects) * OBJECT_BYTES
+
+
+class LevelCache(object):
+    """
+    A list of levels which only keeps some of them in memory. Levels are numbered like in list_of_maps, and
+    it can be indexed, iterated over, appended to and saved just like the list.
+
+    The level the player is on and the neighbours levels on each side of it always stay in memory. The
+    others are kept while they fit in budget bytes, and after that the one that was used least recently
+    goes to the disk.
+    """
+    def __init__(self, list_of_maps=(), current=0, budget=LEVEL_MEMORY_BUDGET, directory=LEVEL_CACHE_DIR,
+                 neighbours=1):
+        self.budget = budget
+        self.directory = directory
+        self.neighbours = neighbours
+        self.levels = []    # level number -> GameMap, or None while it is on the disk
+        self.recent = []    # numbers of the levels in memory, the least recently used first
+        self.current = current  # the level the player is on
+        self._journal = None
+        for gamemap_instance in list_of_maps:
+            self.append(gamemap_instance)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, number):
+        """Returns a level, loading it if it is on the disk."""
+        if not 0 <= number < len(self.levels):
+            raise IndexError('There is no level ' + str(number) + '.')
+        gamemap_instance = self.levels[number]
+        if gamemap_instance is not None and self.recent[-1] == number:
+            return gamemap_instance # the main loop asks for the same level every frame
+        if gamemap_instance is None:
+            gamemap_instance = self.page_in(number)
+        self.touch(number)
+        self.trim(keep=number)
+        return gamemap_instance
+
+    def __iter__(self):
+        """
+        Goes through every level. The ones on the disk get loaded one at a time and are not kept, so this
+        doesn't use any more memory than one extra level.
+        """
+        for number in range(len(self.levels)):
+            if self.levels[number] is not None:
+                yield self.levels[number]
+            else:
+                yield savegame.load(self.path(number))[0][0]
+
+    def append(self, gamemap_instance):
+        """
+        Adds a new level after the last one. It can also be a savegame.level_snapshot() of a level, like the
+        ones savegame.load() leaves unbuilt, which goes straight to the disk.
+        """
+        if isinstance(gamemap_instance, savegame.Snapshot):
+            self.levels.append(None)
+            self.write(len(self.levels) - 1, gamemap_instance)
+            return
+        gamemap_instance.journal = self._journal
+        self.levels.append(gamemap_instance)
+        self.touch(len(self.levels) - 1)
+        self.trim(keep=len(self.levels) - 1)
+
+    def visit(self, number):
+        """
+        Makes a level the one the player is on, and returns it. It and its neighbours get loaded if they are on
+        the disk, so that the next trip up or down the stairs doesn't have to wait for the disk.
+        """
+        self.current = number
+        for neighbour in range(number - self.neighbours, number + self.neighbours + 1):
+            if neighbour != number and 0 <= neighbour < len(self.levels):
+                self[neighbour]
+        return self[number]
+
+    def close(self):
+        """Deletes the files of the levels on the disk. Only do this once the game is over."""
+        for number in range(len(self.levels)):
+            if os.path.exists(self.path(number)):
+                os.remove(self.path(number))
+
+    #------------------------------------------------------------
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @journal.setter
+    def journal(self, journal):
+        """Sets the action journal (see journal.py) of every level in memory, and of each one that gets loaded."""
+        self._journal = journal
+        for gamemap_instance in self.levels:
+            if gamemap_instance is not None:
+                gamemap_instance.journal = journal
+
+    def level_snapshots(self):
+        """What savegame.snapshot() uses to copy the levels out. The ones on the disk are read as they are."""
+        for number in range(len(self.levels)):
+            if self.levels[number] is not None:
+                yield savegame.level_snapshot(self.levels[number])
+            else:
+                with open(self.path(number), 'rb') as level_file:
+                    yield savegame.saved_level(level_file.read())
+
+    def resident(self):
+        """Returns the numbers of the levels in memory."""
+        return [number for number in range(len(self.levels)) if self.levels[number] is not None]
+
+    def path(self, number):
+        return os.path.join(self.directory, 'level' + str(number) + '.sav')
+
+    def touch(self, number):
+        if self.recent and self.recent[-1] == number:
+            return
+        if number in self.recent:
+            self.recent.remove(number)
+        self.recent.append(number)
+
+    def trim(self, keep=None):
+        """Sends the least recently used levels to the disk until the rest fit in the budget."""
+        pinned = range(self.current - self.neighbours, self.current + self.neighbours + 1)
+        total = sum(level_size(self.levels[number]) for number in self.recent)
+        for number in list(self.recent):
+            if total <= self.budget:
+                break
+            if number in pinned or number == keep:
+                continue
+            total -= level_size(self.levels[number])
+            self.page_out(number)
+
+    def page_out(self, number):
+        self.write(number, self.levels[number])
+        self.levels[number] = None
+        self.recent.remove(number)
+
+    def write(self, number, level):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        savegame.save(self.path(number), [level], 0)
+
+    def page_in(self, number):
+        gamemap_instance = savegame.load(self.path(number))[0][0]
+        gamemap_instance.journal = self._journal
+        self.levels[number] = gamemap_instance
+        return gamemap_instance
+
+
+def load(path, budget=LEVEL_MEMORY_BUDGET, directory=LEVEL_CACHE_DIR, neighbours=1):
+    """
+    Loads a game saved with savegame.save() into a LevelCache. Only the level the player is on and its
+    neighbours get built, and the other levels go from the save straight into their files, so loading a long
+    game doesn't need any more memory than playing it. Returns (list_of_maps, map_number, game_state,
+    messages, random_state) like savegame.load().
+    """
+    list_of_maps, map_number, game_state, messages, random_state = savegame.load(path, neighbours=neighbours)
+    list_of_maps = LevelCache(list_of_maps, map_number, budget, directory, neighbours)
+    return list_of_maps, map_number, game_state, messages, random_state
+
+
+#------------------------------------------------------------
+# The stairs
+
+def go_down(list_of_maps, map_number):
+    """
+    Takes the player down the stairs on level map_number of a LevelCache. The first time, this makes the
+    level below, and the player gets to rest on the way. Returns the number of the level the player is on now.
+    """
+    if map_number + 1 < len(list_of_maps):
+        return move_player(list_of_maps, map_number, map_number + 1, 'upstairs')
+
+    gamemap_instance = list_of_maps[map_number]
+    player = gamemap_instance.player
+    message('You rest for a moment and recover your strength.', libtcod.light_violet)
+    player.fighter.heal(player.fighter.max_hp / 2)
+
+    message('You move onward to the next area...', libtcod.red)
+    gamemap_instance.remove_object(player)
+    nextmap, objects_for_this_map = make_surface_map(player) # a fresh level, with the player somewhere on it
+    list_of_maps.append(GameMap(map_number + 1, nextmap, 'surface', objects_for_this_map))
+    list_of_maps.visit(map_number + 1)
+    return map_number + 1
+
+def go_up(list_of_maps, map_number):
+    """
+    Takes the player up the stairs on level map_number of a LevelCache, to the stairs down on the level above.
+    Returns the number of the level the player is on now.
+    """
+    return move_player(list_of_maps, map_number, map_number - 1, 'stairs')
+
+def move_player(list_of_maps, from_number, to_number, arrive_at):
+    """
+    Takes the player off one level and puts them on another, which gets loaded if it is on the disk. They
+    arrive on the object with the role arrive_at, or anywhere they can stand if the level doesn't have one.
+    """
+    player = list_of_maps[from_number].player
+    # Off the old level first, so that the player doesn't get saved along with it if it goes to the disk
+    list_of_maps[from_number].remove_object(player)
+    gamemap_instance = list_of_maps.visit(to_number)
+    spot = gamemap_instance.roles.get(arrive_at)
+    if spot is not None:
+        (player.x, player.y) = (spot.x, spot.y)
+    else:
+        (player.x, player.y) = choose_random_unblocked_spot(gamemap_instance.level, rng=streams['spawning'])
+    gamemap_instance.add_object(player)
+    return to_number
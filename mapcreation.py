@@ -4,9 +4,16 @@
 
 import libtcodpy as libtcod
 from constants import *
+from palette import COLORS, CHARS, color_index, char_index
+from pathing import FlowField, ReservationTable, ClusterMap
+from workorders import WorkOrders
+from regions import RegionMap
+from scheduler import TurnScheduler
+from profiling import timer
+from randomness import streams, random_int
 
 from utility_methods import MAP_WIDTH, MAP_HEIGHT, switch, is_blocked, choose_random_unblocked_spot, \
-                            random_choice_index, random_choice, cast_heal
+                            random_choice_index, random_choice, cast_heal, ring_around, TileSet
 from classes import GamePiece, Fighter, Item, Equipment
 from ai import BasicNPC, BasicExplorer, BasicBuilder, player_death, NPC_death, namegenerator
 
@@ -21,58 +28,627 @@ class GameMap(object):
     GameMaps contain a list of all objects within them. If an object moves between maps, such as the player
     going to a different area, the origin map needs to hand the player object to the destination map.
     """
+    # Objects with these names are looked up by name so often that the GameMap keeps a direct reference to them
+    ROLES = ('player', 'stairs', 'upstairs')
+
     def __init__(self, id_number, level, location='surface', objects=None):
         self.id_number = id_number
         self.level = level # this is the actual map.
-        self.fov_map = None
         self.location = location
+
+        # The FOV map is built once and then kept up to date as tiles change, rather than being rebuilt 
+        # every frame. fov_recompute says whether the last FOV computation is stale.
+        # fov_version counts the FOV computations, so that anything caching visibility knows when it is stale.
+        self.fov_map = None
+        self.fov_origin = None
+        self.fov_recompute = True
+        self.fov_version = 0
+
+        # One navigation map which every AI paths against, also kept up to date as tiles change.
+        # nav_version counts the changes to it, so that cached paths and distance maps know when they are stale.
+        self.nav_map = None
+        self.nav_version = 0
+        self.initialize_nav()
+        self.player_flow_field = None
+
+        # Counts the passes through the main loop, so creatures can plan around each other ahead of time
+        self.turn = 0
+        self.reservations = ReservationTable(self)
+
+        # Which creatures get to act on which turn
+        self.scheduler = TurnScheduler()
+
+        # Designated tiles waiting for a builder, and the builders which found none they could get to, with
+        # what things looked like then (see claim_job)
+        self.work_orders = WorkOrders()
+        self.idle_builders = {}
+        for index in xrange(self.level.size):
+            if self.level.designated[index]:
+                self.work_orders.add(*self.level.coords(index))
+
+        self.level.add_listener(self.tile_changed)
         
-        if objects is None:
-            self.objects = []
-        else:
-            self.objects = objects
+        # Every object on the map, in drawing order, plus an index of which objects are standing on each tile.
+        # Add, remove and move objects through the methods below so that the two always agree.
+        self.objects = []
+        self.occupants = {} # (x, y) -> list of objects on that tile
+
+        # The same objects split up by what they do, so that loops only have to look at the ones they need.
+        # Objects move between these when they change, through object_changed().
+        self.actors = []    # creatures, which move around and take turns
+        self.items = []     # things which can be picked up
+        self.props = []     # everything else, like stairs, trees and remains, which just sits there
+        self.partitions = {}    # object -> which of the three lists above it is in
+        self.static_version = 0 # counts changes to the items and props, so the renderer knows when to look again
+
+        # A registry of well known objects, so that nothing has to search the object list for them:
+        self.roles = {}     # role from ROLES -> the object filling it
+        self.kinds = {}     # object name -> list of all the objects with that name, such as every 'robot'
+        self.landers = []   # Rects of the landers that have come down on this map
+
+        # Where the things that happen on this map get written down as they happen, if anywhere. See journal.py.
+        self.journal = None
+
+        if objects is not None:
+            for obj in objects:
+                self.add_object(obj)
 
     def __getitem__(self, index):
         return self.level[index]
 
+    @property
+    def player(self):
+        return self.roles.get('player')
+
+    @property
+    def stairs(self):
+        return self.roles.get('stairs')
+
+    def record(self, kind, *args):
+        """Writes something that happened on this map down in the journal, if the map has one."""
+        if self.journal is not None:
+            self.journal.append(self, kind, args)
+
+    def add_object(self, obj):
+        """Puts an object onto this map at its current coordinates."""
+        self.record('spawn', obj)
+        self.objects.append(obj)
+        self.occupants.setdefault((obj.x, obj.y), []).append(obj)
+        if obj.name in self.ROLES:
+            self.roles[obj.name] = obj
+        self.kinds.setdefault(obj.name, []).append(obj)
+        self._partition(obj)
+        obj.gamemap = self
+        if obj.ai:
+            self.scheduler.add(obj, self.turn)
+
+    def remove_object(self, obj):
+        """Takes an object off this map, for example when it gets picked up."""
+        self.record('removed', obj)
+        self.objects.remove(obj)
+        self._vacate(obj)
+        for role, filled_by in self.roles.items():
+            if filled_by is obj:
+                del self.roles[role]
+        self._unfile(obj)
+        self._unpartition(obj)
+        self.reservations.release(obj)
+        self.scheduler.remove(obj, self.turn)
+        obj.gamemap = None
+
+    def object_changed(self, obj):
+        """
+        Call this when an object on this map changes what it is, such as dying and turning into remains, or
+        getting its AI swapped out by confusion.
+        """
+        self._unfile(obj)
+        self.kinds.setdefault(obj.name, []).append(obj)
+
+        if self.partition_for(obj) is not self.partitions[obj]:
+            self._unpartition(obj)
+            self._partition(obj)
+        elif obj not in self.actors:
+            self.static_version += 1
+
+        if obj.ai and obj not in self.scheduler:
+            self.scheduler.add(obj, self.turn)
+        elif not obj.ai:
+            self.scheduler.remove(obj, self.turn)
+
+    def run_turn(self):
+        """Lets every creature which is due take its turn, and then moves the map on to the next turn."""
+        obj = self.scheduler.next_due(self.turn)
+        while obj is not None:
+            if timer.enabled:
+                timer.call('ai ' + obj.ai.__class__.__name__, obj.ai.take_turn, self)
+            else:
+                obj.ai.take_turn(self)
+            # Dead creatures have no AI any more, and creatures which left the map are scheduled there
+            if obj.ai and obj.gamemap is self:
+                self.scheduler.reschedule(obj, self.turn)
+                self.record('wait', obj, self.scheduler.waiting(obj, self.turn))
+            obj = self.scheduler.next_due(self.turn)
+        self.turn += 1
+
+    def partition_for(self, obj):
+        """Returns which of actors, items or props an object belongs in."""
+        if obj.ai or obj.fighter:
+            return self.actors
+        if obj.item:
+            return self.items
+        return self.props
+
+    def _partition(self, obj):
+        partition = self.partition_for(obj)
+        partition.append(obj)
+        self.partitions[obj] = partition
+        if partition is not self.actors:
+            self.static_version += 1
+
+    def _unpartition(self, obj):
+        partition = self.partitions.pop(obj)
+        partition.remove(obj)
+        if partition is not self.actors:
+            self.static_version += 1
+
+    def of_kind(self, name):
+        """Returns a list of all the objects on this map with a given name, such as all the 'civil engineer's."""
+        return self.kinds.get(name, [])
+
+    def _unfile(self, obj):
+        for name, objects in self.kinds.items():
+            if obj in objects:
+                objects.remove(obj)
+                if not objects:
+                    del self.kinds[name]
+                return
+
+    def move_object(self, obj, x, y):
+        """Moves an object to (x, y), keeping the occupancy index up to date."""
+        self.record('move', obj, x, y)
+        self._vacate(obj)
+        obj.x = x
+        obj.y = y
+        self.occupants.setdefault((x, y), []).append(obj)
+        if self.partitions[obj] is not self.actors:
+            self.static_version += 1
+
+    def _vacate(self, obj):
+        here = self.occupants[(obj.x, obj.y)]
+        here.remove(obj)
+        if not here:
+            del self.occupants[(obj.x, obj.y)]
+
+    def objects_at(self, x, y):
+        """Returns a list of the objects standing on (x, y)."""
+        return self.occupants.get((x, y), [])
+
+    def within_radius(self, x, y, radius):
+        """Returns a list of the objects no further than radius from (x, y)."""
+        radius_squared = radius ** 2
+        found = []
+        if (2 * radius + 1) ** 2 < len(self.occupants):
+            # Only look at the tiles around (x, y)
+            for tx in range(x - radius, x + radius + 1):
+                for ty in range(y - radius, y + radius + 1):
+                    if (tx - x) ** 2 + (ty - y) ** 2 <= radius_squared and (tx, ty) in self.occupants:
+                        found.extend(self.occupants[(tx, ty)])
+        else:
+            # The area is bigger than the number of occupied tiles, so it's quicker to check those instead
+            for (tx, ty), here in self.occupants.items():
+                if (tx - x) ** 2 + (ty - y) ** 2 <= radius_squared:
+                    found.extend(here)
+        return found
+
+    def nearest(self, x, y, predicate=None, max_range=None):
+        """
+        Returns the closest object to (x, y) for which predicate(object) is true, or None if there isn't one
+        within max_range. This searches outwards from (x, y) one square ring at a time, so it only looks at
+        as much of the map as it has to.
+        """
+        if max_range is None:
+            max_range = max(self.level.width, self.level.height)
+        best = None
+        best_distance = max_range ** 2 + 1
+
+        for ring in range(max_range + 1):
+            if ring ** 2 >= best_distance:
+                break # everything on this ring and beyond is further away than what we have
+            for (tx, ty) in ring_around(x, y, ring):
+                for obj in self.occupants.get((tx, ty), ()):
+                    distance = (tx - x) ** 2 + (ty - y) ** 2
+                    if distance < best_distance and (predicate is None or predicate(obj)):
+                        best = obj
+                        best_distance = distance
+        return best
+
+    def is_blocked(self, x, y):
+        """Is this square blocked by a map tile, or an object?"""
+        if self.level.blocked[self.level.index(x, y)]:
+            return True
+        for obj in self.occupants.get((x, y), ()):
+            if obj.blocks:
+                return True
+        return False
+
     def initialize_fov(self):
         """This is needed to allow field of view stuff. It requires the GameMap instance to already have
         a level (a Tile array)."""
         
         #create the FOV map according to the generated map
-        self.fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-        for y in range(MAP_HEIGHT):
-            for x in range(MAP_WIDTH):
-                libtcod.map_set_properties(self.fov_map, x, y, not self.level[x][y].block_sight, not self.level[x][y].blocked)
-                
+        self.fov_map = self.new_libtcod_map()
+        self.fov_recompute = True
+
+    def initialize_nav(self):
+        """Builds the navigation map that all the AI pathfinding uses."""
+        self.nav_map = self.new_libtcod_map()
+        self.nav_version += 1
+
+    def flow_field_to_player(self):
+        """Returns the FlowField leading to the player, bringing it up to date first if it needs it."""
+        if self.player_flow_field is None:
+            self.player_flow_field = FlowField(self)
+        self.player_flow_field.update(self.player.x, self.player.y)
+        return self.player_flow_field
+
+    def new_libtcod_map(self):
+        """Returns a libtcod map with the transparency and walkability of every tile in the level."""
+        libtcod_map = libtcod.map_new(self.level.width, self.level.height)
+        block_sight = self.level.block_sight
+        blocked = self.level.blocked
+        for x in range(self.level.width):
+            for y in range(self.level.height):
+                index = self.level.index(x, y)
+                libtcod.map_set_properties(libtcod_map, x, y, not block_sight[index], not blocked[index])
+        return libtcod_map
+
+    def claim_job(self, builder, accept=None):
+        """
+        Claims the nearest unclaimed work order that the builder can actually get to. Returns its (x, y), 
+        or (None, None).
+
+        A builder which found nothing doesn't look through the jobs again until one gets freed up, a tile gets
+        cleared or it is somewhere else, since none of the jobs it couldn't get to can have become reachable.
+        """
+        regions = self.level.regions()
+        looked = (self.work_orders.version, regions.version, regions.region_at(builder.x, builder.y))
+        if accept is None and self.idle_builders.get(builder) == looked:
+            return (None, None)
+
+        def reachable(x, y):
+            if not regions.can_reach_next_to(builder.x, builder.y, x, y):
+                return False
+            return accept is None or accept(x, y)
+
+        x, y = self.work_orders.claim_nearest(builder, builder.x, builder.y, reachable)
+        if x is not None:
+            self.level.set(x, y, being_worked_on=True)
+            self.idle_builders.pop(builder, None)
+        elif accept is None:
+            self.idle_builders[builder] = looked
+        return (x, y)
+
+    def release_job(self, builder):
+        """Gives a builder's claimed job back to the work orders, if it has one."""
+        self.idle_builders.pop(builder, None)
+        job = self.work_orders.release(builder)
+        if job is not None:
+            self.level.set(job[0], job[1], being_worked_on=False)
+
+    def designate(self, x, y, designation_type, designation_char):
+        """Marks a tile as needing work, which puts it in the work orders for the builders."""
+        if not (0 <= x < self.level.width and 0 <= y < self.level.height):
+            raise IndexError('Cannot designate a tile outside of the map.')
+        self.record('designate', x, y, designation_type, designation_char)
+        self.level.set(x, y, designated=True, designation_type=designation_type, designation_char=designation_char)
+
+    def clear_tile(self, x, y):
+        """A builder finished clearing a designated tile, which turns it into open gravel."""
+        self.record('cleared', x, y)
+        self.level.set(x, y, blocked=False, block_sight=False, fore=color_ground, back=color_ground, char=GRAVEL,
+                       designated=False, designation_type=None, designation_char=None, being_worked_on=False)
+
+    def tile_changed(self, index, name):
+        """
+        Listener on the level, which copies walkability and transparency changes into the FOV and nav maps,
+        and keeps the work orders in step with the designated tiles.
+        """
+        if name == 'designated':
+            x, y = self.level.coords(index)
+            if self.level.designated[index]:
+                self.work_orders.add(x, y)
+            else:
+                self.work_orders.remove(x, y)
+            return
+
+        if name not in ('blocked', 'block_sight'):
+            return
+
+        x, y = self.level.coords(index)
+        transparent = not self.level.block_sight[index]
+        walkable = not self.level.blocked[index]
+        if self.fov_map is not None:
+            libtcod.map_set_properties(self.fov_map, x, y, transparent, walkable)
+            self.fov_recompute = True
+        libtcod.map_set_properties(self.nav_map, x, y, transparent, walkable)
+        self.nav_version += 1
+
+    def compute_fov(self, x, y):
+        """
+        Computes the field of view from (x, y), but only if it moved or the map's transparency changed since
+        the last time. Returns True if the FOV was recomputed.
+        """
+        if self.fov_map is None:
+            self.initialize_fov()
+
+        if not self.fov_recompute and self.fov_origin == (x, y):
+            return False
+
+        libtcod.map_compute_fov(self.fov_map, x, y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+        self.fov_origin = (x, y)
+        self.fov_recompute = False
+        self.fov_version += 1
+        return True
+
 
 class Tile(object):
     """
     A tile in the map and its properties. These are the properties that an individual square has, 
     not to be confused with the properties that an entire game level might have.
-    A map is a 2D array of Tiles.
+    A Tile doesn't store anything itself, it is a view of one square of a TileGrid, so setting
+    tile.blocked writes straight into the grid's blocked plane.
     """
-    def __init__(self, blocked, block_sight=True, char=' ', fore=libtcod.white, back=libtcod.black, outdoors=True):
-        self.blocked = blocked #is it passable?
-        self.block_sight = block_sight
-        self.char = char 
-        self.fore = fore #foreground color
-        self.back = back #background color
-        self.outdoors = outdoors
-        self.mapedge = False
-        self.explored = False
-
-        # A tile can be designated for construction of some sort. If it is designated, it will blink.
-        # designation_type determines more details like how it blinks or what it needs to be made into.
-        # Valid designation_types are:
-        # 'clearing'        when it needs to have all blocking walls removed
-        # 'build wall'      to build the wall of a building
-        # 'clean floor'     to lay the floor of a building (designate it as indoors and remove debris)
-        # 'install airlock' to place a door 
-        self.designated = False
-        self.designation_type = None
-        self.designation_char = None
-        self.being_worked_on = False
+    __slots__ = ('grid', 'index')
+
+    def __init__(self, grid, index):
+        self.grid = grid
+        self.index = index
+
+    def _flag(name):
+        def getter(self):
+            return bool(getattr(self.grid, name)[self.index])
+        def setter(self, value):
+            self.grid.set_index(self.index, name, value)
+        return property(getter, setter)
+
+    def _paletted(name, table):
+        def getter(self):
+            return table[getattr(self.grid, name)[self.index]]
+        def setter(self, value):
+            self.grid.set_index(self.index, name, value)
+        return property(getter, setter)
+
+    def _sparse(name):
+        def getter(self):
+            return getattr(self.grid, name).get(self.index)
+        def setter(self, value):
+            self.grid.set_index(self.index, name, value)
+        return property(getter, setter)
+
+    blocked = _flag('blocked') #is it passable?
+    block_sight = _flag('block_sight')
+    outdoors = _flag('outdoors')
+    mapedge = _flag('mapedge')
+    explored = _flag('explored')
+    char = _paletted('char', CHARS)
+    fore = _paletted('fore', COLORS) #foreground color
+    back = _paletted('back', COLORS) #background color
+
+    # A tile can be designated for construction of some sort. If it is designated, it will blink.
+    # designation_type determines more details like how it blinks or what it needs to be made into.
+    # Valid designation_types are:
+    # 'clearing'        when it needs to have all blocking walls removed
+    # 'build wall'      to build the wall of a building
+    # 'clean floor'     to lay the floor of a building (designate it as indoors and remove debris)
+    # 'install airlock' to place a door 
+    designated = _flag('designated')
+    designation_type = _sparse('designation_type')
+    designation_char = _sparse('designation_char')
+    being_worked_on = _flag('being_worked_on')
+
+    del _flag, _paletted, _sparse
+
+class TileColumn(object):
+    """One column of a TileGrid, so that grid[x][y] works like it did on a 2D array of Tiles."""
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.grid.height
+        if not 0 <= y < self.grid.height:
+            raise IndexError('Tile y coordinate out of range.')
+        return Tile(self.grid, self.x * self.grid.height + y)
+
+class TileGrid(object):
+    """
+    The tiles of a level, stored as a structure of arrays. Each tile property is a flat bytearray 
+    plane with one entry per tile, indexed by x * height + y. The characters and colors planes hold
+    indices into the palettes in palette.py rather than the values themselves. Whole-map passes
+    should work on the planes directly, while grid[x][y] gives a Tile view for everything else.
+    """
+    FLAGS = ('blocked', 'block_sight', 'outdoors', 'mapedge', 'explored', 'designated', 'being_worked_on')
+    PALETTED = { 'char': char_index, 'fore': color_index, 'back': color_index }
+    SPARSE = ('designation_type', 'designation_char')
+
+    def __init__(self, width=MAP_WIDTH, height=MAP_HEIGHT, blocked=False, block_sight=True, char=' ', 
+                 fore=libtcod.white, back=libtcod.black, outdoors=True):
+        self.width = width
+        self.height = height
+        self.size = width * height
+
+        # Callbacks of the form listener(index, name), called whenever a tile property actually changes.
+        self.listeners = []
+
+        for name in self.FLAGS:
+            setattr(self, name, bytearray(self.size))
+        for name in self.SPARSE:
+            setattr(self, name, {}) # tile index -> value, only for tiles that have one
+
+        self.char = bytearray(self.size)
+        self.fore = bytearray(self.size)
+        self.back = bytearray(self.size)
+        self.fill(0, 0, width-1, height-1, blocked=blocked, block_sight=block_sight, char=char, fore=fore, 
+                  back=back, outdoors=outdoors)
+
+        self.columns = [TileColumn(self, x) for x in range(width)]
+
+        # Every unblocked tile, kept up to date whenever a tile's blocked property changes
+        self.free = TileSet(index for index in xrange(self.size) if not self.blocked[index])
+
+        # The connected regions of unblocked tiles. This isn't worked out until something asks for it, so that
+        # map generation doesn't pay for keeping it up to date.
+        self.region_map = None
+        self.cluster_map = None
+
+    @classmethod
+    def from_planes(cls, width, height, planes, sparse=None):
+        """
+        Makes a grid straight out of its planes, such as ones read from a saved game, without setting the
+        tiles one at a time. planes is a dict of plane name -> bytes, and sparse a dict of sparse property
+        name -> {tile index: value}. Planes that aren't given are left as blocked, unlit ground.
+        """
+        grid = cls(width, height, blocked=True)
+        for name, plane in planes.items():
+            if len(plane) != grid.size:
+                raise ValueError('The ' + name + ' plane has ' + str(len(plane)) + ' tiles, but a ' + str(width) + 
+                                 'x' + str(height) + ' map needs ' + str(grid.size) + '.')
+            setattr(grid, name, bytearray(plane))
+        for name, values in (sparse or {}).items():
+            setattr(grid, name, dict(values))
+        grid.free = TileSet(index for index in xrange(grid.size) if not grid.blocked[index])
+        return grid
+
+    def __getitem__(self, x):
+        return self.columns[x]
+
+    def __len__(self):
+        return self.width
+
+    def index(self, x, y):
+        """Returns the position of (x, y) in the planes."""
+        return x * self.height + y
+
+    def coords(self, index):
+        """Returns the (x, y) coordinates of a position in the planes."""
+        return divmod(index, self.height)
+
+    def encode(self, name, value):
+        """Turns a property value into what gets stored in that property's plane."""
+        if name in self.PALETTED:
+            return self.PALETTED[name](value)
+        if name in self.SPARSE:
+            return value
+        return 1 if value else 0
+
+    def add_listener(self, listener):
+        """Registers a callback which gets told the index and property name of every tile change."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stops a callback from hearing about tile changes."""
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def set_index(self, index, name, value):
+        """Sets one property of the tile at a plane position."""
+        self._store(index, name, self.encode(name, value))
+
+    def _store(self, index, name, value):
+        """Puts an already encoded value into a plane, and tells the listeners if it changed anything."""
+        plane = getattr(self, name)
+        if name in self.SPARSE:
+            if plane.get(index) == value:
+                return
+            if value is None:
+                del plane[index]
+            else:
+                plane[index] = value
+        else:
+            if plane[index] == value:
+                return
+            plane[index] = value
+            if name == 'blocked' and hasattr(self, 'free'):
+                if value:
+                    self.free.discard(index)
+                else:
+                    self.free.add(index)
+
+        for listener in self.listeners:
+            listener(index, name)
+
+    def set(self, x, y, **properties):
+        """Sets any number of properties of the tile at (x, y)."""
+        index = self.index(x, y)
+        for name, value in properties.items():
+            self.set_index(index, name, value)
+
+    def fill(self, x1, y1, x2, y2, **properties):
+        """Sets properties for every tile in the rectangle from (x1, y1) to (x2, y2), inclusive."""
+        for name, value in properties.items():
+            value = self.encode(name, value)
+            for x in range(x1, x2+1):
+                start = self.index(x, y1)
+                stop = self.index(x, y2) + 1
+                if name in self.SPARSE or self.listeners or (name == 'blocked' and hasattr(self, 'free')):
+                    # Go tile by tile so that listeners and the free tile set hear about each tile that really changed
+                    for index in range(start, stop):
+                        self._store(index, name, value)
+                else:
+                    getattr(self, name)[start:stop] = bytearray([value]) * (stop - start)
+
+    def random_free_tile(self, rng=0):
+        """Returns the (x, y) of a random unblocked tile, or (None, None) if every tile is blocked."""
+        if not self.free:
+            return (None, None)
+        return self.coords(self.free.choice(rng))
+
+    def random_free_tile_in(self, x1, y1, x2, y2, tries=20, rng=0):
+        """Returns the (x, y) of a random unblocked tile inside a rectangle, or (None, None) if there isn't one."""
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, self.width-1), min(y2, self.height-1)
+        if x1 > x2 or y1 > y2:
+            return (None, None)
+
+        # Usually most of the area is open, so just try random spots for a while
+        for attempt in range(tries):
+            x = random_int(rng, x1, x2)
+            y = random_int(rng, y1, y2)
+            if not self.blocked[self.index(x, y)]:
+                return (x, y)
+
+        candidates = [(x, y) for x in range(x1, x2+1) for y in range(y1, y2+1) if not self.blocked[self.index(x, y)]]
+        if not candidates:
+            return (None, None)
+        return candidates[random_int(rng, 0, len(candidates)-1)]
+
+    def regions(self):
+        """Returns the RegionMap of this grid, labelling the regions first if nobody has asked for them yet."""
+        if self.region_map is None:
+            self.region_map = RegionMap(self)
+        return self.region_map
+
+    def clusters(self):
+        """Returns the ClusterMap of this grid for long paths, making it first if nobody has asked for it yet."""
+        if self.cluster_map is None:
+            self.cluster_map = ClusterMap(self)
+        return self.cluster_map
+
+    def random_reachable_tile(self, x, y, rng=0):
+        """Returns the (x, y) of a random unblocked tile which can be walked to from (x, y), or (None, None)."""
+        return self.regions().random_tile(self.regions().region_at(x, y), rng)
+
+    def neighbours(self, index):
+        """Returns the plane positions of the up to 8 tiles around the one at index."""
+        x, y = self.coords(index)
+        return [self.index(x + dx, y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) 
+                if (dx or dy) and 0 <= x + dx < self.width and 0 <= y + dy < self.height]
 
 class Rect(object):
     """A rectangle, with a center."""
@@ -120,33 +696,15 @@ def create_building(mymap, building):
     """
 
     # Clear the whole footprint
-    for x in range(building.x1, building.x2+1):
-        for y in range(building.y1, building.y2+1):
-            mymap[x][y].blocked = False
-            mymap[x][y].block_sight = False
-            mymap[x][y].fore = color_ground
-            mymap[x][y].back = color_ground
-            mymap[x][y].outdoors = False
+    mymap.fill(building.x1, building.y1, building.x2, building.y2, blocked=False, block_sight=False,
+               fore=color_ground, back=color_ground, outdoors=False)
 
     #Create walls of building 
-    for x in range(building.x1, building.x2+1):
-        mymap[x][building.y1].blocked = True
-        mymap[x][building.y1].block_sight = True
-        mymap[x][building.y1].fore = color_building
-        mymap[x][building.y1].back = color_building
-        mymap[x][building.y2].blocked = True
-        mymap[x][building.y2].block_sight = True
-        mymap[x][building.y2].fore = color_building
-        mymap[x][building.y2].back = color_building
-    for y in range(building.y1, building.y2+1):
-        mymap[building.x1][y].blocked = True
-        mymap[building.x1][y].block_sight = True
-        mymap[building.x1][y].fore = color_building
-        mymap[building.x1][y].back = color_building
-        mymap[building.x2][y].blocked = True
-        mymap[building.x2][y].block_sight = True
-        mymap[building.x2][y].fore = color_building
-        mymap[building.x2][y].back = color_building
+    wall = dict(blocked=True, block_sight=True, fore=color_building, back=color_building)
+    mymap.fill(building.x1, building.y1, building.x2, building.y1, **wall)
+    mymap.fill(building.x1, building.y2, building.x2, building.y2, **wall)
+    mymap.fill(building.x1, building.y1, building.x1, building.y2, **wall)
+    mymap.fill(building.x2, building.y1, building.x2, building.y2, **wall)
 
 def create_h_tunnel(x1, x2, y):
     global map
@@ -160,10 +718,11 @@ def create_v_tunnel(y1, y2, x):
         map[x][y].blocked = False
         map[x][y].block_sight = False
 
-def make_bare_surface_map(player=None):
+def make_bare_surface_map(player=None, width=MAP_WIDTH, height=MAP_HEIGHT):
     """
     Creates a map which is open by default, and then filled with boulders, mesas and rocks.
-    Uses a 2D noise generator. The map has an impenetrable border.
+    Uses a 2D noise generator. The map has an impenetrable border. It is MAP_WIDTH by MAP_HEIGHT tiles 
+    unless width and height say otherwise.
     """
     objects_for_this_map = []
 
@@ -181,61 +740,45 @@ def make_bare_surface_map(player=None):
         objects_for_this_map.append(player)
 
 
-    noise2d = libtcod.noise_new(2) #create a 2D noise generator
+    noise_rng = streams.libtcod_generator('terrain')
+    noise2d = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY, 
+                                noise_rng) #create a 2D noise generator
     libtcod.noise_set_type(noise2d, libtcod.NOISE_SIMPLEX) #tell it to use simplex noise for higher contrast
 
     # Create the map with a default tile choice of empty unblocked squares.
-    newmap = [[ Tile(blocked=False, block_sight=False, char=' ', fore=color_ground, back=color_ground) 
-        for y in range(MAP_HEIGHT)] 
-            for x in range(MAP_WIDTH) ]
+    newmap = TileGrid(width, height, blocked=False, block_sight=False, char=' ', fore=color_ground, 
+                      back=color_ground)
 
     #Put a border around the map so the characters can't go off the edge of the world
-    for x in range(0, MAP_WIDTH):
-        newmap[x][0].blocked = True
-        newmap[x][0].block_sight = True
-        newmap[x][0].mapedge = True
-        newmap[x][0].fore = color_wall
-        newmap[x][0].back = color_wall
-        newmap[x][MAP_HEIGHT-1].blocked = True
-        newmap[x][MAP_HEIGHT-1].block_sight = True
-        newmap[x][MAP_HEIGHT-1].mapedge = True
-        newmap[x][MAP_HEIGHT-1].fore = color_wall
-        newmap[x][MAP_HEIGHT-1].back = color_wall
-    for y in range(0, MAP_HEIGHT):
-        newmap[0][y].blocked = True
-        newmap[0][y].block_sight = True
-        newmap[0][y].mapedge = True
-        newmap[0][y].fore = color_wall
-        newmap[0][y].back = color_wall
-        newmap[MAP_WIDTH-1][y].blocked = True
-        newmap[MAP_WIDTH-1][y].block_sight = True
-        newmap[MAP_WIDTH-1][y].mapedge = True
-        newmap[MAP_WIDTH-1][y].fore = color_wall
-        newmap[MAP_WIDTH-1][y].back = color_wall
+    border = dict(blocked=True, block_sight=True, mapedge=True, fore=color_wall, back=color_wall)
+    newmap.fill(0, 0, width-1, 0, **border)
+    newmap.fill(0, height-1, width-1, height-1, **border)
+    newmap.fill(0, 0, 0, height-1, **border)
+    newmap.fill(width-1, 0, width-1, height-1, **border)
 
     # Create natural looking landscape
-    for x in range(1, MAP_WIDTH-1):
-        for y in range(1, MAP_HEIGHT-1):
+    for x in range(1, width-1):
+        for y in range(1, height-1):
             if libtcod.noise_get_turbulence(noise2d, [x, y], 128.0, libtcod.NOISE_SIMPLEX) < 0.4:
                 #Turbulent simplex noise returns values between 0.0 and 1.0, with many values greater than 0.9.
-                newmap[x][y].blocked = True
-                newmap[x][y].block_sight = True
-                newmap[x][y].fore = color_wall
-                newmap[x][y].back = color_wall
+                newmap.set(x, y, blocked=True, block_sight=True, fore=color_wall, back=color_wall)
+    libtcod.noise_delete(noise2d)
+    libtcod.random_delete(noise_rng)
 
     # Scatter debris around the map to add flavor:
     place_junk(newmap)
 
     # Choose a spot for the player to start
-    player.x, player.y = choose_random_unblocked_spot(newmap)
+    player.x, player.y = choose_random_unblocked_spot(newmap, rng=streams['spawning'])
 
     return newmap, objects_for_this_map
 
 
-def make_surface_map(player=None):
+def make_surface_map(player=None, width=MAP_WIDTH, height=MAP_HEIGHT):
     """
     Creates a map which is open by default, and then filled with boulders, mesas and buildings.
-    Uses a 2D noise generator. The map has an impenetrable border.
+    Uses a 2D noise generator. The map has an impenetrable border. It is MAP_WIDTH by MAP_HEIGHT tiles 
+    unless width and height say otherwise.
     """
     objects_for_this_map = []
     new_objects = []
@@ -255,56 +798,39 @@ def make_surface_map(player=None):
         objects_for_this_map.append(player)
 
 
-    noise2d = libtcod.noise_new(2) #create a 2D noise generator
+    noise_rng = streams.libtcod_generator('terrain')
+    noise2d = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY, 
+                                noise_rng) #create a 2D noise generator
     libtcod.noise_set_type(noise2d, libtcod.NOISE_SIMPLEX) #tell it to use simplex noise for higher contrast
 
     # Create the map with a default tile choice of empty unblocked squares.
-    newmap = [[ Tile(blocked=False, block_sight=False, char=' ', fore=color_ground, back=color_ground) 
-        for y in range(MAP_HEIGHT)] 
-            for x in range(MAP_WIDTH) ]
+    newmap = TileGrid(width, height, blocked=False, block_sight=False, char=' ', fore=color_ground, 
+                      back=color_ground)
 
     #Put a border around the map so the characters can't go off the edge of the world
-    for x in range(0, MAP_WIDTH):
-        newmap[x][0].blocked = True
-        newmap[x][0].block_sight = True
-        newmap[x][0].mapedge = True
-        newmap[x][0].fore = color_wall
-        newmap[x][0].back = color_wall
-        newmap[x][MAP_HEIGHT-1].blocked = True
-        newmap[x][MAP_HEIGHT-1].block_sight = True
-        newmap[x][MAP_HEIGHT-1].mapedge = True
-        newmap[x][MAP_HEIGHT-1].fore = color_wall
-        newmap[x][MAP_HEIGHT-1].back = color_wall
-    for y in range(0, MAP_HEIGHT):
-        newmap[0][y].blocked = True
-        newmap[0][y].block_sight = True
-        newmap[0][y].mapedge = True
-        newmap[0][y].fore = color_wall
-        newmap[0][y].back = color_wall
-        newmap[MAP_WIDTH-1][y].blocked = True
-        newmap[MAP_WIDTH-1][y].block_sight = True
-        newmap[MAP_WIDTH-1][y].mapedge = True
-        newmap[MAP_WIDTH-1][y].fore = color_wall
-        newmap[MAP_WIDTH-1][y].back = color_wall
+    border = dict(blocked=True, block_sight=True, mapedge=True, fore=color_wall, back=color_wall)
+    newmap.fill(0, 0, width-1, 0, **border)
+    newmap.fill(0, height-1, width-1, height-1, **border)
+    newmap.fill(0, 0, 0, height-1, **border)
+    newmap.fill(width-1, 0, width-1, height-1, **border)
 
     # Create natural looking landscape
-    for x in range(1, MAP_WIDTH-1):
-        for y in range(1, MAP_HEIGHT-1):
+    for x in range(1, width-1):
+        for y in range(1, height-1):
             if libtcod.noise_get_turbulence(noise2d, [x, y], 128.0, libtcod.NOISE_SIMPLEX) < 0.4:
                 #Turbulent simplex noise returns values between 0.0 and 1.0, with many values greater than 0.9.
-                newmap[x][y].blocked = True
-                newmap[x][y].block_sight = True
-                newmap[x][y].fore = color_wall
-                newmap[x][y].back = color_wall
+                newmap.set(x, y, blocked=True, block_sight=True, fore=color_wall, back=color_wall)
+    libtcod.noise_delete(noise2d)
+    libtcod.random_delete(noise_rng)
 
     # Place buildings
     buildings = []
     num_buildings = 0
     for r in range(MAX_BUILDINGS):
-        w = libtcod.random_get_int(0, BUILDING_MIN_SIZE, BUILDING_MAX_SIZE)
-        h = libtcod.random_get_int(0, BUILDING_MIN_SIZE, BUILDING_MAX_SIZE)
-        x = libtcod.random_get_int(0, 0, MAP_WIDTH - w - 1)
-        y = libtcod.random_get_int(0, 0, MAP_HEIGHT - h - 1)
+        w = random_int(streams['terrain'], BUILDING_MIN_SIZE, BUILDING_MAX_SIZE)
+        h = random_int(streams['terrain'], BUILDING_MIN_SIZE, BUILDING_MAX_SIZE)
+        x = random_int(streams['terrain'], 0, width - w - 1)
+        y = random_int(streams['terrain'], 0, height - h - 1)
         new_building = Rect(x, y, w, h)
         create_building(newmap, new_building)
         buildings.append(new_building)
@@ -329,26 +855,26 @@ def make_surface_map(player=None):
         if newmap[doorx][doory].blocked and not newmap[doorx][doory].mapedge: 
             newmap[doorx][doory].char = LEFT_DOOR
             newmap[doorx][doory].blocked = False 
-            newmap[doorx][doory].fore = libtcod.white
-            newmap[doorx][doory].back = libtcod.grey
+            newmap[doorx][doory].fore = color_door
+            newmap[doorx][doory].back = color_door_back
         doorx, doory = place.middle_of_wall('top')
         if newmap[doorx][doory].blocked and not newmap[doorx][doory].mapedge:
             newmap[doorx][doory].char = TOP_DOOR
             newmap[doorx][doory].blocked = False 
-            newmap[doorx][doory].fore = libtcod.white
-            newmap[doorx][doory].back = libtcod.grey
+            newmap[doorx][doory].fore = color_door
+            newmap[doorx][doory].back = color_door_back
         doorx, doory = place.middle_of_wall('right')
         if newmap[doorx][doory].blocked and not newmap[doorx][doory].mapedge: 
             newmap[doorx][doory].char = RIGHT_DOOR
             newmap[doorx][doory].blocked = False 
-            newmap[doorx][doory].fore = libtcod.white
-            newmap[doorx][doory].back = libtcod.grey
+            newmap[doorx][doory].fore = color_door
+            newmap[doorx][doory].back = color_door_back
         doorx, doory = place.middle_of_wall('bottom')
         if newmap[doorx][doory].blocked and not newmap[doorx][doory].mapedge: 
             newmap[doorx][doory].char = BOTTOM_DOOR
             newmap[doorx][doory].blocked = False 
-            newmap[doorx][doory].fore = libtcod.white
-            newmap[doorx][doory].back = libtcod.grey
+            newmap[doorx][doory].fore = color_door
+            newmap[doorx][doory].back = color_door_back
 
         more_objects = place_objects(newmap, place) #add some contents to this room
         if more_objects is not None:
@@ -359,7 +885,7 @@ def make_surface_map(player=None):
     place_junk(newmap)
 
     # Choose a spot for the player to start
-    player.x, player.y = choose_random_unblocked_spot(newmap)
+    player.x, player.y = choose_random_unblocked_spot(newmap, rng=streams['spawning'])
 
     for item in new_objects:
         objects_for_this_map.append(item)
@@ -397,16 +923,16 @@ def place_objects(mymap, room):
     item_chances['shield'] = 15
  
     #choose a random number of NPCs
-    num_NPCs = libtcod.random_get_int(0, 0, max_NPCs)
+    num_NPCs = random_int(streams['spawning'], 0, max_NPCs)
 
     for i in range(num_NPCs):
         #choose a spot for the NPC
-        x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
-        y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
+        x = random_int(streams['spawning'], room.x1+1, room.x2-1)
+        y = random_int(streams['spawning'], room.y1+1, room.y2-1)
         
         #Create the NPC
         if not is_blocked(mymap, objects, x, y):
-            choice = random_choice(NPC_chances)
+            choice = random_choice(NPC_chances, streams['spawning'])
             if choice == 'robot': 
                 #Create an minor enemy
                 fighter_component = Fighter(hp=10, defense=0, power=3, xp=35, death_function=NPC_death)
@@ -433,12 +959,12 @@ def place_objects(mymap, room):
             objects.append(NPC)
             
     #Create and place items
-    num_items = libtcod.random_get_int(0, 0, max_items)
+    num_items = random_int(streams['spawning'], 0, max_items)
     for i in range(num_items):
-        x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
-        y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
+        x = random_int(streams['spawning'], room.x1+1, room.x2-1)
+        y = random_int(streams['spawning'], room.y1+1, room.y2-1)
         if not is_blocked(mymap, objects, x, y):
-            choice = random_choice(item_chances)
+            choice = random_choice(item_chances, streams['spawning'])
             if choice == 'heal':
                 #creating a healing potion:
                 item_component = Item(use_function=cast_heal)
@@ -474,108 +1000,60 @@ def land_astronauts(gamemap_instance):
     a permanent addition to the map.
     """
 
-    landingx = libtcod.random_get_int(0, 7, MAP_WIDTH-7)
-    landingy = libtcod.random_get_int(0, 7, MAP_HEIGHT-7)
-
     mymap = gamemap_instance.level
-    objects_for_this_map = gamemap_instance.objects
 
-    martian_lander = Rect(landingx-2, landingy-2, 4, 4)
+    landingx = random_int(streams['spawning'], 7, mymap.width-7)
+    landingy = random_int(streams['spawning'], 7, mymap.height-7)
+    build_lander(gamemap_instance, landingx, landingy)
 
-    # Make the walls
-    for x in range(landingx-2, landingx+3):
-        mymap[x][landingy-2].blocked = True
-        mymap[x][landingy-2].block_sight = True
-        mymap[x][landingy-2].char = ' '
-        mymap[x][landingy-2].fore = libtcod.darkest_grey
-        mymap[x][landingy-2].back = libtcod.darkest_grey
-        mymap[x][landingy-2].outdoors = False
-        mymap[x][landingy-2].explored = False
-        mymap[x][landingy-2].designated = False
-        mymap[x][landingy-2].designation_type = None
-        mymap[x][landingy-2].designation_char = None
-
-        mymap[x][landingy+2].blocked = True
-        mymap[x][landingy+2].block_sight = True
-        mymap[x][landingy+2].char = ' '
-        mymap[x][landingy+2].fore = libtcod.darkest_grey
-        mymap[x][landingy+2].back = libtcod.darkest_grey
-        mymap[x][landingy+2].outdoors = False
-        mymap[x][landingy+2].explored = False
-        mymap[x][landingy+2].designated = False
-        mymap[x][landingy+2].designation_type = None
-        mymap[x][landingy+2].designation_char = None
-
-    for y in range(landingy-2, landingy+3):
-        mymap[landingx-2][y].blocked = True
-        mymap[landingx-2][y].block_sight = True
-        mymap[landingx-2][y].char = ' '
-        mymap[landingx-2][y].fore = libtcod.darkest_grey
-        mymap[landingx-2][y].back = libtcod.darkest_grey
-        mymap[landingx-2][y].outdoors = False
-        mymap[landingx-2][y].explored = False
-        mymap[landingx-2][y].designated = False
-        mymap[landingx-2][y].designation_type = None
-        mymap[landingx-2][y].designation_char = None
-
-        mymap[landingx+2][y].blocked = True
-        mymap[landingx+2][y].block_sight = True
-        mymap[landingx+2][y].char = ' '
-        mymap[landingx+2][y].fore = libtcod.darkest_grey
-        mymap[landingx+2][y].back = libtcod.darkest_grey
-        mymap[landingx+2][y].outdoors = False
-        mymap[landingx+2][y].explored = False
-        mymap[landingx+2][y].designated = False
-        mymap[landingx+2][y].designation_type = None
-        mymap[landingx+2][y].designation_char = None
-
-    # Make the floor inside
+    # Place the astronauts inside:
     for x in range(landingx-1, landingx+2):
         for y in range(landingy-1, landingy+2):
-            mymap[x][y].blocked = False
-            mymap[x][y].block_sight = False
-            mymap[x][y].char = ' '
-            mymap[x][y].fore = libtcod.grey
-            mymap[x][y].back = libtcod.grey
-            mymap[x][y].outdoors = False
-            mymap[x][y].explored = False
-            mymap[x][y].designated = False
-            mymap[x][y].designation_type = None
-            mymap[x][y].designation_char = None
+            fighter_component = Fighter(hp=10, defense=0, power=3, xp=35, death_function=NPC_death)
+            ai_component = BasicBuilder()
+            NPC = GamePiece(x, y, '@', 'civil engineer', libtcod.white, blocks=True,
+                            fighter=fighter_component, ai=ai_component)
+            
+            print 'Created BasicBuilder'
+            gamemap_instance.add_object(NPC)
+            print 'Appended ' + str(NPC) + ' to this map.'
+
+def build_lander(gamemap_instance, landingx, landingy):
+    """Puts an empty lander down on the map, centered on (landingx, landingy)."""
+    mymap = gamemap_instance.level
+    gamemap_instance.record('landed', landingx, landingy)
+
+    martian_lander = Rect(landingx-2, landingy-2, 4, 4)
+    gamemap_instance.landers.append(martian_lander)
+
+    # Make the walls, and then hollow out the floor inside
+    mymap.fill(landingx-2, landingy-2, landingx+2, landingy+2, blocked=True, block_sight=True, char=' ', 
+               fore=color_lander, back=color_lander, outdoors=False, explored=False, 
+               designated=False, designation_type=None, designation_char=None)
+    mymap.fill(landingx-1, landingy-1, landingx+1, landingy+1, blocked=False, block_sight=False, 
+               fore=color_lander_floor, back=color_lander_floor)
 
     # Put airlocks in all four sides
     doorx, doory = martian_lander.middle_of_wall('left')
     mymap[doorx][doory].char = LEFT_DOOR
     mymap[doorx][doory].blocked = False 
-    mymap[doorx][doory].fore = libtcod.white
-    mymap[doorx][doory].back = libtcod.grey
+    mymap[doorx][doory].fore = color_door
+    mymap[doorx][doory].back = color_door_back
     doorx, doory = martian_lander.middle_of_wall('top')
     mymap[doorx][doory].char = TOP_DOOR
     mymap[doorx][doory].blocked = False 
-    mymap[doorx][doory].fore = libtcod.white
-    mymap[doorx][doory].back = libtcod.grey
+    mymap[doorx][doory].fore = color_door
+    mymap[doorx][doory].back = color_door_back
     doorx, doory = martian_lander.middle_of_wall('right')
     mymap[doorx][doory].char = RIGHT_DOOR
     mymap[doorx][doory].blocked = False 
-    mymap[doorx][doory].fore = libtcod.white
-    mymap[doorx][doory].back = libtcod.grey
+    mymap[doorx][doory].fore = color_door
+    mymap[doorx][doory].back = color_door_back
     doorx, doory = martian_lander.middle_of_wall('bottom')
     mymap[doorx][doory].char = BOTTOM_DOOR
     mymap[doorx][doory].blocked = False 
-    mymap[doorx][doory].fore = libtcod.white
-    mymap[doorx][doory].back = libtcod.grey
-
-    # Place the astronauts inside:
-    for x in range(landingx-1, landingx+2):
-        for y in range(landingy-1, landingy+2):
-            fighter_component = Fighter(hp=10, defense=0, power=3, xp=35, death_function=NPC_death)
-            ai_component = BasicBuilder()
-            NPC = GamePiece(x, y, '@', 'civil engineer', libtcod.white, blocks=True,
-                            fighter=fighter_component, ai=ai_component)
-            
-            print 'Created BasicBuilder'
-            objects_for_this_map.append(NPC)
-            print 'Appended ' + str(NPC) + ' to this map.'
+    mymap[doorx][doory].fore = color_door
+    mymap[doorx][doory].back = color_door_back
 
 
 
@@ -594,18 +1072,21 @@ def place_junk(mymap):
     debris['boulder'] = 10
     debris['gravel'] = 10
 
-    for y in range(MAP_HEIGHT): 
-            for x in range(MAP_WIDTH):
-                if mymap[x][y].outdoors and not mymap[x][y].blocked:
-                    choice = random_choice(debris)
+    outdoors = mymap.outdoors
+    blocked = mymap.blocked
+    for y in range(mymap.height): 
+            for x in range(mymap.width):
+                index = mymap.index(x, y)
+                if outdoors[index] and not blocked[index]:
+                    choice = random_choice(debris, streams['terrain'])
                     if choice == 'nothing':
                         pass
                     elif choice == 'stone':
-                        mymap[x][y].char = '.'
-                        mymap[x][y].fore = libtcod.dark_sepia
+                        mymap.set_index(index, 'char', '.')
+                        mymap.set_index(index, 'fore', color_stone)
                     elif choice == 'boulder':
-                        mymap[x][y].char = BOULDER # bullet point
-                        mymap[x][y].fore = libtcod.dark_sepia
+                        mymap.set_index(index, 'char', BOULDER) # bullet point
+                        mymap.set_index(index, 'fore', color_stone)
                     else: 
-                        mymap[x][y].char = GRAVEL
-                        mymap[x][y].fore = libtcod.dark_red
+                        mymap.set_index(index, 'char', GRAVEL)
+                        mymap.set_index(index, 'fore', color_gravel)
@@ -3,21 +3,36 @@
 
 # import general python and libtcod stuff:
 import libtcodpy as libtcod
-import shelve
-from time import sleep
+import os
+import argparse
+from time import sleep, time
 
 # Now import stuff from the game's other files:
 from constants import *
 from classes import switch, GamePiece, Fighter, Item, Equipment
 
 from utility_methods import is_blocked, choose_random_unblocked_spot, random_choice_index, random_choice, \
-                             target_NPC, find_player_in_list, message, move, move_towards, send_to_back
+                             target_NPC, message, move, move_towards, send_to_back
 
 from mapcreation import MAP_WIDTH, MAP_HEIGHT, GameMap, Tile, Rect, create_room, create_building, create_h_tunnel, \
                             create_v_tunnel, make_surface_map, place_objects, place_junk, make_bare_surface_map, \
                             land_astronauts
 
 from ai import BasicNPC, BasicExplorer, player_death, NPC_death
+from rendering import MapRenderer
+from profiling import timer
+from randomness import streams
+from recording import inputs
+import savegame
+from savegame import saver
+import journal
+from journal import Journal
+import levels
+from levels import LevelCache, go_down, go_up
+
+SAVE_FILE = 'savegame'
+AUTOSAVE_FILE = 'autosave'
+RECOVERY_FILE = 'recovery' # the action journal and its snapshots, for getting the game back after a crash
 
 
 def target_tile(mymap, max_range=None):
@@ -26,7 +41,7 @@ def target_tile(mymap, max_range=None):
     while True:
         # render the screen, which erases the inventory screen and shows the names of objects under the mouse
         libtcod.console_flush()
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE, key, mouse)
+        inputs.check_for_event(key, mouse)
         render_all(mymap)
         
         (x, y) = (mouse.cx, mouse.cy)
@@ -39,26 +54,6 @@ def target_tile(mymap, max_range=None):
             return (None, None) # have to return a tuple with 2 output args
 
 
-def next_level(list_of_maps, map_number):
-
-    player = find_player_in_list(list_of_maps[map_number].objects)
-    
-    message('You rest for a moment and recover your strength.', libtcod.light_violet)
-    player.fighter.heal(player.fighter.max_hp / 2)
-
-    message('You move onward to the next area...', libtcod.red)
-    map_number += 1
-    nextmap, objects_for_this_map = make_surface_map() # a fresh level!
-
-    # Append this new level to the list_of_maps, and then append all the objects to that GameMap's
-    # object list.
-    list_of_maps.append(GameMap(map_number, nextmap, 'surface'))
-    for item in objects_for_this_map:
-                list_of_maps[map_number].objects.append(item)
-
-
-
-
 def draw_things(list_of_maps, map_number):
     """
     This lets the player place things using the mouse by clicking on a tile and drawing over multiple
@@ -72,7 +67,7 @@ def draw_things(list_of_maps, map_number):
     while True:
         # Rendering the screen first closes the menu and returns to the map, ready to place something
         libtcod.console_flush()
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE,key,mouse)        
+        inputs.check_for_event(key, mouse)
         render_all(list_of_maps)
 
         xlist = []
@@ -127,7 +122,7 @@ def build_menu(mymap, header):
         (x, y) = target_tile(mymap)
         if x is not None and y is not None:
             thing = GamePiece(x, y, 247, 'liquid water', libtcod.blue, blocks=True, always_visible=True)
-            mymap[x][y].back = libtcod.darker_blue
+            mymap[x][y].back = color_water
     elif choice == 2:
         (x, y) = target_tile(mymap)
         if x is not None and y is not None:
@@ -149,8 +144,8 @@ def build_menu(mymap, header):
             thing = GamePiece(x, y, 206, 'a pipe', libtcod.brass * libtcod.dark_grey, blocks=False, always_visible=True)
             #check_for_junction(mymap, x, y)
 
-    mymap.objects.append(thing)
-    thing.send_to_back(mymap.objects)
+    mymap.add_object(thing)
+    send_to_back(thing, mymap.objects)
 
     libtcod.console_flush()
     render_all(mymap)    
@@ -210,7 +205,7 @@ def menu(header, options, width):
     #present the root console to the player and wait for a key-press
     libtcod.console_flush()
     sleep(0.4) # Need to debounce otherwise the menus are super irritating
-    key = libtcod.console_wait_for_keypress(True)
+    key = inputs.wait_for_keypress()
     if key.vk == libtcod.KEY_ENTER and key.lalt:
         #Alt+Enter: toggle fullscreen
         libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
@@ -259,63 +254,37 @@ def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
 def render_all(map_to_be_rendered):
     """Draw everything on to the screen. This is where all the consoles get blit'd."""
 
-    # Find the player in this map's list of objects:
-    player_index = 0
-    for obj in map_to_be_rendered.objects:
-        if obj.name == 'player':
-            break
-        else:
-            player_index += 1
-
-    player = map_to_be_rendered.objects[player_index]
-
-    fov_map = map_to_be_rendered.fov_map
-
-    map_to_be_rendered.initialize_fov()
-    libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
-
-    # go through all tiles and set character, foreground and background according to FOV
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            visible = libtcod.map_is_in_fov(fov_map, x, y)
-            wall = map_to_be_rendered[x][y].block_sight
-            if not visible:
-                if map_to_be_rendered[x][y].explored:
-                    # Draw things outside of vision which are remembered
-                    if wall:
-                        libtcod.console_put_char_ex(con, x, y, map_to_be_rendered[x][y].char, 
-                            libtcod.light_gray * map_to_be_rendered[x][y].fore, libtcod.light_gray * map_to_be_rendered[x][y].back)
-                    else:
-                        libtcod.console_put_char_ex(con, x, y, map_to_be_rendered[x][y].char, 
-                            libtcod.dark_grey * map_to_be_rendered[x][y].fore, libtcod.dark_grey * map_to_be_rendered[x][y].back)
-                        # TODO: Draw non-map things which are always visible, such as some objects.
-                        # Currently objects with always_visible=True do not get shaded darker when
-                        # outside of view. :-(
-
-            else:
-            # Currently visible things
-                libtcod.console_put_char_ex(con, x, y, map_to_be_rendered[x][y].char, map_to_be_rendered[x][y].fore, map_to_be_rendered[x][y].back)
-                map_to_be_rendered[x][y].explored = True
+    player = map_to_be_rendered.player
 
-    for object in map_to_be_rendered.objects:
-        if object != 'player':
-            object.draw(map_to_be_rendered, fov_map, con)
+    # The renderer would recompute the FOV itself, but doing it first lets it be timed on its own
+    started = timer.start()
+    map_to_be_rendered.compute_fov(player.x, player.y)
+    timer.stop('fov', started)
 
-    #if we didn't draw this separately, corpses and items sometimes get drawn over the player:        
-    player.draw(map_to_be_rendered, fov_map, con) 
+    # Redraws only the cells that changed since the last frame.
+    started = timer.start()
+    renderer.render(map_to_be_rendered, player)
     
     # blit the contents of "con" to the root console to display them
     libtcod.console_blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT, 0, 0, 0)
+    timer.stop('map', started)
     
     #prepare to render the GUI panel
+    started = timer.start()
     libtcod.console_set_default_background(panel, libtcod.black)
     libtcod.console_clear(panel)
 
-    y = 1
-    for (line, color) in game_msgs:
-        libtcod.console_set_default_foreground(panel, color)
-        libtcod.console_print_ex(panel, MSG_X, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
-        y += 1
+    if timer.enabled:
+        # The frame timings take the place of the messages while they are switched on
+        libtcod.console_set_default_foreground(panel, libtcod.light_green)
+        for y, line in enumerate(timer.overlay_lines(MSG_WIDTH, MSG_HEIGHT)):
+            libtcod.console_print_ex(panel, MSG_X, y + 1, libtcod.BKGND_NONE, libtcod.LEFT, line)
+    else:
+        y = 1
+        for (line, color) in game_msgs:
+            libtcod.console_set_default_foreground(panel, color)
+            libtcod.console_print_ex(panel, MSG_X, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+            y += 1
         
     #show the player's stats
     render_bar(1, 1, BAR_WIDTH, 'HP', player.fighter.hp, player.fighter.max_hp,
@@ -323,11 +292,15 @@ def render_all(map_to_be_rendered):
     #display location
     libtcod.console_print_ex(panel, 1, 3, libtcod.BKGND_NONE, libtcod.LEFT, 'Location: ' +
          str(map_to_be_rendered.location))
+    #show how saving is going, while it happens in the background
+    libtcod.console_set_default_foreground(panel, libtcod.light_yellow)
+    libtcod.console_print_ex(panel, 1, 5, libtcod.BKGND_NONE, libtcod.LEFT, saver.status_text())
     #display names of objects under the mouse
     libtcod.console_set_default_foreground(panel, libtcod.light_gray)
     libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, get_names_under_mouse(map_to_be_rendered))
     #blit the contents of "panel" to the root console
     libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
+    timer.stop('panel', started)
     
 #==============================================================================
 # Keyboard and Mouse management        
@@ -338,7 +311,7 @@ def player_move_or_attack(gamemap_instance, dx, dy):
     with a creature or thing in that space (which means no movement).
     """
     
-    player = find_player_in_list(gamemap_instance.objects)
+    player = gamemap_instance.player
 
 
     #the coordinates the player is moving to or attacking into
@@ -347,8 +320,8 @@ def player_move_or_attack(gamemap_instance, dx, dy):
     
     #Is there an attackable object there?
     target = None
-    for object in gamemap_instance.objects:
-        if object.fighter and object.x == x and object.y == y:
+    for object in gamemap_instance.objects_at(x, y):
+        if object.fighter:
             target = object
             break #prevents attacking multiple overlapping things
             
@@ -362,6 +335,10 @@ def player_move_or_attack(gamemap_instance, dx, dy):
         #fov_recompute = True
         #return fov_recompute
 
+    # Moving and attacking both set how long the player has to wait before doing anything else
+    gamemap_instance.scheduler.hold(player, gamemap_instance.turn)
+    gamemap_instance.record('wait', player, gamemap_instance.scheduler.waiting(player, gamemap_instance.turn))
+
 def get_names_under_mouse(mymap):
     global mouse
     
@@ -372,7 +349,7 @@ def get_names_under_mouse(mymap):
     fov_map = mymap.fov_map
 
     #create a list with the names of all objects under the mouse AND in FOV 
-    names = [obj.name for obj in mymap.objects if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+    names = [obj.name for obj in mymap.objects_at(x, y) if libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
     
     # If there is junk placed, explain what it is
     try:
@@ -398,31 +375,9 @@ def handle_keys(gamemap_instance):
     """Handles all keyboard input."""
     global key
 
-    are_there_stairs = True
-
-    # Find the player in this map's list of objects:
-    player_index = 0
-    for obj in gamemap_instance.objects:
-        if obj.name == 'player':
-            break
-        else:
-            player_index += 1
-
-    player = gamemap_instance.objects[player_index]
-
-    # Find the stairs in this map's list of objects:
-    stair_index = 0
-    for obj in gamemap_instance.objects:
-        if obj.name == 'stairs':
-            break
-        else:
-            stair_index += 1
-
-    if stair_index >= len(gamemap_instance.objects):
-        # No stairs on this map!
-        are_there_stairs = False
-    else:
-        stairs = gamemap_instance.objects[stair_index]
+    player = gamemap_instance.player
+    stairs = gamemap_instance.stairs
+    upstairs = gamemap_instance.roles.get('upstairs')
 
     # -----------------------------------------------------
     # Now check for all the key presses that we care about:
@@ -436,8 +391,7 @@ def handle_keys(gamemap_instance):
     #movement keys
     if game_state == 'playing':
 
-        if player.wait > 0: # don't take a turn yet if still waiting
-            player.wait -= 1
+        if not gamemap_instance.scheduler.is_ready(player, gamemap_instance.turn): # still waiting
             return
 
         if key.vk == libtcod.KEY_UP or key.vk == libtcod.KEY_KP8:
@@ -464,36 +418,31 @@ def handle_keys(gamemap_instance):
             key_char = chr(key.c)
             if key_char == 'g':
                 #pick up an item
-                for object in gamemap_instance.objects: #Is there an item in the player's tile?
-                    if object.x == player.x and object.y == player.y and object.item:
-                        object.item.pick_up(player)
+                for object in gamemap_instance.objects_at(player.x, player.y): #Is there an item in the player's tile?
+                    if object.item:
+                        object.item.pick_up(player, gamemap_instance)
                         break
             
             if key_char == 'i':
                 #show the inventory. If an item is selected, use it
                 chosen_item = inventory_menu('Press the key next to an item to use it, or any other key to cancel.\n', player)
                 if chosen_item is not None:
-                    chosen_item.use()
+                    chosen_item.use(player)
                     
             if key_char == 'd':
                 #show the inventory and drop the selected item
                 chosen_item = inventory_menu('Press the key next to an item to drop it, or any other key to cancel.\n', player)
                 if chosen_item is not None:
-                    chosen_item.drop(player)
+                    chosen_item.drop(player, gamemap_instance)
 
-            if key_char == '>' and are_there_stairs:
+            if key_char == '>' and stairs is not None:
                 #go to next map
                 if stairs.x == player.x and stairs.y == player.y:
-                    print 'Going down stairs. Map number is: ' + str(map_number)
-                    next_level(list_of_maps, map_number)
-                    map_number += 1
-                    return 'next_map'
+                    return 'next_map' # play_game takes the player down, see levels.go_down()
 
-            if key_char == '<' and are_there_stairs:
+            if key_char == '<' and upstairs is not None:
                 #go to previous map
-                if upstairs.x == player.x and stairs.y == player.y:
-                    print 'Going up stairs. Map number is: ' + str(map_number)
-                    map_number -= 1
+                if upstairs.x == player.x and upstairs.y == player.y:
                     return 'previous_map'
 
 
@@ -517,6 +466,7 @@ def handle_keys(gamemap_instance):
                     '>: Take down stairs\n' + 
                     'c: Show character information\n' + 
                     'q: Build something in a tile\n' +
+                    'f: Show frame timings\n' +
                     '\nDebugging:\n' +
                     'm: Reveal map\n' +
                     'p: Print player coordinates', 
@@ -524,9 +474,16 @@ def handle_keys(gamemap_instance):
 
             if key_char == 'm':
                 #Debugging - display whole map
-                for y in range(MAP_HEIGHT):
-                    for x in range(MAP_WIDTH):
-                        gamemap_instance.level[x][y].explored = True
+                gamemap_instance.level.fill(0, 0, MAP_WIDTH-1, MAP_HEIGHT-1, explored=True)
+
+            if key_char == 'f':
+                # Show how long each part of a frame takes, and log every frame to frame_timings.jsonl
+                if timer.enabled:
+                    timer.dump('frame_timings.jsonl')
+                    timer.disable()
+                else:
+                    timer.reset()
+                    timer.enable('frame_timings.jsonl')
 
             if key_char == 'p':
                 #Debugging - give us the player's coordinates
@@ -539,7 +496,6 @@ def handle_keys(gamemap_instance):
             if key_char == 'L':
                 # Land some astronauts!!
                 land_astronauts(gamemap_instance)
-                gamemap_instance.initialize_fov()
                 print 'Objects in this maps object list:'
                 for item in gamemap_instance.objects:
                     print item.name + ' (' + str(item) + ')'
@@ -550,8 +506,19 @@ def handle_keys(gamemap_instance):
 # Initialization & Main Loop
 #############################################
  
-def new_game():
+def new_game(seed=None):
+    """
+    Builds a new world from a seed, or from the clock if there isn't one. If the game was started with
+    --record, the input for this game gets recorded along with the seed.
+    """
     global game_msgs, game_state
+
+    if seed is None:
+        seed = int(time() * 1000) & 0x7fffffff
+    streams.reseed(seed)
+    print 'The world seed is ' + str(seed) + '.'
+    if options.record and inputs.mode != 'replay':
+        inputs.record(options.record, seed)
     
     map_number = 0
     list_of_maps = []
@@ -563,10 +530,11 @@ def new_game():
     # object list.
     list_of_maps.append( GameMap(map_number, newmap, 'surface') )
     for item in objects_for_this_map:
-                list_of_maps[map_number].objects.append(item)
+                list_of_maps[map_number].add_object(item)
 
     list_of_maps[map_number].initialize_fov()
-    libtcod.console_clear(con)
+    renderer.invalidate()
+    list_of_maps = LevelCache(list_of_maps) # levels the player isn't near get saved to the disk
 
 
     game_state = 'playing'
@@ -593,35 +561,51 @@ def play_game(list_of_maps, map_number):
 
     mouse = libtcod.Mouse()
     key = libtcod.Key()
+    list_of_maps.visit(map_number)
+    recovery.start(list_of_maps, map_number, game_state, game_msgs)
     while not libtcod.console_is_window_closed():
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE,key,mouse)
+        timer.end_frame()
+
+        started = timer.start()
+        inputs.check_for_event(key, mouse)
+        timer.stop('events', started)
+
         gamemap_instance = list_of_maps[map_number]
+        started = timer.start()
         render_all(gamemap_instance) #render the screen
+        timer.stop('render', started)
+
+        # This is also where libtcod sleeps to hold the frame rate down to LIMIT_FPS
+        started = timer.start()
         libtcod.console_flush()
+        timer.stop('flush', started)
 
         #check_level_up()
         
-        #erase all objects at their old locations, before they move
-        for object in gamemap_instance.objects:
-            object.clear(con)
-    
+        # There is no need to erase objects at their old locations, the renderer redraws any cell whose
+        # occupant changed.
+
         #handle keys and exit game if needed
+        started = timer.start()
         player_action = handle_keys(gamemap_instance)
+        timer.stop('keys', started)
         if player_action == 'exit':
-            save_game()
+            recovery.close()
+            save_game(list_of_maps, map_number)
             break
         
         if player_action == 'next_map':
-            map_number += 1
+            map_number = go_down(list_of_maps, map_number)
 
         if player_action == 'previous_map':
-            map_number -= 1
+            map_number = go_up(list_of_maps, map_number)
 
 # -----------------------------------------------------------------------------
         # Designating Buildings:
 
         # CHECK FOR MAP EDGE! :-0
 
+        started = timer.start()
         if mouse.lbutton and not currently_building:
             startx, starty = mouse.cx, mouse.cy # The position of the mouse in cells at the time the lbutton is PRESSED
             currently_building = True
@@ -662,11 +646,10 @@ def play_game(list_of_maps, map_number):
             for x in range(dx):
                 for y in range(dy):
                     try:
-                        gamemap_instance.level[startx + x][starty + y].designated = True
-                        gamemap_instance.level[startx + x][starty + y].designation_type = 'clearing'
-                        gamemap_instance.level[startx + x][starty + y].designation_char = '+'
+                        gamemap_instance.designate(startx + x, starty + y, 'clearing', '+')
                     except IndexError:
                         pass
+            inputs.designated(startx, starty, newx, newy)
 
 
             print 'Trying to blit the console of the construction_area (' + str(dx) +', ' + str(dy) + ') wide.'
@@ -685,18 +668,28 @@ def play_game(list_of_maps, map_number):
                         libtcod.console_print_ex(0, startx, starty + row, libtcod.BKGND_NONE, libtcod.LEFT, zone_character)
 
             libtcod.console_flush()
+        timer.stop('designate', started)
 # -----------------------------------------------------------------------------
 
         #blink_all_designations(gamemap_instance)
 
         #let NPCs take their turn
         if game_state == 'playing': #and player_action != 'didnt_take_turn': #let NPCs take their turn
-            for object in gamemap_instance.objects:
-                if object.ai:
-                    if object.wait > 0: # don't take a turn yet if still waiting
-                        object.wait -= 1
-                    else:
-                        object.ai.take_turn(gamemap_instance)
+            # Only the creatures which are done waiting get looked at
+            started = timer.start()
+            gamemap_instance.run_turn()
+            timer.stop('ai', started)
+
+            started = timer.start()
+            recovery.end_turn(list_of_maps, map_number, game_state, game_msgs)
+            timer.stop('journal', started)
+
+            if gamemap_instance.turn % AUTOSAVE_INTERVAL == 0:
+                # Only the snapshot happens here, the rest of the save is done in the background
+                started = timer.start()
+                saver.save(AUTOSAVE_FILE, list_of_maps, map_number, game_state, game_msgs)
+                timer.stop('autosave', started)
+    recovery.close()
                     
 
 
@@ -729,48 +722,57 @@ def main_menu():
         if choice == 0: #new game
             list_of_maps, map_number = new_game()
             play_game(list_of_maps, map_number)
+            list_of_maps.close()
         elif choice == 1: #load game
             try:
-                load_game()
-            except:
+                list_of_maps, map_number = load_game()
+            except (IOError, ValueError):
                 msgbox('\n No saved game to load.\n', 24)
                 continue
             play_game(list_of_maps, map_number)
+            list_of_maps.close()
         elif choice == 2: #quit
             break
 
-def save_game():
-    #opens a new empty shelve, possibly overwriting an old one, to write the game data
-    file = shelve.open('savegame', 'n')
-    file['map'] = map
-    file['objects'] = objects
-    file['player_index'] = objects.index(player) 
-    # This stuff with player_index prevents double-referencing the player object. We only save the index of
-    # the player object in the list of the objects, we never save the player object specifically. To restore it in 
-    # load_game(), we take the index and place object[player_index] into the player object.
-    file['inventory'] = inventory
-    file['game_msgs'] = game_msgs
-    file['game_state'] = game_state
-    file['stairs_index'] = objects.index(stairs)
-    file['map_number'] = map_number
-    file.close()
+def save_game(list_of_maps, map_number):
+    """
+    Starts saving every level, the messages and which level the player is on to SAVE_FILE. The saving
+    carries on in the background, and quitting waits for it to finish.
+    """
+    saver.wait() # an autosave might still be going
+    saver.save(SAVE_FILE, list_of_maps, map_number, game_state, game_msgs)
     
 def load_game():
-    global map, objects, player, inventory, game_msgs, game_state, stairs, map_number
-    
-    file = shelve.open('savegame', 'r')
-    map = file['map']
-    objects = file['objects']
-    player = objects[file['player_index']] #all we stored previously was the player index. The player itself was stored in objects[].
-    inventory = file['inventory']
-    game_msgs = file['game_msgs']
-    game_state = file['game_state']
-    stairs = objects[file['stairs_index']]
-    map_number = file['map_number']
-    file.close()
+    """
+    Loads whichever of SAVE_FILE and AUTOSAVE_FILE is newer, and returns the list of maps and which one the
+    player is on. If the game crashed after both of those were saved, it gets restored from the action
+    journal instead. Whichever one can't be loaded, the next newest gets tried.
+    """
+    global game_state
     
-    # Now that the core variables of the game have been restored, we can initialize the FOV map based on the loaded tiles:
-    initialize_fov()
+    saver.wait() # the game being saved might be the one to load
+    saves = [path for path in (SAVE_FILE, AUTOSAVE_FILE, recovery.journal_path) if os.path.exists(path)]
+    if not saves:
+        raise IOError('There is no saved game.')
+    saves.sort(key=os.path.getmtime, reverse=True)
+    for path in saves:
+        try:
+            if path == recovery.journal_path:
+                list_of_maps, map_number, game_state, messages, random_state = journal.restore(RECOVERY_FILE)
+            else:
+                list_of_maps, map_number, game_state, messages, random_state = levels.load(path)
+            break
+        except (IOError, ValueError) as error:
+            # For example a crash right after a new level was made, before the journal had a snapshot of it
+            print 'Could not load ' + path + ': ' + str(error)
+    else:
+        raise ValueError('None of the saved games could be loaded.')
+    game_msgs[:] = messages
+    streams.restore(random_state) # the game carries on with the random numbers it would have had
+    renderer.invalidate()
+    if not isinstance(list_of_maps, LevelCache):
+        list_of_maps = LevelCache(list_of_maps, map_number) # the journal's snapshot comes back whole
+    return list_of_maps, map_number
     
 
 #==============================================================================
@@ -784,9 +786,23 @@ libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'Many Martians!', False)
 con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
 # GUI panel console "panel"
 panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+# draws the map onto "con", only touching the cells that changed
+renderer = MapRenderer(con)
+# writes down everything that happens, so that a crash loses next to nothing
+recovery = Journal(RECOVERY_FILE)
 
 libtcod.sys_set_fps(LIMIT_FPS)
 
-main_menu()
+parser = argparse.ArgumentParser(description='Many Martians!')
+parser.add_argument('--record', metavar='FILE', help='record the world seed and all input of new games to FILE')
+parser.add_argument('--replay', metavar='FILE', help='play back a game recorded with --record, then carry on')
+options = parser.parse_args()
+
+if options.replay:
+    list_of_maps, map_number = new_game(inputs.replay(options.replay))
+    play_game(list_of_maps, map_number)
+    list_of_maps.close()
+else:
+    main_menu()
 
 # Alternatively, just remake Scarab of Ra. Have the font start out really big on the early, smaller levels.
\ No newline at end of file
@@ -0,0 +1,76 @@
+#=============================================================
+# Palettes for the tile grid. Tiles don't hold their own characters and
+# Colors, they hold a small index into one of these tables instead.
+# This keeps every level down to a handful of byte arrays.
+#
+# Every color also has its shaded variants worked out once, when it is
+# added to the palette, so shading a tile while drawing is just a lookup
+# in SHADED[shade][color index].
+#=============================================================
+
+import libtcodpy as libtcod
+from constants import *
+
+
+# A tile plane stores indices in a bytearray, so each palette can hold at most 256 entries.
+PALETTE_SIZE = 256
+
+COLORS = []
+_color_indices = {}
+
+# The shades a tile can be drawn in. Each is a multiplier Color, or None for the color as it is.
+LIT = 0
+REMEMBERED_WALL = 1
+REMEMBERED_FLOOR = 2
+SHADE_MULTIPLIERS = [None, color_remembered_wall, color_remembered_floor]
+
+# SHADED[shade] is a table of the same length as COLORS, holding every palette color in that shade.
+SHADED = [COLORS, [], []]
+
+CHARS = []
+_char_indices = {}
+
+
+def color_index(color):
+    """Returns the palette index for a libtcod Color, adding it to the palette if it is new."""
+    key = (color.r, color.g, color.b)
+    try:
+        return _color_indices[key]
+    except KeyError:
+        if len(COLORS) >= PALETTE_SIZE:
+            raise ValueError('Cannot have more than ' + str(PALETTE_SIZE) + ' colors in the tile palette.')
+        COLORS.append(libtcod.Color(color.r, color.g, color.b))
+        for shade in range(1, len(SHADED)):
+            SHADED[shade].append(SHADE_MULTIPLIERS[shade] * COLORS[-1])
+        _color_indices[key] = len(COLORS) - 1
+        return _color_indices[key]
+
+def add_shade(multiplier):
+    """
+    Adds a new shade, such as dusk or a dust storm, and works it out for every color already in the palette.
+    Returns the number of the new shade, for use as an index into SHADED.
+    """
+    SHADE_MULTIPLIERS.append(multiplier)
+    SHADED.append([multiplier * color for color in COLORS])
+    return len(SHADED) - 1
+
+def char_index(char):
+    """
+    Returns the palette index for a tile character. Characters can be strings like '.' or Code Page 437
+    numbers like GRAVEL, and both kinds are kept as they were given so comparisons still work.
+    """
+    try:
+        return _char_indices[char]
+    except KeyError:
+        if len(CHARS) >= PALETTE_SIZE:
+            raise ValueError('Cannot have more than ' + str(PALETTE_SIZE) + ' characters in the tile palette.')
+        CHARS.append(char)
+        _char_indices[char] = len(CHARS) - 1
+        return _char_indices[char]
+
+
+# Put every color that the map generators use for tiles into the palette up front, so all their shades
+# are ready before the first frame is drawn.
+for color in (libtcod.white, libtcod.black, color_wall, color_ground, color_building, color_lander, 
+              color_lander_floor, color_door, color_door_back, color_stone, color_gravel, color_water):
+    color_index(color)
@@ -0,0 +1,682 @@
+#=============================================================
+# Pathfinding helpers which are shared between many AIs, rather than
+# each AI working out its own path from scratch.
+#=============================================================
+
+import heapq
+
+import libtcodpy as libtcod
+
+
+# The eight steps a creature can take, orthogonal ones first so they win ties
+NEIGHBOURS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+
+class FlowField(object):
+    """
+    A Dijkstra map of the distance from every tile to one target tile, such as the player. It only gets
+    recomputed when the target moves or the terrain changes, and then any number of creatures heading for
+    the target just take the downhill step from wherever they are.
+    """
+    def __init__(self, gamemap_instance, diagonal_cost=1.41):
+        self.gamemap = gamemap_instance
+        self.dijkstra = libtcod.dijkstra_new(gamemap_instance.nav_map, diagonal_cost)
+        self.target = None
+        self.nav_version = None
+
+    def update(self, target_x, target_y):
+        """Recomputes the distances if the target moved or the nav map changed since last time."""
+        if (target_x, target_y) == self.target and self.gamemap.nav_version == self.nav_version:
+            return False
+
+        libtcod.dijkstra_compute(self.dijkstra, target_x, target_y)
+        self.target = (target_x, target_y)
+        self.nav_version = self.gamemap.nav_version
+        return True
+
+    def distance(self, x, y):
+        """The path distance from (x, y) to the target, or None if the target can't be reached from there."""
+        distance = libtcod.dijkstra_get_distance(self.dijkstra, x, y)
+        if distance < 0:
+            return None
+        return distance
+
+    def step_from(self, x, y):
+        """
+        Returns the (dx, dy) step from (x, y) which gets closest to the target without walking into something
+        that blocks, or None if there is no step which gets any closer.
+        """
+        best_step = None
+        best_distance = self.distance(x, y)
+        if best_distance is None:
+            return None
+
+        for (dx, dy) in NEIGHBOURS:
+            distance = self.distance(x + dx, y + dy)
+            if distance is not None and distance < best_distance and not self.gamemap.is_blocked(x + dx, y + dy):
+                best_step = (dx, dy)
+                best_distance = distance
+        return best_step
+
+
+INFINITY = float('inf')
+
+
+class RepairablePath(object):
+    """
+    A path from a creature to a goal tile which fixes itself when the terrain changes, using D* Lite.
+    The search runs backwards from the goal, so when a handful of tiles get blocked or cleared only the
+    part of the search those tiles affect gets redone, instead of starting over with a fresh A*.
+
+    The goal tile itself counts as walkable even if it is blocked, since builders usually head for a
+    rock they're going to clear. Obstacles are tiles which are only blocked for now, like one with another
+    creature standing on it, and can be changed every turn with set_obstacles().
+    """
+    def __init__(self, grid, start_x, start_y, goal_x, goal_y, diagonal_cost=1.41):
+        self.grid = grid
+        # Costs are kept in hundredths of a step so they add up exactly. With floats, paths which ought to
+        # cost the same can come out a hair apart, and D* Lite stops searching too early when that happens.
+        self.straight_cost = 100
+        self.diagonal_cost = int(round(diagonal_cost * 100))
+        self.start = grid.index(start_x, start_y)
+        self.goal = grid.index(goal_x, goal_y)
+        self.last = self.start
+        self.km = 0     # how much the heuristic has drifted since the search began, as the start moves
+        self.g = {}
+        self.rhs = {self.goal: 0}
+        self.open = {}  # index -> its current key. Old entries in the heap are skipped when popped.
+        self.heap = []
+        self.obstacles = set()
+        self.changed = set()
+
+        self.push(self.goal)
+        grid.add_listener(self.tile_changed)
+
+    def close(self):
+        """Stops listening for tile changes. Call this when the path isn't needed any more."""
+        self.grid.remove_listener(self.tile_changed)
+
+    #------------------------------------------------------------
+    # Walking the path
+
+    def move_to(self, x, y):
+        """Tells the path that the creature has moved to (x, y)."""
+        index = self.grid.index(x, y)
+        if index != self.start:
+            self.km += self.heuristic(self.last, index)
+            self.last = index
+            self.start = index
+
+    def set_obstacles(self, tiles):
+        """Replaces the tiles which are blocked for now with a new list of (x, y) tiles."""
+        obstacles = set(self.grid.index(x, y) for (x, y) in tiles)
+        self.changed.update(obstacles ^ self.obstacles)
+        self.obstacles = obstacles
+
+    def next_step(self):
+        """
+        Returns the (x, y) of the next tile along the path, repairing it first if anything has changed.
+        Returns None if the goal can't be reached, or if the creature is already there.
+        """
+        self.repair()
+        if self.start == self.goal or self.g.get(self.start, INFINITY) == INFINITY:
+            return None
+
+        best = None
+        best_cost = INFINITY
+        for neighbour in self.grid.neighbours(self.start):
+            cost = self.cost(self.start, neighbour) + self.g.get(neighbour, INFINITY)
+            if cost < best_cost:
+                best = neighbour
+                best_cost = cost
+        if best is None:
+            return None
+        return self.grid.coords(best)
+
+    def cost_to_goal(self, x, y):
+        """
+        A guess at the path distance from (x, y) to the goal, which never overestimates. It is exact for the
+        tiles the search has already reached, which includes everything along the path.
+        """
+        index = self.grid.index(x, y)
+        known = min(self.g.get(index, INFINITY), self.rhs.get(index, INFINITY))
+        if known == INFINITY:
+            known = self.heuristic(index, self.goal)
+        return known / 100.0
+
+    def distance(self):
+        """The path distance left to the goal, or None if it can't be reached."""
+        self.repair()
+        distance = self.g.get(self.start, INFINITY)
+        if distance == INFINITY:
+            return None
+        return distance / 100.0
+
+    #------------------------------------------------------------
+    # D* Lite
+
+    def tile_changed(self, index, name):
+        if name == 'blocked':
+            self.changed.add(index)
+
+    def repair(self):
+        """Updates the search around every tile which changed since last time, and finishes the search."""
+        for index in self.changed:
+            # Every step into or out of this tile changed cost
+            self.update(index)
+            for neighbour in self.grid.neighbours(index):
+                self.update(neighbour)
+        self.changed = set()
+        self.compute()
+
+    def walkable(self, index):
+        return index == self.goal or (not self.grid.blocked[index] and index not in self.obstacles)
+
+    def cost(self, a, b):
+        if not (self.walkable(a) and self.walkable(b)):
+            return INFINITY
+        # Plane positions next to each other in the same column or row are height or 1 apart
+        if abs(a - b) == 1 or abs(a - b) == self.grid.height:
+            return self.straight_cost
+        return self.diagonal_cost
+
+    def heuristic(self, a, b):
+        ax, ay = self.grid.coords(a)
+        bx, by = self.grid.coords(b)
+        dx = abs(ax - bx)
+        dy = abs(ay - by)
+        return self.straight_cost * max(dx, dy) + (self.diagonal_cost - self.straight_cost) * min(dx, dy)
+
+    def key(self, index):
+        best = min(self.g.get(index, INFINITY), self.rhs.get(index, INFINITY))
+        return (best + self.heuristic(self.start, index) + self.km, best)
+
+    def push(self, index):
+        key = self.key(index)
+        self.open[index] = key
+        heapq.heappush(self.heap, (key, index))
+
+    def top(self):
+        """Returns the smallest (key, index) still in the open list, dropping old heap entries on the way."""
+        while self.heap:
+            key, index = self.heap[0]
+            if self.open.get(index) == key:
+                return key, index
+            heapq.heappop(self.heap)
+        return (INFINITY, INFINITY), None
+
+    def update(self, index):
+        if index != self.goal:
+            self.rhs[index] = min([self.cost(index, neighbour) + self.g.get(neighbour, INFINITY)
+                                   for neighbour in self.grid.neighbours(index)] or [INFINITY])
+        self.open.pop(index, None)
+        if self.g.get(index, INFINITY) != self.rhs.get(index, INFINITY):
+            self.push(index)
+
+    def compute(self):
+        while True:
+            key, index = self.top()
+            start_key = self.key(self.start)
+            if index is None or (key >= start_key and 
+                                 self.rhs.get(self.start, INFINITY) == self.g.get(self.start, INFINITY)):
+                return
+
+            new_key = self.key(index)
+            if key < new_key:
+                # The start moved since this was queued, so it goes back in with an up to date key
+                self.push(index)
+            elif self.g.get(index, INFINITY) > self.rhs[index]:
+                self.g[index] = self.rhs[index]
+                del self.open[index]
+                for neighbour in self.grid.neighbours(index):
+                    self.update(neighbour)
+            else:
+                self.g[index] = INFINITY
+                self.update(index)
+                for neighbour in self.grid.neighbours(index):
+                    self.update(neighbour)
+
+
+class ReservationTable(object):
+    """
+    Which creature is going to be standing on which tile on which turn, so that creatures can plan their next
+    few steps around each other instead of walking into each other and losing their turn (cooperative A*).
+
+    Every time a creature acts it plans a window of its next few moves through space and time, steering
+    clear of everything already reserved, and then reserves the tiles it will be standing on. Creatures
+    which plan first get first pick, and everyone replans each time they act.
+    """
+    def __init__(self, gamemap_instance, window=8):
+        self.gamemap = gamemap_instance
+        self.window = window
+        self.reserved = {}  # (x, y, turn) -> the creature which will be standing there
+        self.claims = {}    # creature -> list of its (x, y, turn) reservations
+
+    def holder(self, x, y, turn):
+        """Returns the creature which reserved (x, y) on a turn, or None."""
+        return self.reserved.get((x, y, turn))
+
+    def is_free(self, creature, x, y, start, end):
+        """Returns True if nobody but the creature has reserved (x, y) for any turn from start up to end."""
+        for turn in xrange(start, end):
+            holder = self.reserved.get((x, y, turn))
+            if holder is not None and holder is not creature:
+                return False
+        return True
+
+    def reserve(self, creature, x, y, start, end):
+        """Reserves (x, y) for the creature for every turn from start up to end."""
+        claims = self.claims.setdefault(creature, [])
+        for turn in xrange(start, end):
+            if (x, y, turn) not in self.reserved:
+                self.reserved[(x, y, turn)] = creature
+                claims.append((x, y, turn))
+
+    def release(self, creature):
+        """Forgets everything the creature reserved, because it is replanning, has stopped or has died."""
+        for key in self.claims.pop(creature, ()):
+            if self.reserved.get(key) is creature:
+                del self.reserved[key]
+
+    def is_wanted(self, creature):
+        """Returns True if anyone else is planning to walk through the tile the creature is standing on."""
+        now = self.gamemap.turn
+        return not self.is_free(creature, creature.x, creature.y, now, now + self.window * (creature.speed + 1))
+
+    def step_aside(self, creature):
+        """
+        Returns the (x, y) of a tile next to the creature which is clear, and which nobody is planning to walk
+        through for a while, or None if there isn't one.
+        """
+        grid = self.gamemap.level
+        now = self.gamemap.turn
+        for (dx, dy) in NEIGHBOURS:
+            x, y = creature.x + dx, creature.y + dy
+            if 0 <= x < grid.width and 0 <= y < grid.height and not self.gamemap.is_blocked(x, y) and \
+                    self.is_free(creature, x, y, now, now + self.window * (creature.speed + 1)):
+                return (x, y)
+        return None
+
+    def plan(self, creature, estimate, done=None):
+        """
+        Plans the creature's next window of moves, and reserves them. Returns the list of (x, y) tiles it
+        will step to, one per move, where staying put counts as a move.
+
+        estimate(x, y) guesses the path distance left from (x, y), and done(x, y) says whether the creature
+        would be finished there (it defaults to being where estimate gives 0). The creature moves once every
+        speed + 1 turns, since it has to wait speed turns after every move.
+        """
+        if done is None:
+            done = lambda x, y: estimate(x, y) == 0
+
+        grid = self.gamemap.level
+        now = self.gamemap.turn
+        period = creature.speed + 1
+        self.release(creature)
+
+        start = (creature.x, creature.y, 0)
+        came_from = {start: None}
+        cost_so_far = {start: 0}
+        heap = [(estimate(creature.x, creature.y), 0, 0, start)]
+        counter = 1
+        best = start
+        while heap:
+            f, negative_step, order, node = heapq.heappop(heap)
+            x, y, step = node
+            if step == self.window:
+                best = node
+                break
+
+            arrive = now + (step + 1) * period
+            finished = done(x, y)
+            for (dx, dy) in NEIGHBOURS + [(0, 0)]:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < grid.width and 0 <= ny < grid.height):
+                    continue
+                if (dx or dy) and grid.blocked[grid.index(nx, ny)]:
+                    continue
+                # Nobody else knows where creatures outside of the table will be, so the first step also
+                # has to be clear right now
+                if step == 0 and (dx or dy) and self.gamemap.is_blocked(nx, ny):
+                    continue
+                if not self.is_free(creature, nx, ny, arrive, arrive + period):
+                    continue
+                # Two creatures can't swap places through each other
+                other = self.holder(nx, ny, arrive - 1)
+                if (dx or dy) and other is not None and other is not creature and \
+                        self.holder(x, y, arrive) is other:
+                    continue
+
+                if finished and not (dx or dy):
+                    step_cost = 0   # waiting once the job is reached costs nothing
+                elif dx and dy:
+                    step_cost = 1.41
+                else:
+                    step_cost = 1
+
+                next_node = (nx, ny, step + 1)
+                new_cost = cost_so_far[node] + step_cost
+                if next_node not in cost_so_far or new_cost < cost_so_far[next_node]:
+                    cost_so_far[next_node] = new_cost
+                    came_from[next_node] = node
+                    remaining = 0 if done(nx, ny) else estimate(nx, ny)
+                    heapq.heappush(heap, (new_cost + remaining, -(step + 1), counter, next_node))
+                    counter += 1
+                    
+        if best == start:
+            # Boxed in even for waiting, so stand still and don't claim anything
+            return [(creature.x, creature.y)]
+
+        steps = []
+        node = best
+        while node != start:
+            steps.append(node)
+            node = came_from[node]
+        steps.reverse()
+
+        self.reserve(creature, creature.x, creature.y, now, now + period)
+        for (x, y, step) in steps:
+            arrive = now + step * period
+            self.reserve(creature, x, y, arrive, arrive + period)
+        return [(x, y) for (x, y, step) in steps]
+
+
+class ClusterMap(object):
+    """
+    A coarse map of the level for long paths (HPA*). The level is cut into square clusters, and wherever
+    two neighbouring clusters have open ground on both sides of their shared edge there is an entrance.
+    The distances between the entrances of each cluster are worked out ahead of time, so a long path is
+    a search over a few dozen entrances instead of thousands of tiles.
+
+    When a tile gets blocked or cleared only the cluster it is in gets worked out again, and not until the
+    next time somebody asks for a path.
+    """
+    def __init__(self, grid, cluster_size=10):
+        self.grid = grid
+        self.cluster_size = cluster_size
+        self.columns = (grid.width + cluster_size - 1) // cluster_size
+        self.rows = (grid.height + cluster_size - 1) // cluster_size
+
+        self.transitions = {}   # (cluster, cluster) -> list of (tile, tile) pairs facing each other across them
+        self.crossings = {}     # entrance tile -> set of the entrance tiles facing it in other clusters
+        self.entrances = {}     # cluster -> set of its entrance tiles
+        self.edges = {}         # entrance tile -> dict of entrance tile in the same cluster -> path cost
+
+        self.dirty = set((cx, cy) for cx in range(self.columns) for cy in range(self.rows))
+        grid.add_listener(self.tile_changed)
+
+    #------------------------------------------------------------
+    # Queries
+
+    def cluster_of(self, index):
+        x, y = self.grid.coords(index)
+        return (x // self.cluster_size, y // self.cluster_size)
+
+    def are_near(self, x1, y1, x2, y2):
+        """Returns True if the two tiles are in the same cluster or in clusters next to each other."""
+        return abs(x1 // self.cluster_size - x2 // self.cluster_size) <= 1 and \
+               abs(y1 // self.cluster_size - y2 // self.cluster_size) <= 1
+
+    def route(self, start_x, start_y, goal_x, goal_y):
+        """
+        Finds a route over the entrances between clusters. Returns a list of (x, y, cost left) waypoints 
+        ending with the goal, where cost left is the path distance from that waypoint on to the goal in 
+        hundredths of a step. Returns None if the goal can't be reached. 
+        The goal counts as walkable even if it is blocked, just like in a RepairablePath.
+        """
+        self.refresh()
+        start = self.grid.index(start_x, start_y)
+        goal = self.grid.index(goal_x, goal_y)
+
+        from_start = self.link(start)
+        to_goal = self.link(goal)
+
+        came_from = {start: None}
+        cost_so_far = {start: 0}
+        heap = [(self.heuristic(start, goal), 0, start)]
+        counter = 1
+        while heap:
+            f, order, node = heapq.heappop(heap)
+            if node == goal:
+                break
+            if f > cost_so_far[node] + self.heuristic(node, goal):
+                continue    # an old heap entry for a node which has since been reached more cheaply
+
+            links = self.edges.get(node, {}).items()
+            links += [(other, 100) for other in self.crossings.get(node, ())]
+            if node == start:
+                links += from_start.items()
+            if node in to_goal:
+                links.append((goal, to_goal[node]))
+
+            for (other, cost) in links:
+                new_cost = cost_so_far[node] + cost
+                if other not in cost_so_far or new_cost < cost_so_far[other]:
+                    cost_so_far[other] = new_cost
+                    came_from[other] = node
+                    heapq.heappush(heap, (new_cost + self.heuristic(other, goal), counter, other))
+                    counter += 1
+
+        if goal not in cost_so_far:
+            return None
+
+        waypoints = []
+        node = goal
+        while node != start:
+            x, y = self.grid.coords(node)
+            waypoints.append((x, y, cost_so_far[goal] - cost_so_far[node]))
+            node = came_from[node]
+        waypoints.reverse()
+        return waypoints
+
+    def link(self, index):
+        """Returns a dict of the entrances of the tile's cluster which it can get to -> their path cost."""
+        distances = self.local_distances(index, self.cluster_of(index))
+        return dict((entrance, distances[entrance]) for entrance in self.entrances.get(self.cluster_of(index), ())
+                    if entrance in distances and entrance != index)
+
+    def heuristic(self, a, b):
+        ax, ay = self.grid.coords(a)
+        bx, by = self.grid.coords(b)
+        dx = abs(ax - bx)
+        dy = abs(ay - by)
+        return 100 * max(dx, dy) + 41 * min(dx, dy)
+
+    #------------------------------------------------------------
+    # Working out the entrances
+
+    def tile_changed(self, index, name):
+        if name == 'blocked':
+            self.dirty.add(self.cluster_of(index))
+
+    def bounds(self, cluster):
+        """Returns the (x1, y1, x2, y2) corners of a cluster, inclusive."""
+        x1 = cluster[0] * self.cluster_size
+        y1 = cluster[1] * self.cluster_size
+        return (x1, y1, min(x1 + self.cluster_size, self.grid.width) - 1, 
+                min(y1 + self.cluster_size, self.grid.height) - 1)
+
+    def borders_of(self, cluster):
+        """Returns the (cluster, cluster) pairs for each edge the cluster shares with another one."""
+        cx, cy = cluster
+        borders = []
+        if cx > 0:
+            borders.append(((cx - 1, cy), cluster))
+        if cx < self.columns - 1:
+            borders.append((cluster, (cx + 1, cy)))
+        if cy > 0:
+            borders.append(((cx, cy - 1), cluster))
+        if cy < self.rows - 1:
+            borders.append((cluster, (cx, cy + 1)))
+        return borders
+
+    def refresh(self):
+        """Works out the entrances and distances again for every cluster which has changed."""
+        if not self.dirty:
+            return
+        redo = set()
+        for cluster in self.dirty:
+            for border in self.borders_of(cluster):
+                redo.add(border)
+        affected = set()
+        for border in redo:
+            self.find_transitions(border)
+            affected.update(border)
+        for cluster in affected:
+            self.connect(cluster)
+        self.dirty = set()
+
+    def find_transitions(self, border):
+        """
+        Finds the stretches of open ground on both sides of the edge between two clusters. Short stretches 
+        get one entrance in the middle, and long ones get an entrance at each end.
+        """
+        for (a, b) in self.transitions.pop(border, ()):
+            self.crossings[a].discard(b)
+            self.crossings[b].discard(a)
+
+        first, second = border
+        x1, y1, x2, y2 = self.bounds(first)
+        if second[0] != first[0]:
+            # side by side, so the edge is the column x2 on one side and x2 + 1 on the other
+            pairs = [(self.grid.index(x2, y), self.grid.index(x2 + 1, y)) for y in range(y1, y2 + 1)]
+        else:
+            pairs = [(self.grid.index(x, y2), self.grid.index(x, y2 + 1)) for x in range(x1, x2 + 1)]
+
+        runs = [[]]
+        for (a, b) in pairs:
+            if not self.grid.blocked[a] and not self.grid.blocked[b]:
+                runs[-1].append((a, b))
+            elif runs[-1]:
+                runs.append([])
+
+        transitions = []
+        for run in runs:
+            if len(run) >= 6:
+                transitions.append(run[0])
+                transitions.append(run[-1])
+            elif run:
+                transitions.append(run[len(run) // 2])
+
+        self.transitions[border] = transitions
+        for (a, b) in transitions:
+            self.crossings.setdefault(a, set()).add(b)
+            self.crossings.setdefault(b, set()).add(a)
+
+    def connect(self, cluster):
+        """Works out the path costs between every pair of entrances of a cluster."""
+        entrances = set()
+        for border in self.borders_of(cluster):
+            for pair in self.transitions.get(border, ()):
+                entrances.add(pair[0] if border[0] == cluster else pair[1])
+
+        for entrance in self.entrances.get(cluster, set()) - entrances:
+            del self.edges[entrance]
+        self.entrances[cluster] = entrances
+
+        for entrance in entrances:
+            distances = self.local_distances(entrance, cluster)
+            self.edges[entrance] = dict((other, distances[other]) for other in entrances 
+                                        if other != entrance and other in distances)
+
+    def local_distances(self, source, cluster):
+        """
+        Returns a dict of tile -> path cost from source, for every tile in the cluster it can get to without
+        leaving the cluster. The source itself may be blocked.
+        """
+        x1, y1, x2, y2 = self.bounds(cluster)
+        distances = {source: 0}
+        heap = [(0, source)]
+        while heap:
+            cost, index = heapq.heappop(heap)
+            if cost > distances[index]:
+                continue
+            x, y = self.grid.coords(index)
+            for (dx, dy) in NEIGHBOURS:
+                nx, ny = x + dx, y + dy
+                if not (x1 <= nx <= x2 and y1 <= ny <= y2):
+                    continue
+                neighbour = self.grid.index(nx, ny)
+                if self.grid.blocked[neighbour]:
+                    continue
+                new_cost = cost + (141 if dx and dy else 100)
+                if new_cost < distances.get(neighbour, INFINITY):
+                    distances[neighbour] = new_cost
+                    heapq.heappush(heap, (new_cost, neighbour))
+        return distances
+
+
+class LongPath(object):
+    """
+    A path to somewhere far away. It follows a ClusterMap route, and walks from each waypoint to the next
+    with a RepairablePath, so the detailed search only ever covers a cluster or two at a time.
+    It can be used just like a RepairablePath.
+    """
+    def __init__(self, grid, start_x, start_y, goal_x, goal_y):
+        self.grid = grid
+        self.goal = (goal_x, goal_y)
+        self.position = (start_x, start_y)
+        self.obstacles = []
+        self.leg = None
+        self.plan_route()
+
+    def plan_route(self):
+        """Finds a route from where the creature is now, and starts walking towards its first waypoint."""
+        self.waypoints = self.grid.clusters().route(self.position[0], self.position[1], self.goal[0], self.goal[1])
+        if not self.waypoints:
+            # Nothing on the coarse map, which can miss ways through that only go diagonally between
+            # clusters. Search the whole way instead.
+            self.waypoints = [(self.goal[0], self.goal[1], 0)]
+        self.start_leg()
+
+    def start_leg(self):
+        if self.leg is not None:
+            self.leg.close()
+        x, y, cost_left = self.waypoints[0]
+        self.leg = RepairablePath(self.grid, self.position[0], self.position[1], x, y)
+        self.leg.set_obstacles(self.obstacles)
+
+    def close(self):
+        if self.leg is not None:
+            self.leg.close()
+            self.leg = None
+
+    def move_to(self, x, y):
+        self.position = (x, y)
+        self.leg.move_to(x, y)
+        if len(self.waypoints) > 1 and (x, y) == self.waypoints[0][:2]:
+            self.waypoints.pop(0)
+            self.start_leg()
+
+    def set_obstacles(self, tiles):
+        self.obstacles = tiles
+        self.leg.set_obstacles(tiles)
+
+    def check_leg(self):
+        """If the way to the next waypoint got cut off, finds a new route from here."""
+        if self.leg.distance() is None and len(self.waypoints) > 1:
+            self.plan_route()
+
+    def next_step(self):
+        self.check_leg()
+        return self.leg.next_step()
+
+    def cost_to_goal(self, x, y):
+        return self.leg.cost_to_goal(x, y) + self.waypoints[0][2] / 100.0
+
+    def distance(self):
+        self.check_leg()
+        distance = self.leg.distance()
+        if distance is None:
+            return None
+        return distance + self.waypoints[0][2] / 100.0
+
+
+def make_path(grid, start_x, start_y, goal_x, goal_y):
+    """
+    Returns a path from (start_x, start_y) to (goal_x, goal_y), which is a RepairablePath for short trips
+    and a LongPath which goes by way of the grid's ClusterMap for long ones.
+    """
+    if grid.clusters().are_near(start_x, start_y, goal_x, goal_y):
+        return RepairablePath(grid, start_x, start_y, goal_x, goal_y)
+    return LongPath(grid, start_x, start_y, goal_x, goal_y)
@@ -0,0 +1,158 @@
+#=============================================================
+# Frame timing. When the game drops below LIMIT_FPS, this says whether
+# it was the input, the drawing, the FOV or the AIs. The main loop and
+# GameMap.run_turn time their phases with the one FrameTimer in here,
+# which keeps the last few hundred timings of each phase, can draw their
+# percentiles in the GUI panel, and can write every frame to a JSON lines
+# file. While it is switched off, timing something is a single check.
+#=============================================================
+
+import json
+from time import time
+from collections import deque
+
+
+class FrameTimer(object):
+    """
+    Times the phases of each frame. Use it like this:
+
+        started = timer.start()
+        do_the_thing()
+        timer.stop('thing', started)
+
+    and call end_frame() once per pass through the main loop. start() returns None while the timer is off,
+    and stop() ignores that, so leaving the calls in costs next to nothing.
+
+    Each phase keeps its last window timings for working out percentiles. Phases which happen more than
+    once a frame, like the AIs' turns, are timed one call at a time, and the frame log has their total
+    for the frame along with how many calls there were.
+    """
+    def __init__(self, window=300):
+        self.enabled = False
+        self.window = window
+        self.samples = {}   # phase name -> deque of the latest timings, in seconds
+        self.frame = {}     # phase name -> [total seconds, calls] so far this frame
+        self.frame_number = 0
+        self.frame_started = None
+        self.log = None
+
+    def enable(self, log_path=None):
+        """Starts timing. If a log path is given, every frame is appended to it as a line of JSON."""
+        self.enabled = True
+        self.frame = {}
+        self.frame_started = None
+        if log_path is not None:
+            self.close_log()
+            self.log = open(log_path, 'a')
+
+    def disable(self):
+        """Stops timing and closes the log. The timings collected so far are kept."""
+        self.enabled = False
+        self.frame_started = None
+        self.close_log()
+
+    def close_log(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def reset(self):
+        """Forgets every timing collected so far."""
+        self.samples = {}
+        self.frame = {}
+
+    #------------------------------------------------------------
+    # Timing things
+
+    def start(self):
+        """Returns the time to pass to stop(), or None when the timer is off."""
+        if self.enabled:
+            return time()
+        return None
+
+    def stop(self, name, started):
+        """Records how long it has been since start() under the name of a phase."""
+        if started is None:
+            return
+        self.record(name, time() - started)
+
+    def call(self, name, function, *args):
+        """Calls a function, timing it under the name of a phase, and returns what it returned."""
+        if not self.enabled:
+            return function(*args)
+        started = time()
+        result = function(*args)
+        self.record(name, time() - started)
+        return result
+
+    def record(self, name, seconds):
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.window)
+        self.samples[name].append(seconds)
+        total = self.frame.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+    def end_frame(self):
+        """
+        Finishes a frame: records how long the whole frame took, and writes it to the log. The first call
+        after enable() only marks where the first frame starts.
+        """
+        if not self.enabled:
+            return
+        now = time()
+        if self.frame_started is None:
+            self.frame_started = now
+            self.frame = {}
+            return
+        self.record('frame', now - self.frame_started)
+        self.frame_started = now
+
+        if self.log is not None:
+            phases = dict((name, {'ms': round(total[0] * 1000, 3), 'calls': total[1]})
+                          for name, total in self.frame.items())
+            self.log.write(json.dumps({'frame': self.frame_number, 'time': round(now, 3), 'phases': phases},
+                                      sort_keys=True) + '\n')
+        self.frame = {}
+        self.frame_number += 1
+
+    #------------------------------------------------------------
+    # Reporting
+
+    def percentile(self, name, percent):
+        """Returns the given percentile of the recent timings of a phase, in seconds, or None if there are none."""
+        samples = self.samples.get(name)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * percent / 100.0), len(ordered) - 1)]
+
+    def summary(self, percents=(50, 95, 99)):
+        """Returns a dict of phase name -> {percentile: seconds}, for every phase timed so far."""
+        return dict((name, dict((percent, self.percentile(name, percent)) for percent in percents))
+                    for name in self.samples)
+
+    def overlay_lines(self, width=20, height=None):
+        """
+        Returns the recent median and 95th percentile of each phase in milliseconds, as lines of text no
+        wider than width for drawing in the GUI panel. The slowest phases come first.
+        """
+        names = sorted(self.samples, key=lambda name: -self.percentile(name, 95))
+        lines = [('%-*s %5s %5s' % (width - 12, 'ms', 'p50', 'p95'))[:width]]
+        for name in names:
+            lines.append('%-*s %5.1f %5.1f' % (width - 12, name[:width - 12], self.percentile(name, 50) * 1000,
+                                                self.percentile(name, 95) * 1000))
+        if height is not None:
+            lines = lines[:height]
+        return lines
+
+    def dump(self, path):
+        """Appends the current percentiles of every phase to a file as one line of JSON."""
+        summary = dict((name, dict(('p' + str(percent), round(seconds * 1000, 3)) for percent, seconds in values.items()))
+                       for name, values in self.summary().items())
+        with open(path, 'a') as summary_file:
+            summary_file.write(json.dumps({'frame': self.frame_number, 'summary_ms': summary}, sort_keys=True) + '\n')
+
+
+# The game only ever has the one
+timer = FrameTimer()
@@ -0,0 +1,93 @@
+#=============================================================
+# Random number streams. Everything random in the world draws from one
+# of a few named generators instead of libtcod's default one, and all
+# of them come from a single world seed. The same seed always builds the
+# same world, and a change to how the AI rolls dice doesn't shift the
+# terrain that gets generated, since they don't share a generator.
+#
+# The streams are Python generators rather than libtcod ones, since
+# libtcod has no way to write a generator's state out, and a saved game
+# has to carry on with the numbers it would have had. Use random_int()
+# where the game used to call libtcod.random_get_int().
+#=============================================================
+
+import zlib
+import random
+
+import libtcodpy as libtcod
+
+
+class RandomStreams(object):
+    """
+    One random generator per part of the game, all seeded from the world seed:
+
+        terrain   - noise, buildings and junk
+        spawning  - where things get placed, what they are, and where landers come down
+        ai        - decisions the creatures make
+        names     - the names the robots get
+
+    Use it by passing streams['terrain'] (and so on) to random_int(). libtcod functions which want a
+    generator of their own, like noise_new(), get one from libtcod_generator().
+    """
+    NAMES = ('terrain', 'spawning', 'ai', 'names')
+
+    def __init__(self, seed=0):
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        """Starts every stream over from a new world seed."""
+        self.seed = seed
+        self.generators = dict((name, random.Random(self.stream_seed(seed, name))) for name in self.NAMES)
+
+    def state(self):
+        """
+        Returns the state of the streams, for saving along with the game. This only reads it, so saving the
+        game doesn't change what happens next.
+        """
+        streams = {}
+        for name in self.NAMES:
+            (version, internal, gauss_next) = self.generators[name].getstate()
+            streams[name] = [version, list(internal), gauss_next]
+        return {'seed': self.seed, 'streams': streams}
+
+    def restore(self, state):
+        """
+        Puts the streams back the way state() found them. A state with only the world seed in it, from an
+        older save, starts every stream over from the world seed.
+        """
+        self.reseed(state['seed'])
+        for name, (version, internal, gauss_next) in state.get('streams', {}).items():
+            self[name].setstate((version, tuple(internal), gauss_next))
+
+    def libtcod_generator(self, name):
+        """
+        Returns a new libtcod generator seeded from a stream, for the libtcod functions which need one. Free it
+        with libtcod.random_delete() once it has been used.
+        """
+        return libtcod.random_new_from_seed(self[name].randint(0, 0x7fffffff))
+
+    def __getitem__(self, name):
+        if name not in self.generators:
+            raise ValueError('There is no random stream called ' + str(name) + '.')
+        return self.generators[name]
+
+    @staticmethod
+    def stream_seed(seed, name):
+        """Works out the seed of one stream from the world seed, so that each stream gets a different one."""
+        return zlib.crc32(str(seed) + ':' + name) & 0xffffffff
+
+
+
+
+def random_int(rng, low, high):
+    """
+    A random whole number from low to high, both included, out of a stream. rng can also be 0 for libtcod's
+    default generator, like libtcod.random_get_int() takes.
+    """
+    if not rng:
+        return libtcod.random_get_int(0, low, high)
+    return rng.randint(low, high)
+
+
+# The world only ever has the one set of streams
+streams = RandomStreams()
@@ -0,0 +1,183 @@
+#=============================================================
+# Input recording and replay. Everything random in the world comes from
+# the world seed (see randomness.py), so the seed plus every key and
+# mouse event the game read is enough to play a session out again
+# exactly, for instance under the profiler when somebody reports that
+# their game got slow.
+#
+# The log is a text file. The first line is a header with the version
+# and the world seed, and then there is one line per input event. Polls
+# where nothing happened aren't written at all, and the mouse is only
+# written when it changed, so a long session makes a small file:
+#
+#     martians-input 1 1234
+#     57 m 40 20 0
+#     60 k 65 0 0
+#     212 d 10 5 14 8
+#
+# Each line starts with the number of the poll it happened on. 'k' is a
+# key (vk, character code, modifier bits), 'w' a key the game waited for
+# in a menu, 'm' the mouse (cell x, cell y, button bits) and 'd' an area
+# which got designated (x1 y1 x2 y2). Designations follow from the mouse,
+# so on replay they are only checked against what happens again, as a
+# way to notice when the replay has gone out of step.
+#=============================================================
+
+import libtcodpy as libtcod
+
+
+VERSION = 1
+
+# Bits for the modifier keys and mouse buttons
+KEY_FLAGS = ('lalt', 'lctrl', 'ralt', 'rctrl', 'shift')
+MOUSE_FLAGS = ('lbutton', 'rbutton', 'mbutton', 'lbutton_pressed', 'rbutton_pressed', 'mbutton_pressed')
+
+
+def pack_flags(thing, names):
+    bits = 0
+    for bit, name in enumerate(names):
+        if getattr(thing, name):
+            bits |= 1 << bit
+    return bits
+
+def unpack_flags(thing, names, bits):
+    for bit, name in enumerate(names):
+        setattr(thing, name, bool(bits & (1 << bit)))
+
+
+class InputLog(object):
+    """
+    Sits between the game and libtcod's input functions. It normally just passes the input through. While
+    recording it also writes the input down, and while replaying it hands back what was written down
+    instead of what the player is doing. Once a replay runs out of input the player gets control back.
+    """
+    def __init__(self):
+        self.mode = None    # None, 'record' or 'replay'
+        self.file = None
+        self.poll = 0
+        self.mouse_state = None
+        self.events = []    # while replaying, the events still to come, latest first
+        self.diverged = False
+
+    def record(self, path, seed):
+        """Starts writing input to a new log, for a world built from seed."""
+        self.stop()
+        self.file = open(path, 'w')
+        self.file.write('martians-input ' + str(VERSION) + ' ' + str(seed) + '\n')
+        self.mode = 'record'
+        self.poll = 0
+        self.mouse_state = None
+
+    def replay(self, path):
+        """Reads a log to replay, and returns the world seed to build the world from."""
+        self.stop()
+        with open(path) as log:
+            header = log.readline().split()
+            if len(header) != 3 or header[0] != 'martians-input':
+                raise ValueError(path + ' is not an input log.')
+            if int(header[1]) != VERSION:
+                raise ValueError(path + ' is an input log from version ' + header[1] + ', but this reads version ' +
+                                 str(VERSION) + '.')
+            seed = int(header[2])
+            events = []
+            for line in log:
+                fields = line.split()
+                if fields:
+                    events.append((int(fields[0]), fields[1], [int(field) for field in fields[2:]]))
+        events.reverse()
+        self.events = events
+        self.mode = 'replay'
+        self.poll = 0
+        self.mouse_state = None
+        self.diverged = False
+        return seed
+
+    def stop(self):
+        """Stops recording or replaying."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.mode = None
+        self.events = []
+
+    #------------------------------------------------------------
+    # What the game calls instead of libtcod
+
+    def check_for_event(self, key, mouse):
+        """Fills in key and mouse like libtcod.sys_check_for_event() does."""
+        # Even while replaying this has to be called, or the window stops responding
+        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE, key, mouse)
+        self.poll += 1
+        if self.mode == 'record':
+            if key.vk != libtcod.KEY_NONE:
+                self.write('k', key.vk, key.c, pack_flags(key, KEY_FLAGS))
+            state = (mouse.cx, mouse.cy, pack_flags(mouse, MOUSE_FLAGS))
+            if state != self.mouse_state:
+                self.write('m', *state)
+                self.mouse_state = state
+        elif self.mode == 'replay':
+            key.vk, key.c = libtcod.KEY_NONE, 0
+            unpack_flags(key, KEY_FLAGS, 0)
+            for kind, values in self.take('k', 'm'):
+                if kind == 'k':
+                    key.vk, key.c = values[0], values[1]
+                    unpack_flags(key, KEY_FLAGS, values[2])
+                else:
+                    self.mouse_state = tuple(values)
+            if self.mouse_state is not None:
+                mouse.cx, mouse.cy = self.mouse_state[0], self.mouse_state[1]
+                unpack_flags(mouse, MOUSE_FLAGS, self.mouse_state[2])
+            self.finish_replay()
+
+    def wait_for_keypress(self):
+        """Waits for a key like libtcod.console_wait_for_keypress(True) does, and returns it."""
+        self.poll += 1
+        if self.mode == 'replay':
+            for kind, values in self.take('w'):
+                key = libtcod.Key()
+                key.vk, key.c = values[0], values[1]
+                unpack_flags(key, KEY_FLAGS, values[2])
+                self.finish_replay()
+                return key
+            self.finish_replay()
+        key = libtcod.console_wait_for_keypress(True)
+        if self.mode == 'record':
+            self.write('w', key.vk, key.c, pack_flags(key, KEY_FLAGS))
+        return key
+
+    def designated(self, x1, y1, x2, y2):
+        """Notes down an area the player designated, or checks it against the log while replaying."""
+        if self.mode == 'record':
+            self.write('d', x1, y1, x2, y2)
+        elif self.mode == 'replay':
+            if self.take('d') != [('d', [x1, y1, x2, y2])] and not self.diverged:
+                self.diverged = True
+                print 'The replay has gone out of step with the log at poll ' + str(self.poll) + '.'
+
+    #------------------------------------------------------------
+
+    def write(self, kind, *values):
+        self.file.write(str(self.poll) + ' ' + kind + ' ' + ' '.join(str(value) for value in values) + '\n')
+
+    def take(self, *kinds):
+        """Takes the events of the given kinds for the current poll off of the replay."""
+        taken = []
+        while self.events and self.events[-1][0] < self.poll:
+            # Something was logged which the game didn't ask for this time round
+            self.events.pop()
+            if not self.diverged:
+                self.diverged = True
+                print 'The replay has gone out of step with the log at poll ' + str(self.poll) + '.'
+        while self.events and self.events[-1][0] == self.poll and self.events[-1][1] in kinds:
+            poll, kind, values = self.events.pop()
+            taken.append((kind, values))
+        return taken
+
+    def finish_replay(self):
+        if self.mode == 'replay' and not self.events:
+            print 'The replay is over after ' + str(self.poll) + ' polls.'
+            self.stop()
+
+
+# The game only ever has the one
+inputs = InputLog()
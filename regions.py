@@ -0,0 +1,173 @@
+#=============================================================
+# Connected regions of walkable ground. Noise mesas wall off pockets of
+# open ground, and there is no point trying to path into one of those
+# from outside. Every unblocked tile gets a region id, and two tiles can
+# reach each other exactly when their region ids are the same.
+#=============================================================
+
+from array import array
+
+from utility_methods import TileSet
+
+
+class RegionMap(object):
+    """
+    Labels every unblocked tile of a TileGrid with the id of the connected region it belongs to, counting
+    diagonal steps as connected just like libtcod's pathfinding does. Blocked tiles have region 0.
+    The labels are kept up to date as tiles get blocked or cleared, without relabelling the whole map:
+    clearing a tile merges the regions around it, and blocking one only searches for a split when the
+    tiles around it aren't still joined to each other.
+    """
+    def __init__(self, grid):
+        self.grid = grid
+        self.labels = array('i', [0]) * grid.size
+        self.members = {}   # region id -> TileSet of the plane positions in it
+        self.next_id = 1
+        # Goes up whenever a tile gets cleared, which is the only way for a tile to become reachable from
+        # somewhere it wasn't before
+        self.version = 0
+
+        for index in xrange(grid.size):
+            if not grid.blocked[index] and not self.labels[index]:
+                self.flood(index, self.new_region())
+
+        grid.add_listener(self.tile_changed)
+
+    #------------------------------------------------------------
+    # Queries
+
+    def region_at(self, x, y):
+        """Returns the region id of the tile at (x, y), which is 0 if it is blocked."""
+        return self.labels[self.grid.index(x, y)]
+
+    def same_region(self, a, b):
+        """Returns True if the tiles at the (x, y) coordinates a and b can be walked between."""
+        region = self.region_at(a[0], a[1])
+        return region != 0 and region == self.region_at(b[0], b[1])
+
+    def size(self, region):
+        """Returns the number of tiles in a region."""
+        if region not in self.members:
+            return 0
+        return len(self.members[region])
+
+    def sizes(self):
+        """Returns a dict of region id -> number of tiles, for every region."""
+        return dict((region, len(tiles)) for region, tiles in self.members.items())
+
+    def can_reach_next_to(self, from_x, from_y, x, y):
+        """
+        Returns True if something at (from_x, from_y) can walk to (x, y) or to one of the tiles around it.
+        That is what a builder needs to work on a tile, which is usually blocked itself.
+        """
+        region = self.region_at(from_x, from_y)
+        if region == 0:
+            return False
+        index = self.grid.index(x, y)
+        if self.labels[index] == region:
+            return True
+        for neighbour in self.grid.neighbours(index):
+            if self.labels[neighbour] == region:
+                return True
+        return False
+
+    def random_tile(self, region, rng=0):
+        """Returns the (x, y) of a random tile in a region, or (None, None) if the region doesn't exist."""
+        if region not in self.members:
+            return (None, None)
+        return self.grid.coords(self.members[region].choice(rng))
+
+    #------------------------------------------------------------
+    # Keeping the labels up to date
+
+    def new_region(self):
+        region = self.next_id
+        self.next_id += 1
+        self.members[region] = TileSet()
+        return region
+
+    def relabel(self, index, region):
+        old = self.labels[index]
+        if old:
+            self.members[old].discard(index)
+        self.labels[index] = region
+        self.members[region].add(index)
+
+    def flood(self, start, region):
+        """Gives every tile connected to start the given region id."""
+        self.relabel(start, region)
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            for neighbour in self.grid.neighbours(index):
+                if not self.grid.blocked[neighbour] and self.labels[neighbour] != region:
+                    self.relabel(neighbour, region)
+                    stack.append(neighbour)
+
+    def tile_changed(self, index, name):
+        if name != 'blocked':
+            return
+        if self.grid.blocked[index]:
+            self.tile_blocked(index)
+        else:
+            self.tile_cleared(index)
+
+    def tile_cleared(self, index):
+        """A tile opened up, so it joins the regions around it together."""
+        self.version += 1
+        around = set(self.labels[neighbour] for neighbour in self.grid.neighbours(index)) - set([0])
+        if not around:
+            self.relabel(index, self.new_region())
+            return
+
+        # Keep the biggest region's id and move the smaller ones into it
+        biggest = max(around, key=lambda region: (len(self.members[region]), -region))
+        for region in around:
+            if region != biggest:
+                for member in list(self.members[region]):
+                    self.relabel(member, biggest)
+                del self.members[region]
+        self.relabel(index, biggest)
+
+    def tile_blocked(self, index):
+        """A tile got blocked, which might cut its region in two."""
+        region = self.labels[index]
+        if region == 0:
+            return
+        self.members[region].discard(index)
+        self.labels[index] = 0
+        if not self.members[region]:
+            del self.members[region]
+            return
+
+        around = [neighbour for neighbour in self.grid.neighbours(index) if self.labels[neighbour] == region]
+        if len(around) <= 1 or self.joined(around):
+            return
+
+        # The tiles around it might only have been connected through this one. Flood fill from the first
+        # one, and anything that doesn't get reached ends up in a region of its own.
+        reached = set([around[0]])
+        stack = [around[0]]
+        while stack:
+            current = stack.pop()
+            for neighbour in self.grid.neighbours(current):
+                if self.labels[neighbour] == region and neighbour not in reached:
+                    reached.add(neighbour)
+                    stack.append(neighbour)
+
+        for start in around[1:]:
+            if start not in reached and self.labels[start] == region:
+                self.flood(start, self.new_region())
+
+    def joined(self, tiles):
+        """Returns True if the tiles are all connected to each other without going outside of the group."""
+        coords = [self.grid.coords(index) for index in tiles]
+        reached = set([coords[0]])
+        stack = [coords[0]]
+        while stack:
+            x, y = stack.pop()
+            for other in coords:
+                if other not in reached and abs(other[0] - x) <= 1 and abs(other[1] - y) <= 1:
+                    reached.add(other)
+                    stack.append(other)
+        return len(reached) == len(coords)
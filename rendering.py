@@ -0,0 +1,164 @@
+#=============================================================
+# Drawing the map. The MapRenderer remembers what it last drew in every
+# cell of the map console, and only sends libtcod the cells that have
+# actually changed since the previous frame.
+#=============================================================
+
+import libtcodpy as libtcod
+from constants import *
+
+from palette import CHARS, SHADED, LIT, REMEMBERED_WALL, REMEMBERED_FLOOR
+
+
+# Tiles which have never been seen aren't drawn at all. The other shades come from palette.py.
+HIDDEN = -1
+
+
+class MapRenderer(object):
+    """
+    Draws a GameMap onto an off-screen console. Cells are only redrawn when their visibility, their
+    tile's appearance or the object standing on them has changed, so an idle frame costs almost nothing.
+    """
+    def __init__(self, con, width=MAP_WIDTH, height=MAP_HEIGHT):
+        self.con = con
+        self.width = width
+        self.height = height
+
+        self.gamemap = None
+        self.fov_version = None
+        self.visible = bytearray(width * height)
+
+        # What is currently on the console in each cell, as (tile key, object key)
+        self.drawn = [None] * (width * height)
+        # The topmost visible actor in each occupied cell, as cell index -> (object key, color)
+        self.objects_drawn = {}
+        # The same for the items and props, which only get looked at again when one of them changes or the
+        # field of view does. static_state says which versions of the map these were worked out for.
+        self.static_drawn = {}
+        self.static_state = None
+        self.dirty = set()
+
+    def invalidate(self):
+        """Forget everything that has been drawn, and redraw the whole map on the next frame."""
+        libtcod.console_clear(self.con)
+        self.drawn = [((HIDDEN, 0, 0, 0), None)] * (self.width * self.height)
+        self.objects_drawn = {}
+        self.static_drawn = {}
+        self.static_state = None
+        self.visible = bytearray(self.width * self.height)
+        self.fov_version = None
+        self.dirty = set(range(self.width * self.height))
+
+    def attach(self, gamemap_instance):
+        """Start drawing a different GameMap. The renderer listens to its tiles to know which ones to redraw."""
+        if self.gamemap is not None:
+            self.gamemap.level.remove_listener(self.tile_changed)
+        self.gamemap = gamemap_instance
+        self.gamemap.level.add_listener(self.tile_changed)
+        self.invalidate()
+
+    def tile_changed(self, index, name):
+        if name in ('char', 'fore', 'back', 'block_sight', 'explored'):
+            self.dirty.add(index)
+        if name == 'explored':
+            self.static_state = None # props which are always visible might show up now
+
+    def tile_key(self, index):
+        """Returns what a tile should look like right now, as (shading, char, fore, back) palette indices."""
+        level = self.gamemap.level
+        if self.visible[index]:
+            shading = LIT
+        elif level.explored[index]:
+            if level.block_sight[index]:
+                shading = REMEMBERED_WALL
+            else:
+                shading = REMEMBERED_FLOOR
+        else:
+            return (HIDDEN, 0, 0, 0)
+        return (shading, level.char[index], level.fore[index], level.back[index])
+
+    def update_visibility(self):
+        """Copy the FOV into self.visible, marking cells dirty when they come into or go out of view."""
+        level = self.gamemap.level
+        fov_map = self.gamemap.fov_map
+        visible = self.visible
+        explored = level.explored
+        for x in range(self.width):
+            for y in range(self.height):
+                index = level.index(x, y)
+                in_fov = 1 if libtcod.map_is_in_fov(fov_map, x, y) else 0
+                if in_fov != visible[index]:
+                    visible[index] = in_fov
+                    self.dirty.add(index)
+                if in_fov:
+                    explored[index] = 1
+
+    def visible_objects(self, objects):
+        """Returns the topmost drawable object of a list in each cell, where later objects are on top."""
+        level = self.gamemap.level
+        objects_now = {}
+        for obj in objects:
+            index = level.index(obj.x, obj.y)
+            if self.visible[index] or (obj.always_visible and level.explored[index]):
+                objects_now[index] = ((obj.char, obj.color.r, obj.color.g, obj.color.b), obj.color)
+        return objects_now
+
+    def mark_changes(self, before, now):
+        """Marks every cell whose topmost object differs between two results of visible_objects()."""
+        for index in set(before) | set(now):
+            if before.get(index, (None,))[0] != now.get(index, (None,))[0]:
+                self.dirty.add(index)
+
+    def render(self, gamemap_instance, player):
+        """Brings the console up to date with the map, drawing only what changed."""
+        if gamemap_instance is not self.gamemap:
+            self.attach(gamemap_instance)
+
+        gamemap_instance.compute_fov(player.x, player.y)
+        if gamemap_instance.fov_version != self.fov_version:
+            self.update_visibility()
+            self.fov_version = gamemap_instance.fov_version
+
+        # Items and props only move when they get picked up, dropped or changed, so they are only looked at 
+        # again when the map says one of them did, or when what can be seen changed.
+        static_state = (gamemap_instance.static_version, self.fov_version)
+        if static_state != self.static_state:
+            static_now = self.visible_objects(gamemap_instance.props + gamemap_instance.items)
+            self.mark_changes(self.static_drawn, static_now)
+            self.static_drawn = static_now
+            self.static_state = static_state
+
+        # Actors get looked at every frame, and the player is always drawn on top
+        objects_now = self.visible_objects(gamemap_instance.actors + [player])
+        self.mark_changes(self.objects_drawn, objects_now)
+        self.objects_drawn = objects_now
+
+        for index in self.dirty:
+            tile = self.tile_key(index)
+            obj = objects_now.get(index) or self.static_drawn.get(index)
+            state = (tile, obj and obj[0])
+            if state != self.drawn[index]:
+                self.draw_cell(index, tile, obj)
+                self.drawn[index] = state
+        self.dirty = set()
+
+    def draw_cell(self, index, tile, obj):
+        """Puts one cell of the map onto the console."""
+        x, y = self.gamemap.level.coords(index)
+        shading, char, fore, back = tile
+        if shading == HIDDEN:
+            libtcod.console_put_char_ex(self.con, x, y, ' ', libtcod.black, libtcod.black)
+            return
+
+        # TODO: Draw non-map things which are always visible, such as some objects.
+        # Currently objects with always_visible=True do not get shaded darker when
+        # outside of view. :-(
+        char = CHARS[char]
+        fore = SHADED[shading][fore]
+        back = SHADED[shading][back]
+
+        if obj is not None:
+            # Objects are drawn over the tile's background, like GamePiece.draw does
+            char = obj[0][0]
+            fore = obj[1]
+        libtcod.console_put_char_ex(self.con, x, y, char, fore, back)
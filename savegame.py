@@ -0,0 +1,754 @@
+#!/usr/bin/env python
+#=============================================================
+# Saved games. A save file holds every GameMap in list_of_maps, without
+# pickling a single Tile or Color:
+#
+#   - a fixed header with the format version and the compression used,
+#   - a JSON description of the game, the maps and the tile palettes,
+#   - each map's tile planes, straight out of its TileGrid,
+#   - one table of every object in the game, stored a column at a time,
+#     plus a record for each fighter, AI, item and piece of equipment.
+#
+# Version 2 added each object's uid, where each creature is in the turn
+# order, and the state of the random streams. Version 1 saves still
+# load, and their objects get new uids.
+#
+# Everything after the header can be compressed with zlib or, if the
+# lzma module is around, with lzma.
+#
+# Saving is done in two steps: snapshot() copies the game on the main
+# loop, which is quick, and encode() does the slow part. The
+# BackgroundSaver does the second step, and the writing, on a thread of
+# its own, so saving doesn't hold up the game.
+#
+#     python savegame.py --levels 4
+#
+# reports how long saving and loading a colony takes, and how big the
+# file gets, with each kind of compression.
+#=============================================================
+
+import os
+import sys
+import json
+import zlib
+import struct
+import argparse
+import tempfile
+import threading
+from array import array
+from time import time
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None # lzma compression just isn't on offer
+
+import libtcodpy as libtcod
+
+from constants import *
+from palette import COLORS, CHARS, color_index, char_index
+from mapcreation import GameMap, TileGrid, Rect
+from classes import GamePiece, Fighter, Item, Equipment, uid_in_use
+from ai import BasicNPC, BasicExplorer, BasicBuilder, player_death, NPC_death
+from utility_methods import cast_heal, cast_lightning, cast_confuse, cast_fireball
+from randomness import streams
+
+
+MAGIC = 'MARTIANS'
+VERSION = 2
+HEADER = struct.Struct('<8sHB')
+
+COMPRESSIONS = ('none', 'zlib', 'lzma')
+
+# Tile planes which get saved, out of every TileGrid
+PLANES = TileGrid.FLAGS + ('char', 'fore', 'back')
+
+# Components refer to functions and AI classes, which get saved by name
+FUNCTIONS = dict((function.__name__, function) for function in
+                 (player_death, NPC_death, cast_heal, cast_lightning, cast_confuse, cast_fireball))
+AI_CLASSES = dict((cls.__name__, cls) for cls in (BasicNPC, BasicExplorer, BasicBuilder))
+
+# What reading a save which was cut short or got damaged can raise, which read() and decode() turn into
+# ValueErrors
+DAMAGED_SAVE_ERRORS = (zlib.error, struct.error, KeyError, IndexError, TypeError)
+if lzma is not None:
+    DAMAGED_SAVE_ERRORS += (lzma.LZMAError,)
+
+# GamePiece flags, packed into one column
+BLOCKS = 1
+ALWAYS_VISIBLE = 2
+SPOKEN = 4
+
+# The entity columns which hold numbers, and get stored as packed arrays
+NUMBER_COLUMNS = ('uid', 'map', 'holder', 'x', 'y', 'color', 'flags', 'speed', 'wait', 'order', 'level')
+
+
+class Snapshot(object):
+    """
+    Everything that goes in a save file, copied out of the game into plain Python data. Nothing in the game
+    refers to any of it, so it can be encoded while the game carries on.
+    """
+    def __init__(self, meta, blobs):
+        self.meta = meta    # the JSON part
+        self.blobs = blobs  # list of (name, bytes) for the tile planes and number columns
+
+
+#------------------------------------------------------------
+# Saving
+
+def snapshot(list_of_maps, map_number, game_state='playing', messages=(), extra=None):
+    """
+    Copies the whole game out into a Snapshot. This only copies, so it is quick, and it doesn't change
+    anything in the game. extra is a dict of anything else to save along with the game, which has to fit in
+    JSON.
+    """
+    random_state = streams.state()
+    meta = {
+        'extra': extra or {},
+        'map_number': map_number,
+        'game_state': game_state,
+        'seed': random_state['seed'],
+        'streams': random_state['streams'],
+        'messages': [[line, pack_color(color)] for (line, color) in messages],
+        'colors': [[color.r, color.g, color.b] for color in COLORS],
+        'chars': [pack_char(char) for char in CHARS],
+        'maps': [],
+    }
+    blobs = []
+    columns = dict((name, array('i')) for name in NUMBER_COLUMNS)
+    table = {'name': [], 'char': [], 'scifi_name': [], 'fighter': [], 'ai': [], 'item': [], 'equipment': [],
+             'count': 0}
+
+    for number, level in enumerate(level_snapshots(list_of_maps)):
+        meta['maps'].append(level.meta['map'])
+        level_blobs = dict(level.blobs)
+        for name in PLANES:
+            blobs.append(('map' + str(number) + '.' + name, level_blobs[name]))
+        add_entities(columns, table, level, number)
+
+    for name in NUMBER_COLUMNS:
+        blobs.append(('entities.' + name, column_bytes(columns[name])))
+    meta['entities'] = table
+    return Snapshot(meta, blobs)
+
+def level_snapshots(list_of_maps):
+    """
+    Returns a Snapshot of each level in turn, made by level_snapshot(). A LevelCache (see levels.py) hands the
+    levels it has on the disk over straight out of their files, instead of loading them, and a level which is
+    already a Snapshot, like the ones load() leaves unbuilt, is used as it is.
+    """
+    if hasattr(list_of_maps, 'level_snapshots'):
+        return list_of_maps.level_snapshots()
+    return (level if isinstance(level, Snapshot) else level_snapshot(level) for level in list_of_maps)
+
+def level_snapshot(gamemap_instance):
+    """
+    Copies one map and everything on it out into a Snapshot of its own. The meta has the map's record under
+    'map' and its entity table under 'entities', and the blobs are named after the tile planes and columns.
+    """
+    level = gamemap_instance.level
+    record = {
+        'id': gamemap_instance.id_number,
+        'location': gamemap_instance.location,
+        'width': level.width,
+        'height': level.height,
+        'turn': gamemap_instance.turn,
+        'landers': [[lander.x1, lander.y1, lander.x2 - lander.x1, lander.y2 - lander.y1]
+                    for lander in gamemap_instance.landers],
+        'sparse': dict((name, [[index, value] for index, value in getattr(level, name).items()])
+                       for name in TileGrid.SPARSE),
+    }
+    blobs = [(name, bytes(getattr(level, name))) for name in PLANES]
+    columns, table = entity_columns([(obj, 0, -1) for obj in gamemap_instance.objects])
+    blobs.extend(('entities.' + name, column_bytes(columns[name])) for name in NUMBER_COLUMNS)
+    return Snapshot({'map': record, 'entities': table}, blobs)
+
+def saved_level(data):
+    """
+    Takes the bytes of a game saved with a single level in it, and returns that level as a level_snapshot(),
+    without loading it. The save has to come from this run of the game, since the tiles aren't translated
+    into this run's palettes.
+    """
+    meta, blobs = read(data)
+    level_blobs = [(name, blobs['map0.' + name]) for name in PLANES]
+    level_blobs.extend(('entities.' + name, blobs['entities.' + name]) for name in NUMBER_COLUMNS)
+    return Snapshot({'map': meta['maps'][0], 'entities': meta['entities']}, level_blobs)
+
+def add_entities(columns, table, level, number):
+    """
+    Adds the entities of a level_snapshot() to the end of the whole game's entity table, as being on map
+    number, renumbering them to go after the ones already there.
+    """
+    first = table['count']
+    blobs = dict(level.blobs)
+    level_table = level.meta['entities']
+    for name in NUMBER_COLUMNS:
+        column = column_array(blobs['entities.' + name])
+        if name == 'map':
+            column = array('i', (number if value != -1 else -1 for value in column))
+        elif name == 'holder':
+            column = array('i', (value + first if value != -1 else -1 for value in column))
+        columns[name].extend(column)
+    for name in ('name', 'char', 'scifi_name'):
+        table[name].extend(level_table[name])
+    for name in ('fighter', 'ai', 'item', 'equipment'):
+        table[name].extend([record[0] + first] + list(record[1:]) for record in level_table[name])
+    table['count'] += level_table['count']
+
+def describe(obj):
+    """
+    Lays a single object, and whatever it carries, out the same way as level_snapshot() does, but with the
+    number columns in with the rest, so that the whole thing fits in JSON. rebuild() turns it back into
+    the object.
+    """
+    columns, table = entity_columns([(obj, -1, -1)])
+    table['columns'] = dict((name, list(column)) for name, column in columns.items())
+    return table
+
+def entity_columns(entities):
+    """
+    Does the work for level_snapshot() and describe(). Takes a list of (object, map number, holder entity
+    number), adds everything the objects carry to the end of it, and returns the number columns and the
+    rest of the table.
+    """
+    # Inventories can hold things which hold things, so keep going until the end of the growing list
+    for holder, (obj, number, held_by) in enumerate(entities):
+        for item in obj.inventory:
+            entities.append((item, -1, holder))
+
+    columns = dict((name, array('i')) for name in NUMBER_COLUMNS)
+    table = {'name': [], 'char': [], 'scifi_name': [], 'fighter': [], 'ai': [], 'item': [], 'equipment': []}
+    for entity, (obj, number, holder) in enumerate(entities):
+        gamemap_instance = obj.gamemap
+        if gamemap_instance is not None:
+            wait = gamemap_instance.scheduler.waiting(obj, gamemap_instance.turn)
+            order = gamemap_instance.scheduler.order_of(obj)
+        else:
+            wait = obj.wait
+            order = -1
+        flags = (BLOCKS if obj.blocks else 0) | (ALWAYS_VISIBLE if obj.always_visible else 0) | \
+                (SPOKEN if obj.spoken else 0)
+        for name, value in (('uid', obj.uid), ('map', number), ('holder', holder), ('x', obj.x), ('y', obj.y),
+                            ('color', pack_color(obj.color)), ('flags', flags), ('speed', obj.speed),
+                            ('wait', wait), ('order', order), ('level', getattr(obj, 'level', -1))):
+            columns[name].append(value)
+        table['name'].append(obj.name)
+        table['char'].append(pack_char(obj.char))
+        table['scifi_name'].append(obj.scifi_name)
+
+        if obj.fighter:
+            fighter = obj.fighter
+            table['fighter'].append([entity, fighter.base_max_hp, fighter.hp, fighter.base_defense,
+                                     fighter.base_power, fighter.xp, function_name(fighter.death_function),
+                                     fighter.attack_speed])
+        if obj.ai:
+            kind = obj.ai.__class__.__name__
+            if kind not in AI_CLASSES:
+                raise ValueError('Cannot save the ' + obj.name + ', there is no way to save a ' + kind + '.')
+            if isinstance(obj.ai, BasicExplorer):
+                target = obj.ai.destination
+            else:
+                target = gamemap_instance.work_orders.claim_of(obj) if gamemap_instance is not None else None
+            table['ai'].append([entity, kind] + list(target or (None, None)))
+        if obj.equipment:
+            equipment = obj.equipment
+            table['equipment'].append([entity, equipment.slot, equipment.power_bonus, equipment.defense_bonus,
+                                       equipment.max_hp_bonus, equipment.is_equipped])
+        elif obj.item:
+            table['item'].append([entity, function_name(obj.item.use_function)])
+
+    table['count'] = len(entities)
+    return columns, table
+
+def encode(snapshot, compression='zlib'):
+    """Turns a Snapshot into the bytes of a save file."""
+    if compression not in COMPRESSIONS:
+        raise ValueError('Unknown compression ' + str(compression) + ', use one of ' + ', '.join(COMPRESSIONS) + '.')
+    meta = dict(snapshot.meta)
+    meta['blobs'] = [[name, len(data)] for (name, data) in snapshot.blobs]
+    meta_json = json.dumps(meta, encoding='latin-1', separators=(',', ':'))
+    body = struct.pack('<I', len(meta_json)) + meta_json + ''.join(data for (name, data) in snapshot.blobs)
+    return HEADER.pack(MAGIC, VERSION, COMPRESSIONS.index(compression)) + compress(body, compression)
+
+def save(path, list_of_maps, map_number, game_state='playing', messages=(), compression='zlib', extra=None):
+    """Saves the game to a file, and returns how many bytes it took."""
+    data = encode(snapshot(list_of_maps, map_number, game_state, messages, extra), compression)
+    write_atomically(path, data)
+    return len(data)
+
+def write_atomically(path, data):
+    """
+    Writes a file so that it is either all there or not changed at all, even if the game crashes or the power
+    goes out halfway through: the data goes to a temporary file first, which replaces the real one once it is
+    safely on the disk.
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as save_file:
+        save_file.write(data)
+        save_file.flush()
+        os.fsync(save_file.fileno())
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path) # Windows won't rename over a file which exists
+    os.rename(temporary, path)
+    if os.name == 'posix':
+        # Make sure the rename itself is on the disk too
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+class BackgroundSaver(object):
+    """
+    Saves games on a thread of its own. The main loop only pays for taking the snapshot, and the encoding,
+    compressing and writing happen while the game carries on. One save runs at a time.
+
+    status is None until the first save, and then 'saving', 'saved' or 'failed'. progress goes from 0.0 to 1.0
+    as a save goes along, for showing on the screen.
+    """
+    def __init__(self):
+        self.thread = None
+        self.status = None
+        self.progress = 0.0
+        self.path = None
+        self.error = None
+        self.finished_at = None
+        self.size = None
+
+    @property
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def save(self, path, list_of_maps, map_number, game_state='playing', messages=(), compression='zlib',
+             extra=None):
+        """
+        Takes a snapshot of the game and starts saving it to path in the background. Returns False without
+        doing anything if the last save hasn't finished yet.
+        """
+        if self.busy:
+            return False
+        copy = snapshot(list_of_maps, map_number, game_state, messages, extra)
+        self.status = 'saving'
+        self.progress = 0.0
+        self.path = path
+        self.error = None
+        # Not a daemon thread, so that quitting the game still waits for the save to be finished
+        self.thread = threading.Thread(target=self.write, args=(path, copy, compression), name='save')
+        self.thread.start()
+        return True
+
+    def write(self, path, copy, compression):
+        try:
+            data = encode(copy, compression)
+            self.progress = 0.6
+            write_atomically(path, data)
+            self.size = len(data)
+            self.progress = 1.0
+            self.status = 'saved'
+        except Exception as error:
+            # Whatever went wrong, the save has to end up 'failed' rather than stuck at 'saving', since the
+            # action journal keeps its records until a snapshot is known to be saved
+            self.error = error
+            self.status = 'failed'
+            print 'Saving to ' + path + ' failed: ' + error.__class__.__name__ + ': ' + str(error)
+        self.finished_at = time()
+
+    def wait(self):
+        """Waits for the save that is going on, if there is one, to finish."""
+        if self.thread is not None:
+            self.thread.join()
+
+    def status_text(self, linger=3.0):
+        """
+        Returns a short line about the save for the GUI panel, or '' if there is nothing to say. A finished save
+        is only mentioned for linger seconds.
+        """
+        if self.status == 'saving':
+            return 'Saving... ' + str(int(self.progress * 100)) + '%'
+        if self.status == 'failed':
+            return 'Save failed!'
+        if self.status == 'saved' and time() - self.finished_at < linger:
+            return 'Saved.'
+        return ''
+
+
+# The game only ever has the one
+saver = BackgroundSaver()
+
+
+#------------------------------------------------------------
+# Loading
+
+def read(data, name='This'):
+    """
+    Checks the header of a save file and splits the rest up. Returns the JSON part and a dict of the blobs.
+    Raises ValueError if it isn't a save this can read, with name (the file's, say) at the start of the message.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError(name + ' is too short to be a saved game.')
+    magic, version, compression = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(name + ' is not a saved game.')
+    if not 1 <= version <= VERSION:
+        raise ValueError(name + ' was saved in version ' + str(version) + ' of the save format, but only up to '
+                         'version ' + str(VERSION) + ' can be loaded.')
+    if compression >= len(COMPRESSIONS):
+        raise ValueError(name + ' was saved with an unknown kind of compression.')
+    try:
+        body = decompress(data[HEADER.size:], COMPRESSIONS[compression])
+        (meta_length,) = struct.unpack_from('<I', body)
+        meta = json.loads(body[4:4 + meta_length], encoding='latin-1')
+        blobs = {}
+        offset = 4 + meta_length
+        for blob_name, length in meta['blobs']:
+            blobs[blob_name] = body[offset:offset + length]
+            offset += length
+        if offset != len(body):
+            raise ValueError('the blobs do not add up to the size of the save')
+    except DAMAGED_SAVE_ERRORS + (ValueError,) as error:
+        raise ValueError(name + ' is damaged and cannot be loaded (' + str(error) + ').')
+    return meta, blobs
+
+def decode(data, extra=None, name='This', neighbours=None):
+    """
+    Turns the bytes of a save file back into a game. Returns (list_of_maps, map_number, game_state, messages,
+    random_state), where random_state is for RandomStreams.restore(). If a dict is passed as extra, it gets
+    whatever was saved as extra by snapshot(). A save which can't be loaded raises ValueError, with name at
+    the start of the message.
+
+    If neighbours is given, only the level the player is on and the levels up to neighbours away from it get
+    built. The others come back in list_of_maps as level_snapshot()s, for a LevelCache to keep on the disk.
+    """
+    meta, blobs = read(data, name)
+    try:
+        return build_game(meta, blobs, extra, neighbours)
+    except DAMAGED_SAVE_ERRORS as error:
+        raise ValueError(name + ' is damaged and cannot be loaded (' + error.__class__.__name__ + ': ' +
+                         str(error) + ').')
+
+def build_game(meta, blobs, extra, neighbours=None):
+    """Does the work for decode(), once the save has been split up."""
+
+    # The palettes get filled in as colors and characters come up, so their indices differ from one run of the
+    # game to the next. Work out where each saved index went this time.
+    color_table = palette_table([color_index(libtcod.Color(*rgb)) for rgb in meta['colors']])
+    char_table = palette_table([char_index(unpack_char(char)) for char in meta['chars']])
+
+    table = meta['entities']
+    columns = dict((name, column_array(blobs['entities.' + name])) for name in NUMBER_COLUMNS
+                   if 'entities.' + name in blobs) # saves from before version 2 have no uids
+    map_number = meta['map_number']
+    if neighbours is None or len(columns) < len(NUMBER_COLUMNS):
+        # Objects from before version 2 only get their uids as they are made, so those saves get built whole
+        built = range(len(meta['maps']))
+    else:
+        built = range(map_number - neighbours, map_number + neighbours + 1)
+        # Nothing gets made for the levels which aren't built, but their uids are still taken
+        if columns['uid']:
+            uid_in_use(max(columns['uid']))
+        parts = split_entities(table, columns, lambda number: 'built' if number in built else number)
+        (table, columns) = parts.pop('built', empty_entities(columns))
+
+    list_of_maps = []
+    for number, record in enumerate(meta['maps']):
+        planes = dict((name, blobs['map' + str(number) + '.' + name]) for name in PLANES)
+        planes['char'] = planes['char'].translate(char_table)
+        planes['fore'] = planes['fore'].translate(color_table)
+        planes['back'] = planes['back'].translate(color_table)
+        if number not in built:
+            (level_table, level_columns) = parts.get(number, empty_entities(columns))
+            level_columns['map'] = array('i', (0 if value != -1 else -1 for value in level_columns['map']))
+            level_blobs = [(name, planes[name]) for name in PLANES]
+            level_blobs.extend(('entities.' + name, column_bytes(level_columns[name])) for name in NUMBER_COLUMNS)
+            list_of_maps.append(Snapshot({'map': record, 'entities': level_table}, level_blobs))
+            continue
+        sparse = dict((name, dict((index, as_str(value)) for index, value in values))
+                      for name, values in record['sparse'].items())
+        level = TileGrid.from_planes(record['width'], record['height'], planes, sparse)
+
+        gamemap_instance = GameMap(record['id'], level, as_str(record['location']))
+        gamemap_instance.turn = record['turn']
+        gamemap_instance.landers = [Rect(*lander) for lander in record['landers']]
+        list_of_maps.append(gamemap_instance)
+
+    place_entities(table, columns, list_of_maps)
+
+    if extra is not None:
+        extra.update(meta.get('extra', {}))
+    messages = [(as_str(line), unpack_color(color)) for (line, color) in meta['messages']]
+    random_state = {'seed': meta['seed'], 'streams': meta.get('streams', {})}
+    return list_of_maps, map_number, as_str(meta['game_state']), messages, random_state
+
+def split_entities(table, columns, group_of):
+    """
+    Splits an entity table up by level. group_of takes a level number and returns which group the objects on
+    that level go in, and the things they carry go along with them. Returns a dict of group -> (table,
+    columns), where each group's entities are numbered from 0, in the same order as before.
+    """
+    groups = {}
+    where = []  # entity -> (group, its number in the group)
+    for entity in range(table['count']):
+        holder = columns['holder'][entity]
+        if holder != -1:
+            group = where[holder][0]    # a holder always comes before what it carries
+        else:
+            group = group_of(columns['map'][entity])
+        if group not in groups:
+            groups[group] = empty_entities(columns)
+        (part_table, part_columns) = groups[group]
+        where.append((group, part_table['count']))
+        part_table['count'] += 1
+        for name in ('name', 'char', 'scifi_name'):
+            part_table[name].append(table[name][entity])
+        for name, column in columns.items():
+            value = column[entity]
+            if name == 'holder' and value != -1:
+                value = where[value][1]
+            part_columns[name].append(value)
+    for name in ('fighter', 'ai', 'item', 'equipment'):
+        for record in table[name]:
+            (group, entity) = where[record[0]]
+            groups[group][0][name].append([entity] + list(record[1:]))
+    return groups
+
+def empty_entities(columns):
+    """An entity table with nothing in it, and columns with the same names as columns."""
+    table = {'name': [], 'char': [], 'scifi_name': [], 'fighter': [], 'ai': [], 'item': [], 'equipment': [],
+             'count': 0}
+    return table, dict((name, array('i')) for name in columns)
+
+def place_entities(table, columns, list_of_maps):
+    """Rebuilds every object from the entity table, and puts it back on its map or in its holder's inventory."""
+    objects = build_objects(table, columns)
+
+    for entity, obj in enumerate(objects):
+        holder = columns['holder'][entity]
+        number = columns['map'][entity]
+        if holder != -1:
+            objects[holder].inventory.append(obj)
+        elif number != -1:
+            gamemap_instance = list_of_maps[number]
+            wait = obj.wait
+            gamemap_instance.add_object(obj)
+            if obj.fighter and not obj.ai and wait > 0:
+                # Creatures driven by the keyboard get held until their wait is over
+                obj.wait = wait - 1
+                gamemap_instance.scheduler.hold(obj, gamemap_instance.turn)
+
+    if 'order' in columns:
+        # Creatures due on the same turn have to take their turns in the same order as before the save, so
+        # schedule them again in that order
+        scheduled = [entity for entity in range(len(objects)) if columns['order'][entity] != -1 and
+                     objects[entity].gamemap is not None]
+        for entity in sorted(scheduled, key=lambda entity: columns['order'][entity]):
+            obj = objects[entity]
+            obj.gamemap.scheduler.add(obj, obj.gamemap.turn)
+
+    # Builders get their jobs back, and explorers carry on to where they were going
+    for record in table['ai']:
+        (entity, x, y) = (record[0], record[2], record[3])
+        obj = objects[entity]
+        if x is None:
+            continue
+        if isinstance(obj.ai, BasicExplorer):
+            obj.ai.destination = (x, y)
+        elif obj.gamemap is not None:
+            obj.gamemap.work_orders.claim(obj, x, y)
+            obj.ai.work_target = (x, y)
+
+def rebuild(description):
+    """Turns what describe() made back into the object, with whatever it carries in its inventory."""
+    objects = build_objects(description, description['columns'])
+    for entity, obj in enumerate(objects):
+        holder = description['columns']['holder'][entity]
+        if holder != -1:
+            objects[holder].inventory.append(obj)
+    return objects[0]
+
+def build_objects(table, columns):
+    """Makes the objects in an entity table, without putting them anywhere, and returns them in order."""
+    count = table['count']
+
+    fighters = dict((record[0], record) for record in table['fighter'])
+    ais = dict((record[0], record) for record in table['ai'])
+    items = dict((record[0], record) for record in table['item'])
+    equipments = dict((record[0], record) for record in table['equipment'])
+
+    objects = []
+    for entity in range(count):
+        fighter = ai = item = equipment = None
+        if entity in fighters:
+            (_, max_hp, hp, defense, power, xp, death_function, attack_speed) = fighters[entity]
+            fighter = Fighter(max_hp, defense, power, xp, named_function(death_function), attack_speed)
+            fighter.hp = hp
+        if entity in ais:
+            if ais[entity][1] not in AI_CLASSES:
+                raise ValueError('The save has a creature with a ' + ais[entity][1] + ', which does not exist any more.')
+            ai = AI_CLASSES[ais[entity][1]]()
+        if entity in items:
+            item = Item(named_function(items[entity][1]))
+        if entity in equipments:
+            (_, slot, power_bonus, defense_bonus, max_hp_bonus, is_equipped) = equipments[entity]
+            equipment = Equipment(as_str(slot), power_bonus, defense_bonus, max_hp_bonus)
+            equipment.is_equipped = is_equipped
+
+        flags = columns['flags'][entity]
+        obj = GamePiece(columns['x'][entity], columns['y'][entity], unpack_char(table['char'][entity]),
+                        as_str(table['name'][entity]), unpack_color(columns['color'][entity]),
+                        blocks=bool(flags & BLOCKS), always_visible=bool(flags & ALWAYS_VISIBLE),
+                        fighter=fighter, ai=ai, item=item, equipment=equipment, speed=columns['speed'][entity])
+        obj.spoken = bool(flags & SPOKEN)
+        obj.scifi_name = as_str(table['scifi_name'][entity])
+        obj.wait = columns['wait'][entity]
+        if columns['level'][entity] != -1:
+            obj.level = columns['level'][entity]
+        if 'uid' in columns:
+            obj.uid = columns['uid'][entity]
+            uid_in_use(obj.uid)
+        objects.append(obj)
+    return objects
+
+def load(path, extra=None, neighbours=None):
+    """
+    Loads a game saved with save(). Returns (list_of_maps, map_number, game_state, messages, random_state).
+    See decode() for neighbours.
+    """
+    with open(path, 'rb') as save_file:
+        return decode(save_file.read(), extra, path, neighbours)
+
+
+#------------------------------------------------------------
+# Packing values
+
+def compress(data, compression):
+    if compression == 'zlib':
+        return zlib.compress(data, 6)
+    if compression == 'lzma':
+        if lzma is None:
+            raise ValueError('lzma compression needs the lzma module, which is not installed.')
+        return lzma.compress(data)
+    return data
+
+def decompress(data, compression):
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    if compression == 'lzma':
+        if lzma is None:
+            raise ValueError('This game was saved with lzma compression, which needs the lzma module to load.')
+        return lzma.decompress(data)
+    return data
+
+def column_bytes(column):
+    """Save files are little endian, whatever the machine is."""
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tostring()
+
+def column_array(data):
+    column = array('i')
+    column.fromstring(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+def palette_table(indices):
+    """Makes a translation table for bytes.translate() out of the new index of each saved palette index."""
+    table = bytearray(range(256))
+    for old, new in enumerate(indices):
+        table[old] = new
+    return bytes(table)
+
+def pack_color(color):
+    return (color.r << 16) | (color.g << 8) | color.b
+
+def unpack_color(value):
+    return libtcod.Color((value >> 16) & 255, (value >> 8) & 255, value & 255)
+
+def pack_char(char):
+    """Characters are either Code Page 437 numbers, which JSON keeps as they are, or strings of bytes."""
+    if isinstance(char, int):
+        return char
+    return [ord(byte) for byte in char]
+
+def unpack_char(char):
+    if isinstance(char, list):
+        return ''.join(chr(byte) for byte in char)
+    return char
+
+def as_str(value):
+    """JSON hands strings back as unicode, but the rest of the game uses byte strings."""
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    return value
+
+def function_name(function):
+    if function is None:
+        return None
+    if FUNCTIONS.get(function.__name__) is not function:
+        raise ValueError('Cannot save a reference to ' + function.__name__ + ', it is not in savegame.FUNCTIONS.')
+    return function.__name__
+
+def named_function(name):
+    if name is None:
+        return None
+    if name not in FUNCTIONS:
+        raise ValueError('The save refers to a function called ' + name + ', which does not exist any more.')
+    return FUNCTIONS[name]
+
+
+#------------------------------------------------------------
+# Measuring
+
+def main(argv=None):
+    from simulation import new_world, Quiet
+
+    parser = argparse.ArgumentParser(description='Report how long saving and loading a colony takes, and how big it is.')
+    parser.add_argument('--levels', type=int, default=4, help='how many levels the colony has')
+    parser.add_argument('--landings', type=int, default=3, help='how many landers come down on the first level')
+    parser.add_argument('--turns', type=int, default=100, help='how many turns to run the colony for first')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the colony')
+    parser.add_argument('--output', help='file to save to while measuring, instead of a temporary one')
+    args = parser.parse_args(argv)
+
+    with Quiet():
+        list_of_maps = new_world(args.seed, args.levels, args.landings, 30, args.turns)
+
+    tiles = sum(gamemap_instance.level.size for gamemap_instance in list_of_maps)
+    objects = sum(len(gamemap_instance.objects) for gamemap_instance in list_of_maps)
+    print str(args.levels) + ' levels, ' + str(tiles) + ' tiles and ' + str(objects) + ' objects.'
+    print '%-6s %10s %12s %10s %10s' % ('', 'bytes', 'snapshot ms', 'save ms', 'load ms')
+    # Without --output it saves to a temporary file, so as not to leave one behind in the current directory
+    path = args.output
+    if path is None:
+        (handle, path) = tempfile.mkstemp(suffix='.sav')
+        os.close(handle)
+    try:
+        for compression in COMPRESSIONS:
+            if compression == 'lzma' and lzma is None:
+                print '%-6s (the lzma module is not installed)' % compression
+                continue
+            start = time()
+            copy = snapshot(list_of_maps, 0)
+            snapshot_time = time() - start
+            start = time()
+            with open(path, 'wb') as save_file:
+                save_file.write(encode(copy, compression))
+            save_time = time() - start + snapshot_time
+            size = os.path.getsize(path)
+            with Quiet():
+                start = time()
+                load(path)
+                load_time = time() - start
+            print '%-6s %10d %12.1f %10.1f %10.1f' % (compression, size, snapshot_time * 1000,
+                                                     save_time * 1000, load_time * 1000)
+    finally:
+        if args.output is None:
+            os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#=============================================================
+# Turn scheduling. Rather than counting down every creature's wait on
+# every pass through the main loop, each creature is filed under the
+# turn it will next act on, and each turn only the creatures that are
+# due get looked at.
+#=============================================================
+
+import heapq
+
+
+class TurnScheduler(object):
+    """
+    A priority queue of creatures keyed by the turn they next get to act on. A creature which has to wait
+    w turns acts w turns from now, and after acting it waits its wait field (which move() and attack() set
+    from speed and attack_speed) and then one more turn, the same as counting the wait down every turn.
+
+    Creatures due on the same turn act in the order they were scheduled, so the same game always plays out
+    the same way. Creatures can be added and removed in the middle of a turn.
+
+    Creatures driven by the keyboard, like the player, can't be queued up to act, so they are held instead:
+    held creatures are only checked for being ready when they try to do something.
+    """
+    def __init__(self):
+        self.heap = []
+        self.entries = {}   # creature -> its [turn, order, creature] entry in the heap
+        self.held = {}      # creature -> the turn it can act again
+        self.order = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, creature):
+        return creature in self.entries
+
+    def add(self, creature, turn):
+        """Schedules a creature to act once its wait has run out, counting from this turn."""
+        self.remove(creature, turn)
+        entry = [turn + creature.wait, self.order, creature]
+        self.order += 1
+        creature.wait = 0
+        self.entries[creature] = entry
+        heapq.heappush(self.heap, entry)
+
+    def remove(self, creature, turn):
+        """Takes a creature out of the schedule. Whatever is left of its wait goes back into its wait field."""
+        entry = self.entries.pop(creature, None)
+        if entry is not None:
+            entry[2] = None  # the heap entry stays behind and gets skipped when it comes up
+            creature.wait = max(entry[0] - turn, 0)
+        due = self.held.pop(creature, None)
+        if due is not None:
+            creature.wait = max(due - turn, 0)
+
+    def next_due(self, turn):
+        """
+        Takes the next creature which is due to act on this turn out of the schedule and returns it, or
+        returns None once nobody else is due. Call reschedule() after it has acted.
+        """
+        while self.heap and self.heap[0][0] <= turn:
+            due, order, creature = heapq.heappop(self.heap)
+            if creature is not None:
+                del self.entries[creature]
+                return creature
+        return None
+
+    def reschedule(self, creature, turn):
+        """Puts a creature which acted on this turn back in the schedule, for after it has waited."""
+        creature.wait += 1
+        self.add(creature, turn)
+
+    def hold(self, creature, turn):
+        """Makes a held creature wait, after it did something on this turn."""
+        self.held[creature] = turn + creature.wait + 1
+        creature.wait = 0
+
+    def is_ready(self, creature, turn):
+        """Returns True if a held creature has finished waiting."""
+        return self.held.get(creature, turn) <= turn
+
+    def order_of(self, creature):
+        """
+        Returns the number which decides where a scheduled creature comes among the ones due on the same turn,
+        or -1 if it isn't scheduled. Lower goes first.
+        """
+        entry = self.entries.get(creature)
+        if entry is not None:
+            return entry[1]
+        return -1
+
+    def waiting(self, creature, turn):
+        """
+        Returns how many more turns a creature has to wait before it acts, without taking it out of the
+        schedule. Creatures which aren't scheduled or held just have their wait field.
+        """
+        entry = self.entries.get(creature)
+        if entry is not None:
+            return max(entry[0] - turn, 0)
+        if creature in self.held:
+            return max(self.held[creature] - turn, 0)
+        return creature.wait
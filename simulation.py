@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#=============================================================
+# Headless simulation. This runs the colony without a window, font or
+# console, as fast as it will go, for soak runs on a server and for
+# timing changes to the AI. Nothing in here may import martians.py,
+# since that opens the game window as soon as it is imported.
+#
+# Run it like this:
+#     python simulation.py --turns 5000 --seed 3
+#=============================================================
+
+import os
+import sys
+import argparse
+from time import time
+
+import libtcodpy as libtcod
+
+from constants import *
+from mapcreation import GameMap, make_surface_map, land_astronauts
+from profiling import timer
+from randomness import streams
+
+
+def seed_generators(seed):
+    """
+    Seeds the world's random streams, which map generation, spawning, the AIs and names draw from, and
+    libtcod's default generator, which stands in for the player picking tiles to designate. The same seed
+    always builds the same colony.
+    """
+    streams.reseed(seed)
+    libtcod.random_restore(0, libtcod.random_new_from_seed(seed))
+
+def new_colony(seed=0, landings=1, jobs=20, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+    Builds a surface map with astronauts landed on it, and designates some blocked tiles for them to clear
+    so the builders have work to do. Returns the GameMap.
+    """
+    seed_generators(seed)
+    level, objects = make_surface_map(width=width, height=height)
+    gamemap_instance = GameMap(0, level, 'surface', objects)
+    gamemap_instance.initialize_fov()
+    for landing in range(landings):
+        land_astronauts(gamemap_instance)
+    designate_random_tiles(gamemap_instance, jobs)
+    return gamemap_instance
+
+def new_world(seed=0, levels=1, landings=1, jobs=20, turns=0):
+    """
+    Builds a colony with new_colony() and runs it for a number of turns, followed by more levels with nobody 
+    on them yet, the way a game looks after the player has gone down the stairs a few times. Returns the 
+    list of GameMaps.
+    """
+    list_of_maps = [new_colony(seed, landings, jobs)]
+    simulate(list_of_maps[0], turns)
+    for number in range(1, levels):
+        level, objects = make_surface_map()
+        list_of_maps.append(GameMap(number, level, 'surface', [obj for obj in objects if obj.name != 'player']))
+    return list_of_maps
+
+def designate_random_tiles(gamemap_instance, count):
+    """Designates up to count random blocked tiles for clearing, the way the player would with the mouse."""
+    level = gamemap_instance.level
+    for attempt in range(count * 20):
+        if count <= 0:
+            break
+        x = libtcod.random_get_int(0, 1, level.width - 2)
+        y = libtcod.random_get_int(0, 1, level.height - 2)
+        if level[x][y].blocked and not level[x][y].designated and not level[x][y].mapedge:
+            gamemap_instance.designate(x, y, 'clearing', '+')
+            count -= 1
+
+def simulate(gamemap_instance, turns):
+    """
+    Runs the map for a number of turns, the same way play_game does when nobody touches the keyboard,
+    and returns how many seconds it took.
+    """
+    start = time()
+    timer.end_frame()
+    for turn in range(turns):
+        # The robots only notice what the player can see, and play_game works the FOV out when drawing
+        player = gamemap_instance.player
+        if player is not None:
+            started = timer.start()
+            gamemap_instance.compute_fov(player.x, player.y)
+            timer.stop('fov', started)
+        started = timer.start()
+        gamemap_instance.run_turn()
+        timer.stop('ai', started)
+        timer.end_frame()
+    return time() - start
+
+
+class Quiet(object):
+    """Throws away everything printed while it is in use, since making maps prints a lot of debugging chatter."""
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the colony without a window and report how fast it goes.')
+    parser.add_argument('--turns', type=int, default=1000, help='how many turns to simulate')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the map and the AIs')
+    parser.add_argument('--landings', type=int, default=1, help='how many landers full of astronauts to land')
+    parser.add_argument('--jobs', type=int, default=20, help='how many tiles to designate for clearing')
+    parser.add_argument('--width', type=int, default=MAP_WIDTH, help='width of the map in tiles')
+    parser.add_argument('--height', type=int, default=MAP_HEIGHT, help='height of the map in tiles')
+    parser.add_argument('--verbose', action='store_true', help="show the AIs' debugging output")
+    parser.add_argument('--timings', metavar='FILE', help='time every turn, and write the timings to FILE as JSON lines')
+    args = parser.parse_args(argv)
+
+    if args.timings:
+        timer.enable(args.timings)
+
+    if args.verbose:
+        gamemap_instance = new_colony(args.seed, args.landings, args.jobs, args.width, args.height)
+        seconds = simulate(gamemap_instance, args.turns)
+    else:
+        with Quiet():
+            gamemap_instance = new_colony(args.seed, args.landings, args.jobs, args.width, args.height)
+            seconds = simulate(gamemap_instance, args.turns)
+
+    print 'Simulated ' + str(args.turns) + ' turns with ' + str(len(gamemap_instance.actors)) + ' creatures in ' + \
+        '%.2f' % seconds + ' seconds (' + '%.1f' % (args.turns / max(seconds, 1e-9)) + ' turns per second).'
+    print str(len(gamemap_instance.work_orders)) + ' designated tiles are still waiting for a builder.'
+
+    if args.timings:
+        timer.dump(args.timings)
+        timer.disable()
+        for line in timer.overlay_lines(60):
+            print line
+
+if __name__ == '__main__':
+    main()
@@ -9,3 +9,60 @@ class TestObject(object):
 	def __init__(self, name):
 		self.name = name
 
+
+
+#=============================================================
+# Automated checks, run with:
+#     python testbed.py
+#=============================================================
+
+def check_stairs():
+    """
+    Walks the player down and up the stairs through a LevelCache small enough that levels go to the disk,
+    then saves the game and loads it with levels.load(), which only builds the levels near the player.
+    """
+    import os
+    import shutil
+    import tempfile
+
+    import savegame
+    import levels
+    from simulation import new_world, Quiet
+
+    directory = tempfile.mkdtemp()
+    try:
+        with Quiet():
+            list_of_maps = levels.LevelCache(new_world(3), budget=0, directory=os.path.join(directory, 'levels'))
+            map_number = 0
+            for trip in range(4):
+                map_number = levels.go_down(list_of_maps, map_number)
+            assert (map_number, len(list_of_maps)) == (4, 5)
+            assert list_of_maps.resident() == [3, 4], list_of_maps.resident()
+
+            for trip in range(2):
+                map_number = levels.go_up(list_of_maps, map_number)
+            gamemap_instance = list_of_maps[map_number]
+            assert map_number == 2 and list_of_maps.resident() == [1, 2, 3], list_of_maps.resident()
+            assert (gamemap_instance.player.x, gamemap_instance.player.y) == \
+                   (gamemap_instance.stairs.x, gamemap_instance.stairs.y)
+            assert [number for number, level in enumerate(list_of_maps) if level.player is not None] == [2]
+
+            path = os.path.join(directory, 'savegame')
+            savegame.save(path, list_of_maps, map_number)
+            loaded, number, game_state, messages, random_state = levels.load(path, budget=0,
+                                                                             directory=os.path.join(directory, 'loaded'))
+            assert number == 2 and loaded.resident() == [1, 2, 3], loaded.resident()
+            assert [sorted(obj.uid for obj in level.objects) for level in loaded] == \
+                   [sorted(obj.uid for obj in level.objects) for level in list_of_maps]
+            unbuilt = savegame.load(path, neighbours=1)[0]
+            assert [isinstance(level, savegame.Snapshot) for level in unbuilt] == [True, False, False, False, True]
+            assert levels.go_down(loaded, number) == 3 and loaded[3].player is not None
+            list_of_maps.close()
+            loaded.close()
+    finally:
+        shutil.rmtree(directory)
+    print 'The stairs work.'
+
+
+if __name__ == '__main__':
+    check_stairs()
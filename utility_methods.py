@@ -9,6 +9,7 @@ from math import sqrt
 import libtcodpy as libtcod
 
 from constants import *
+from randomness import random_int
 
 
 
@@ -38,6 +39,46 @@ class switch(object):
         else:
             return False
 
+#------------------------------------------------------------
+class TileSet(object):
+    """
+    A set of tile plane positions which can also pick a random member in constant time. The members are kept
+    in a list, plus a dict of where each one is in that list so they can be swapped out of it quickly.
+    """
+    def __init__(self, indices=()):
+        self.members = []
+        self.positions = {}
+        for index in indices:
+            self.add(index)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, index):
+        return index in self.positions
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def add(self, index):
+        if index not in self.positions:
+            self.positions[index] = len(self.members)
+            self.members.append(index)
+
+    def discard(self, index):
+        position = self.positions.pop(index, None)
+        if position is None:
+            return
+        last = self.members.pop()
+        if last != index:
+            # Move the last member into the hole left by the one we took out
+            self.members[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng=0):
+        """Returns a random member, using the default libtcod random generator unless rng is a stream."""
+        return self.members[random_int(rng, 0, len(self.members)-1)]
+
 #------------------------------------------------------------
 def message(new_msg, color=libtcod.white):     
     """
@@ -55,7 +96,10 @@ def message(new_msg, color=libtcod.white):
 
 
 def find_player_in_list(object_list):
-    """Use this to find the player in the GameMap's list of objects."""
+    """
+    Use this to find the player in a list of objects. For objects on a GameMap use GameMap.player instead,
+    which doesn't have to search.
+    """
     player_index = 0
     for obj in object_list:
         if obj.name == 'player':
@@ -67,7 +111,10 @@ def find_player_in_list(object_list):
     return player
 
 def is_blocked(mymap, objects, x, y):
-    """Is this square blocked by a map tile, or an object?"""
+    """
+    Is this square blocked by a map tile, or an object? This is for lists of objects which aren't on a
+    GameMap yet. Once they are, use GameMap.is_blocked instead which doesn't have to search the list.
+    """
     #first see if the map tile itself is blocking
     if mymap[x][y].blocked:
         return True
@@ -85,28 +132,42 @@ def is_mapedge(mymap, x, y):
     else:
         return False
 
-def choose_random_unblocked_spot(mymap):
+def choose_random_unblocked_spot(mymap, region=None, reachable_from=None, rng=0):
     """
     This function picks a random point on the map which is not blocked. It returns the x, y coordinates for
-    that location.
+    that location, or (None, None) if there isn't one. The map keeps a set of its unblocked tiles, so this 
+    doesn't have to search for them.
+    Pass a Rect as region to only pick from inside it, or an (x, y) as reachable_from to only pick somewhere 
+    that can be walked to from there. rng is the random stream to pick with.
     """
-    candidates = []
-    for x in range(1, MAP_WIDTH):
-            for y in range(1, MAP_HEIGHT):
-                if not mymap[x][y].blocked:
-                    candidates.append((x, y))
-    rand_index = libtcod.random_get_int(0, 0, len(candidates)-1)
-    return candidates[rand_index]
-
-def random_choice_index(chances):
+    if region is not None:
+        return mymap.random_free_tile_in(region.x1, region.y1, region.x2, region.y2, rng=rng)
+    if reachable_from is not None:
+        return mymap.random_reachable_tile(reachable_from[0], reachable_from[1], rng)
+    return mymap.random_free_tile(rng)
+
+def ring_around(x, y, radius):
+    """Returns the tiles on the edge of the square which is centered on (x, y) and reaches radius tiles out."""
+    if radius == 0:
+        return [(x, y)]
+    tiles = []
+    for tx in range(x - radius, x + radius + 1):
+        tiles.append((tx, y - radius))
+        tiles.append((tx, y + radius))
+    for ty in range(y - radius + 1, y + radius):
+        tiles.append((x - radius, ty))
+        tiles.append((x + radius, ty))
+    return tiles
+
+def random_choice_index(chances, rng=0):
     """
     When given a list of chances, such as [80, 10, 10], it will randomly choose one according to
     its relative probability from that list. Accepts different formats, not just percentages, because
     it chooses from 1 to the sum of the chances. Example: [1, 1, 1, 2] means that the last item has a 
     40 percent chance (2/5) and the first three items each have a 20 percent chance (1/5) of having 
-    their index returned. 
+    their index returned. rng is the random stream to roll with.
     """
-    dice = libtcod.random_get_int(0, 1, sum(chances))
+    dice = random_int(rng, 1, sum(chances))
 
     running_sum = 0
     choice = 0
@@ -117,12 +178,12 @@ def random_choice_index(chances):
             return choice
         choice += 1
 
-def random_choice(chances_dict):
+def random_choice(chances_dict, rng=0):
     """Choose an option from a dictionary of {'thing': chance} pairs, and return the corresponding key."""
     chances = chances_dict.values() 
     strings = chances_dict.keys()
 
-    return strings[random_choice_index(chances)] # returns the key which corresponds to the chosen chance
+    return strings[random_choice_index(chances, rng)] # returns the key which corresponds to the chosen chance
 
 def from_difficulty_level(table):
     """
@@ -149,17 +210,14 @@ def move(gamemap_instance, thisobject, dx, dy):
     """Move to a coordinate if it isn't blocked."""
 
     thismap = gamemap_instance.level
-    object_list = gamemap_instance.objects
 
     if thisobject.name is 'player':
         # If the player is a cursor then it can move through anything. Remove this for adventure mode.
         if not is_mapedge(thismap, thisobject.x + dx, thisobject.y + dy):
-            thisobject.x += dx
-            thisobject.y += dy
+            gamemap_instance.move_object(thisobject, thisobject.x + dx, thisobject.y + dy)
     else:
-        if not is_blocked(thismap, object_list, thisobject.x + dx, thisobject.y + dy):
-            thisobject.x += dx
-            thisobject.y += dy
+        if not gamemap_instance.is_blocked(thisobject.x + dx, thisobject.y + dy):
+            gamemap_instance.move_object(thisobject, thisobject.x + dx, thisobject.y + dy)
 
     # Whenever the thing moves, it has to wait:
     thisobject.wait = thisobject.speed
@@ -170,11 +228,11 @@ def move_towards(gamemap_instance, thisobject, target_x, target_y):
     Move towards a target_x, target_y coordinate. This method computes the A* path and uses move()
     to actually implement the movement.
     """
-    fov_map = gamemap_instance.fov_map
-    path = libtcod.path_new_using_map(fov_map)
+    path = libtcod.path_new_using_map(gamemap_instance.nav_map)
 
     libtcod.path_compute(path, thisobject.x, thisobject.y, target_x, target_y)
     pathx, pathy = libtcod.path_walk(path, True)
+    libtcod.path_delete(path)
     # If the monster tries to move toward something, such as the player, which is standing
     # inside of a wall or other blocked spot, path_walk will return None but the dx and dy
     # calculations will crap out because you can't mix int and NoneType.
@@ -216,8 +274,8 @@ def target_NPC(mymap, max_range=None):
             return None
             
         #return the first clicked NPC, otherwise continue looping
-        for obj in mymap.objects:
-            if obj.x == x and obj.y == y and obj.fighter and obj != player:
+        for obj in mymap.objects_at(x, y):
+            if obj.fighter and obj != player:
                 return obj
             
 def cast_heal():
@@ -232,9 +290,9 @@ def cast_heal():
     message('Your wounds start to feel better!', libtcod.light_violet)
     player.fighter.heal(HEAL_AMOUNT)
 
-def cast_lightning():
+def cast_lightning(gamemap_instance):
     """Find the closest enemy inside a max range and damage it."""
-    NPC = closest_NPC(LIGHTNING_RANGE)
+    NPC = closest_NPC(gamemap_instance, LIGHTNING_RANGE)
     if NPC is None:
         message('No enemy is close enough to strike.', libtcod.azure)
         return 'cancelled'
@@ -243,17 +301,15 @@ def cast_lightning():
         + str(LIGHTNING_DAMAGE) + ' hit points.', libtcod.light_blue)
     NPC.fighter.take_damage(LIGHTNING_DAMAGE)
 
-def closest_NPC(max_range):
-    closest_enemy = None
-    closest_dist = max_range + 1
-    
-    for object in objects:
-        if object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
-            dist = player.distance_to(object)
-            if dist < closest_dist:
-                closest_enemy = object
-                closest_dist = dist
-    return closest_enemy
+def closest_NPC(gamemap_instance, max_range):
+    """Returns the closest fighter that the player can see, up to max_range away, or None."""
+    player = gamemap_instance.player
+    fov_map = gamemap_instance.fov_map
+
+    def is_enemy(object):
+        return object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y)
+
+    return gamemap_instance.nearest(player.x, player.y, is_enemy, max_range)
 
 def cast_confuse():
     #ask the player for a target to confuse
@@ -265,18 +321,20 @@ def cast_confuse():
     old_ai = NPC.ai
     NPC.ai = ConfusedNPC(old_ai)
     NPC.ai.owner = NPC #you need to tell the new component who owns it every time you replace a component during runtime
+    if NPC.gamemap is not None:
+        NPC.gamemap.object_changed(NPC)
     message('The ' + NPC.name + ' starts to stumble around!', libtcod.light_green)
     
-def cast_fireball():
+def cast_fireball(gamemap_instance):
     #ask the player for a target tile at which to throw a fireball:
     message('Left-click a tile for the fireball or right-click to cancel.', libtcod.light_red)
-    (x, y) = target_tile()
+    (x, y) = target_tile(gamemap_instance)
     if x is None: return 'cancelled'
     message('The fireball explodes, burning everything within ' + str(FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
     
-    for obj in objects: 
+    for obj in gamemap_instance.within_radius(x, y, FIREBALL_RADIUS): 
         # damage every fighter within range, including the player. To avoid damaging the player, add " and obj != player"
-        if obj.distance(x, y) <= FIREBALL_RADIUS and obj.fighter:
+        if obj.fighter:
             message('The ' + obj.name + ' gets burned for ' + str(FIREBALL_DAMAGE) + ' hit points.', libtcod.orange)
             obj.fighter.take_damage(FIREBALL_DAMAGE)
 
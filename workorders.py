@@ -0,0 +1,104 @@
+#=============================================================
+# Work orders. Every designated tile is a job, and builders ask the
+# WorkOrders for the nearest job that nobody else has claimed.
+#=============================================================
+
+from utility_methods import ring_around
+
+
+class WorkOrders(object):
+    """
+    An index of the designated tiles on a map. Unclaimed jobs are kept in square buckets of the map, so
+    finding the nearest one only looks at the buckets around the builder instead of the whole map.
+    Each builder can hold a claim on one job at a time.
+    """
+    def __init__(self, bucket_size=8):
+        self.bucket_size = bucket_size
+        self.buckets = {}       # (bucket x, bucket y) -> set of unclaimed (x, y) jobs
+        self.claimed_by = {}    # (x, y) -> the builder working on it
+        self.claims = {}        # builder -> the (x, y) job it is working on
+        self.version = 0        # goes up whenever a job becomes free to claim
+
+    def __len__(self):
+        return sum(len(jobs) for jobs in self.buckets.values()) + len(self.claimed_by)
+
+    def bucket(self, x, y):
+        return (x // self.bucket_size, y // self.bucket_size)
+
+    def add(self, x, y):
+        """Adds a job at (x, y), such as a newly designated tile."""
+        if (x, y) not in self.claimed_by:
+            self.buckets.setdefault(self.bucket(x, y), set()).add((x, y))
+            self.version += 1
+
+    def remove(self, x, y):
+        """Takes the job at (x, y) off the books, because it was finished or undesignated."""
+        if (x, y) in self.claimed_by:
+            builder = self.claimed_by.pop((x, y))
+            del self.claims[builder]
+        self._unbucket(x, y)
+
+    def _unbucket(self, x, y):
+        bucket = self.bucket(x, y)
+        jobs = self.buckets.get(bucket)
+        if jobs is not None and (x, y) in jobs:
+            jobs.remove((x, y))
+            if not jobs:
+                del self.buckets[bucket]
+
+    def claim_nearest(self, builder, x, y, accept=None):
+        """
+        Finds the unclaimed job nearest to (x, y) for which accept(job_x, job_y) is true, claims it for the
+        builder and returns its coordinates. Returns (None, None) if there's nothing to do.
+        A builder which already holds a claim gives it up first.
+        """
+        self.release(builder)
+
+        best = None
+        best_distance = None
+        bucket_x, bucket_y = self.bucket(x, y)
+        furthest_ring = max([max(abs(bx - bucket_x), abs(by - bucket_y)) for (bx, by) in self.buckets] or [-1])
+
+        for ring in range(furthest_ring + 1):
+            # Every tile in this ring of buckets is at least (ring - 1) buckets away, so if that is already
+            # further than the best job so far then nothing from here on can beat it.
+            closest_possible = max(ring - 1, 0) * self.bucket_size
+            if best is not None and closest_possible ** 2 > best_distance:
+                break
+
+            for bucket in ring_around(bucket_x, bucket_y, ring):
+                for (job_x, job_y) in sorted(self.buckets.get(bucket, ())):
+                    distance = (job_x - x) ** 2 + (job_y - y) ** 2
+                    if (best is None or distance < best_distance) and (accept is None or accept(job_x, job_y)):
+                        best = (job_x, job_y)
+                        best_distance = distance
+
+        if best is None:
+            return (None, None)
+
+        self._unbucket(best[0], best[1])
+        self.claimed_by[best] = builder
+        self.claims[builder] = best
+        return best
+
+    def claim(self, builder, x, y):
+        """Claims the job at (x, y) for the builder, such as when a saved game is loaded."""
+        if (x, y) in self.claimed_by:
+            raise ValueError('The job at (' + str(x) + ', ' + str(y) + ') is already claimed.')
+        self.release(builder)
+        self._unbucket(x, y)
+        self.claimed_by[(x, y)] = builder
+        self.claims[builder] = (x, y)
+
+    def release(self, builder):
+        """The builder gave up or died, so its job goes back up for grabs."""
+        job = self.claims.pop(builder, None)
+        if job is not None:
+            del self.claimed_by[job]
+            self.add(job[0], job[1])
+        return job
+
+    def claim_of(self, builder):
+        """Returns the job a builder has claimed, or None."""
+        return self.claims.get(builder)
+